@@ -0,0 +1,116 @@
+"""
+Rotas alternativas entre um par origem/destino pelo método dos nós de passagem.
+
+Em vez de k buscas independentes (ou penalizando a rota anterior a cada
+rodada), uma única busca para frente e uma para trás (MotorRotas.arvores_via)
+dão d(s, v) e d(v, t) para todo nó v que cabe numa rota de até
+(1 + FOLGA) x d(s, t). Cada v define a rota s -> v -> t, que é a união dos
+dois caminhos das árvores.
+
+Platôs são sequências de arcos presentes nas duas árvores: qualquer nó de um
+platô leva à mesma rota, e o trecho do platô é caminho mínimo, então a rota
+não tem volta desnecessária ali (otimalidade local). A rota mínima é o platô
+de s até t. Os platôs são avaliados do mais longo para o mais curto, e uma
+rota é aceita se:
+
+- o custo fica até (1 + FOLGA) x ótimo (garantido pelas árvores);
+- o platô cobre pelo menos PLATO_MINIMO do ótimo;
+- o trecho em comum com cada rota já aceita é no máximo SOBREPOSICAO_MAXIMA
+  do ótimo;
+- a rota não repete nó.
+"""
+import math
+
+# Rotas devolvidas por padrão, contando a mínima
+MAX_ROTAS = 3
+
+# Esticamento máximo de uma alternativa em relação à rota mínima
+FOLGA = 0.25
+
+# Custo em comum com qualquer rota já aceita, como fração do ótimo
+SOBREPOSICAO_MAXIMA = 0.6
+
+# Comprimento mínimo (fração do ótimo) do platô que justifica a alternativa
+PLATO_MINIMO = 0.2
+
+
+def _platos(vias, ida, volta, destinos, pesos):
+    """[(custo do platô, primeiro nó, custo da rota), ...] do mais longo para o mais curto"""
+    custo_ida, pai_ida = ida
+    custo_volta, seguinte_volta = volta
+    seguinte = {}
+    com_anterior = set()
+    for no in vias:
+        arco = seguinte_volta[no]
+        if arco != -1 and pai_ida[destinos[arco]] == arco:
+            seguinte[no] = arco
+            com_anterior.add(destinos[arco])
+
+    platos = []
+    for inicio in seguinte:
+        if inicio in com_anterior:
+            continue
+        comprimento = 0.0
+        arco = seguinte[inicio]
+        while arco is not None:
+            comprimento += pesos[arco]
+            arco = seguinte.get(destinos[arco])
+        platos.append((comprimento, inicio, custo_ida[inicio] + custo_volta[inicio]))
+    platos.sort(key=lambda plato: -plato[0])
+    return platos
+
+
+def _arcos_via(no, ida, volta, origens, destinos):
+    """Arcos da rota origem -> `no` -> destino pelas duas árvores"""
+    pai_ida, seguinte_volta = ida[1], volta[1]
+    arcos = []
+    arco = pai_ida[no]
+    while arco != -1:
+        arcos.append(arco)
+        arco = pai_ida[origens[arco]]
+    arcos.reverse()
+    arco = seguinte_volta[no]
+    while arco != -1:
+        arcos.append(arco)
+        arco = seguinte_volta[destinos[arco]]
+    return arcos
+
+
+def rotas_alternativas(motor, origem, destino, quantidade=MAX_ROTAS, folga=FOLGA,
+                       sobreposicao_maxima=SOBREPOSICAO_MAXIMA, plato_minimo=PLATO_MINIMO):
+    """
+    Até `quantidade` rotas entre os nós `origem` e `destino` (índices), a
+    mínima primeiro. Retorna ([{'arcos', 'custo', 'esticamento',
+    'sobreposicao' (fração da mínima em comum)}, ...], nós assentados);
+    lista vazia sem caminho.
+    """
+    otimo, vias, ida, volta, assentados = motor.arvores_via(origem, destino, folga)
+    if not math.isfinite(otimo):
+        return [], assentados
+    vistas = motor.vistas()
+    origens, destinos, pesos = vistas['origens'], vistas['destinos'], vistas['pesos']
+
+    minima = _arcos_via(destino, ida, volta, origens, destinos)
+    rotas = [{'arcos': minima, 'custo': otimo, 'esticamento': 1.0, 'sobreposicao': 1.0}]
+    conjuntos = [set(minima)]
+    if otimo <= 0:
+        return rotas, assentados
+
+    for comprimento, inicio, custo in _platos(vias, ida, volta, destinos, pesos):
+        if len(rotas) >= quantidade or comprimento < plato_minimo * otimo:
+            break
+        if inicio == origem:
+            # O platô que sai da origem é a própria rota mínima
+            continue
+        arcos = _arcos_via(inicio, ida, volta, origens, destinos)
+        # Nó repetido: os caminhos das duas árvores se cruzam e a rota dá uma volta
+        if len({origem}.union(destinos[arco] for arco in arcos)) != len(arcos) + 1:
+            continue
+        conjunto = set(arcos)
+        em_comum = [sum(pesos[arco] for arco in conjunto & aceita) for aceita in conjuntos]
+        if max(em_comum) > sobreposicao_maxima * otimo:
+            continue
+        rotas.append({'arcos': arcos, 'custo': custo, 'esticamento': custo / otimo,
+                      'sobreposicao': em_comum[0] / otimo})
+        conjuntos.append(conjunto)
+    return rotas, assentados
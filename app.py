@@ -1,15 +1,36 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request
 import osmnx as ox
 import networkx as nx
 import heapq
 import folium
 from geopy.geocoders import Nominatim, GoogleV3
-from geopy.extra.rate_limiter import RateLimiter
-import json
-import random
+from geopy.exc import GeopyError
+import gzip
 import os
-import urllib.request
-import urllib.error
+import time
+import threading
+
+import numpy as np
+
+import snapshot_grafo
+import motor_rotas
+import contracao
+import indice_espacial
+import geometria_rotas
+import modos
+import cenarios
+import trafego
+import cache_rotas
+import cache_geocodificacao
+import autocompletar
+import matriz_distancias
+import desvios
+import isocronas
+import alternativas
+import cliente_osrm
+import io_assincrono
+import metricas
+from metricas import etapa
 
 # Diretórios de templates e estáticos relativos ao arquivo atual
 base_dir = os.path.dirname(os.path.abspath(os.path.realpath(__file__)))
@@ -18,58 +39,299 @@ static_dir = os.path.join(base_dir, 'static')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 
+# Logs estruturados com nível (ROTA_LOG_NIVEL) no lugar de prints
+log = metricas.configurar_logging()
+
 # Configurações
 cidade_atual = "Maricá, Rio de Janeiro, Brazil"
 grafo = None
 grafo_proj = None
+_trava_grafo = threading.Lock()
+snapshot = None
+visoes = {}
+indice = None
+geometria = None
+indice_nomes = None
+servico_matriz = None
+# Cenários de pesos (cenarios.ConjuntoCenarios) com o cenário ativo
+cenarios_pesos = None
+# Fatores de trânsito ao vivo por aresta, compartilhados entre processos (trafego.py)
+trafego_ao_vivo = None
+# Estatísticas do grafo calculadas na carga (api_info_algoritmo)
+estatisticas_grafo = {}
+
+# Snapshot binário do grafo preparado (ver snapshot_grafo.py)
+SNAPSHOT_DIR = os.environ.get('ROTA_SNAPSHOT_DIR', os.path.join(base_dir, 'dados', 'grafo_marica'))
+# Semente da randomização dos pesos: o mesmo OSM gera sempre o mesmo snapshot
+SEMENTE_PESOS = int(os.environ.get('ROTA_SEMENTE_PESOS', 42))
+# 'gerador_pesos': fatores gerados em bloco por cenarios.fatores_randomicos
+PARAMETROS_SNAPSHOT = {'cidade': cidade_atual, 'network_type': 'all', 'semente_pesos': SEMENTE_PESOS,
+                       'gerador_pesos': 'numpy'}
+
+# Cenário de pesos ativo ao iniciar e sementes de cenários randomizados extras ("7,13")
+CENARIO_PADRAO = os.environ.get('ROTA_CENARIO', cenarios.CENARIO_BASE)
+SEMENTES_CENARIOS = [int(s) for s in os.environ.get('ROTA_CENARIOS_SEMENTES', '').split(',') if s.strip()]
+# Se definido, POST /api/cenarios e /api/trafego exigem o cabeçalho X-Rota-Admin com este valor
+TOKEN_ADMIN = os.environ.get('ROTA_ADMIN_TOKEN')
+# Itens aceitos por lote em POST /api/trafego
+MAX_LOTE_TRAFEGO = int(os.environ.get('ROTA_TRAFEGO_MAX_LOTE', 5000))
+
+# Algoritmo de busca padrão ('dijkstra', 'astar_bidirecional' ou 'ch'); pode ser escolhido por requisição.
+# Com 'ch', modos e cenários sem hierarquia de contração usam Dijkstra (ver algoritmo_do_motor)
+ALGORITMO_PADRAO = os.environ.get('ROTA_ALGORITMO', 'dijkstra')
+if ALGORITMO_PADRAO not in motor_rotas.ALGORITMOS:
+    raise ValueError(f"ROTA_ALGORITMO inválido: '{ALGORITMO_PADRAO}' (use um de {', '.join(motor_rotas.ALGORITMOS)})")
+
+# Tamanho máximo (origens x destinos) aceito por /api/matriz
+MAX_CELULAS_MATRIZ = int(os.environ.get('ROTA_MATRIZ_MAX_CELULAS', 10000))
+
+# Limites aceitos por /api/isocronas: quantidade e maior limite de cada tipo (s, m)
+MAX_FAIXAS_ISOCRONA = int(os.environ.get('ROTA_ISOCRONA_MAX_FAIXAS', 10))
+MAX_LIMITE_ISOCRONA = {'tempo': float(os.environ.get('ROTA_ISOCRONA_MAX_SEGUNDOS', 3600)),
+                       'distancia': float(os.environ.get('ROTA_ISOCRONA_MAX_METROS', 50000))}
+
+# Rotas alternativas por pedido em /api/calcular_rota (contando a mínima), esticamento e trecho em comum máximos
+MAX_ALTERNATIVAS = int(os.environ.get('ROTA_ALTERNATIVAS_MAX', 5))
+FOLGA_ALTERNATIVAS = float(os.environ.get('ROTA_ALTERNATIVAS_FOLGA', alternativas.FOLGA))
+SOBREPOSICAO_ALTERNATIVAS = float(os.environ.get('ROTA_ALTERNATIVAS_SOBREPOSICAO', alternativas.SOBREPOSICAO_MAXIMA))
+
+# Formatos de 'caminho' em /api/calcular_rota: pares [lat, lng] ou polilinha codificada
+FORMATOS_CAMINHO = ('coordenadas',) + tuple(geometria_rotas.PRECISOES_POLILINHA)
+
+# Ajuste das coordenadas em /api/calcular_rota: ao nó mais próximo ou cortando a via mais próxima
+AJUSTES = ('no', 'aresta')
+
+# gzip das respostas a partir desse tamanho, se o cliente aceitar (nível 0 desliga)
+NIVEL_COMPRESSAO = int(os.environ.get('ROTA_COMPRESSAO_NIVEL', 6))
+MIN_BYTES_COMPRESSAO = int(os.environ.get('ROTA_COMPRESSAO_MIN_BYTES', 1024))
+TIPOS_COMPRIMIDOS = ('application/json', 'text/html', 'text/plain')
+
+# Cache LRU de rotas por (nó origem, nó destino, modo, cenário, algoritmo, versão dos pesos)
+cache_resultados = cache_rotas.CacheRotas(
+    max_entradas=int(os.environ.get('ROTA_CACHE_ENTRADAS', 2048)),
+    max_bytes=int(float(os.environ.get('ROTA_CACHE_MB', 64)) * 1024 * 1024))
+
+# Pontos turísticos reais de Maricá (também entram no índice de autocompletar)
+PONTOS_TURISTICOS = [
+    {
+        'nome': 'Praia de Maricá',
+        'lat': -22.9189,
+        'lng': -42.8194,
+        'tipo': 'praia',
+        'descricao': 'Principal praia da cidade'
+    },
+    {
+        'nome': 'Lagoa de Maricá',
+        'lat': -22.9200,
+        'lng': -42.8300,
+        'tipo': 'lagoa',
+        'descricao': 'Lagoa costeira com águas calmas'
+    },
+    {
+        'nome': 'Centro de Maricá',
+        'lat': -22.9180,
+        'lng': -42.8190,
+        'tipo': 'centro',
+        'descricao': 'Centro comercial da cidade'
+    },
+    {
+        'nome': 'Barra de Maricá',
+        'lat': -22.9300,
+        'lng': -42.8100,
+        'tipo': 'praia',
+        'descricao': 'Extremidade da praia'
+    }
+]
 
 # Geocoder com configuração otimizada
 geolocator = Nominatim(user_agent="marica_routes_app_v2")
 
-# Rate limiter para evitar bloqueios
-geocode_com_rate_limit = RateLimiter(geolocator.geocode, min_delay_seconds=0.5)
-reverse_geocode_com_rate_limit = RateLimiter(geolocator.reverse, min_delay_seconds=0.5)
+# Chamadas ao Nominatim e ao OSRM passam pelo laço asyncio (ver io_assincrono.py), com
+# limite de simultâneas, intervalo mínimo (evita bloqueios no Nominatim) e tempo limite
+# por serviço; a thread da requisição só espera o resultado
+laco_io = io_assincrono.LacoAssincrono(
+    io_assincrono.Upstream('nominatim', max_simultaneos=2, intervalo_minimo=0.5,
+                           timeout=float(os.environ.get('ROTA_NOMINATIM_TIMEOUT', 10)),
+                           max_fila=int(os.environ.get('ROTA_NOMINATIM_FILA', 500))),
+    io_assincrono.Upstream('osrm', max_simultaneos=int(os.environ.get('OSRM_CONEXOES', 16)),
+                           timeout=float(os.environ.get('OSRM_TIMEOUT', 12)) + 2,
+                           max_fila=int(os.environ.get('OSRM_FILA', 1000))))
 
-def inicializar_sistema():
-    """Inicializa o sistema com Maricá"""
-    global grafo, grafo_proj
+# Buscas de rota (CPU) em poucas threads próprias, fora das threads que esperam E/S
+pool_buscas = io_assincrono.PoolBuscas(int(os.environ.get('ROTA_BUSCAS_SIMULTANEAS', 1)))
+
+# Falha de rede devolve um marcador (e não None) para não virar "não encontrado" no cache
+FALHA_GEOCODIFICACAO = object()
+
+def _consultar_nominatim(funcao, consulta):
+    try:
+        with etapa('geocodificacao'):
+            return laco_io.chamar('nominatim', funcao, consulta)
+    except (GeopyError, io_assincrono.TempoEsgotado, io_assincrono.FilaCheia) as e:
+        log.warning('Nominatim indisponível', extra={'campos': {'erro': repr(e)}})
+        return FALHA_GEOCODIFICACAO
+
+# Cache de geocodificação (memória + disco); acertos não passam pelo RateLimiter.
+# Fica num subdiretório de cache/, onde o osmnx guarda suas respostas HTTP
+cache_geocodificacao_app = cache_geocodificacao.CacheGeocodificacao(
+    os.environ.get('ROTA_CACHE_GEOCODIFICACAO', os.path.join(base_dir, 'cache', 'geocodificacao')),
+    ttl=float(os.environ.get('ROTA_CACHE_GEOCODIFICACAO_TTL', cache_geocodificacao.TTL_PADRAO)))
+
+def _local_para_dict(location):
+    if not location or location is FALHA_GEOCODIFICACAO:
+        return None
+    return {'nome': location.address, 'lat': location.latitude, 'lng': location.longitude}
+
+def geocodificar(consulta):
+    """Geocoding com cache: {'nome', 'lat', 'lng'} ou None"""
+    chave = cache_geocodificacao.chave_busca(consulta)
+    encontrado, valor = cache_geocodificacao_app.obter(chave)
+    metricas.CACHE.inc('geocodificacao', 'acerto' if encontrado else 'falha')
+    if encontrado:
+        return valor
+    location = _consultar_nominatim(geolocator.geocode, consulta)
+    valor = _local_para_dict(location)
+    if location is not FALHA_GEOCODIFICACAO:
+        cache_geocodificacao_app.guardar(chave, valor)
+    return valor
+
+def geocodificar_reverso(lat, lng):
+    """Reverse geocoding com cache, por coordenadas arredondadas"""
+    chave = cache_geocodificacao.chave_reversa(lat, lng)
+    encontrado, valor = cache_geocodificacao_app.obter(chave)
+    metricas.CACHE.inc('geocodificacao', 'acerto' if encontrado else 'falha')
+    if encontrado:
+        return valor
+    location = _consultar_nominatim(geolocator.reverse, f"{lat}, {lng}")
+    valor = _local_para_dict(location)
+    if location is not FALHA_GEOCODIFICACAO:
+        cache_geocodificacao_app.guardar(chave, valor)
+    return valor
+
+def preparar_grafo():
+    """
+    Baixa o grafo de Maricá do OSM e projeta. A randomização dos pesos
+    (requisito do projeto) é feita em bloco nos arrays do snapshot.
+    """
+    ox.settings.log_console = False
+    # Carregar grafo completo que inclui caminhos pedestres
+    grafo_novo = ox.graph_from_place(cidade_atual, network_type=PARAMETROS_SNAPSHOT['network_type'])
+    grafo_proj_novo = ox.project_graph(grafo_novo)
+    return grafo_novo, grafo_proj_novo
+
+def construir_snapshot():
+    """Etapa de build: prepara o grafo a partir do OSM e grava o snapshot em disco"""
+    log.info("📍 Baixando dados de Maricá para o snapshot...")
+    grafo_novo, grafo_proj_novo = preparar_grafo()
+    snapshot_grafo.salvar_snapshot(grafo_novo, grafo_proj_novo, SNAPSHOT_DIR, PARAMETROS_SNAPSHOT)
+    return grafo_novo, grafo_proj_novo
+
+def inicializar_sistema(usar_snapshot=None):
+    """
+    Inicializa o sistema com Maricá.
+    Por padrão carrega o snapshot binário; se ele estiver ausente ou desatualizado,
+    baixa o grafo do OSM e regrava o snapshot (ROTA_INICIALIZACAO=osm ignora o snapshot).
+    """
+    global grafo, grafo_proj, snapshot, visoes, cenarios_pesos, trafego_ao_vivo, indice, geometria, indice_nomes
+    global servico_matriz, estatisticas_grafo
+    if usar_snapshot is None:
+        usar_snapshot = os.environ.get('ROTA_INICIALIZACAO', 'snapshot') != 'osm'
     try:
-        print("📍 Carregando dados de Maricá...")
-        ox.settings.log_console = False
-        # Carregar grafo completo que inclui caminhos pedestres
-        grafo = ox.graph_from_place(cidade_atual, network_type='all')
-        grafo_proj = ox.project_graph(grafo)
+        inicio = time.time()
+        snapshot = snapshot_grafo.carregar_snapshot(SNAPSHOT_DIR, PARAMETROS_SNAPSHOT) if usar_snapshot else None
+        if snapshot is None:
+            if usar_snapshot:
+                log.info("📍 Snapshot indisponível, reconstruindo a partir do OSM...")
+                construir_snapshot()
+                snapshot = snapshot_grafo.carregar_snapshot(SNAPSHOT_DIR, PARAMETROS_SNAPSHOT)
+            else:
+                log.info("📍 Carregando dados de Maricá...")
+                grafo_osm, grafo_proj_osm = preparar_grafo()
+                # Mesmos arrays do snapshot, mantidos apenas em memória
+                snapshot = snapshot_grafo.SnapshotGrafo(
+                    snapshot_grafo.arrays_do_grafo(grafo_osm, grafo_proj_osm, SEMENTE_PESOS),
+                    {'crs': str(grafo_proj_osm.graph.get('crs'))})
+        # O grafo NetworkX (com os pesos do snapshot) só é reconstruído se alguém pedir (obter_grafo)
+        grafo = grafo_proj = None
+        
+        # Visões por modo (máscara + pesos em tempo + motor CSR), índice espacial e
+        # geometria, todos construídos uma única vez sobre os arrays do snapshot
+        visoes = modos.construir_visoes(snapshot)
+        # Cenários de pesos lado a lado sobre as mesmas visões (só a coluna de pesos muda),
+        # com o trânsito ao vivo aplicado por cima de todos
+        trafego_ao_vivo = trafego.TrafegoAoVivo(modos.MODOS, snapshot.num_arestas)
+        cenarios_pesos = cenarios.ConjuntoCenarios(
+            visoes, cenarios.cenarios_do_snapshot(snapshot, PARAMETROS_SNAPSHOT.get('semente_pesos'), SEMENTES_CENARIOS),
+            CENARIO_PADRAO, trafego=trafego_ao_vivo)
+        indice = indice_espacial.IndiceEspacial.do_snapshot(snapshot)
+        for modo, visao in visoes.items():
+            indice.adicionar_modo(modo, visao.nos_validos)
+        geometria = geometria_rotas.GeometriaArestas.do_snapshot(snapshot)
+        indice_nomes = autocompletar.IndiceNomes.do_snapshot(snapshot, PONTOS_TURISTICOS)
+        # Pool de processos da matriz sobre o mesmo snapshot em disco (sem snapshot: no próprio processo)
+        if servico_matriz is not None:
+            servico_matriz.encerrar()
+        processos = os.environ.get('ROTA_MATRIZ_PROCESSOS')
+        servico_matriz = matriz_distancias.ServicoMatriz(
+            SNAPSHOT_DIR if usar_snapshot else None, PARAMETROS_SNAPSHOT,
+            int(processos) if processos else None, SEMENTES_CENARIOS, trafego_ao_vivo.compartilhado)
+        # Pesos recarregados: rotas em cache deixam de valer
+        cache_resultados.nova_versao()
+        estatisticas_grafo = calcular_estatisticas_grafo(snapshot)
         
-        # Aplicar randomização de pesos conforme requisitos do projeto
-        randomizar_pesos_grafo(grafo)
+        # Hierarquias de contração pré-processadas (python contracao.py) para os pesos do
+        # cenário base; os demais cenários usam Dijkstra/A*
+        if usar_snapshot:
+            for modo, visao in visoes.items():
+                motor = visao.motor
+                motor.hierarquia = contracao.carregar_hierarquia(SNAPSHOT_DIR, modo, contracao.checksum_pesos(motor.pesos))
+                if motor.hierarquia is not None:
+                    log.info(f"⚡ Hierarquia de contração '{modo}' carregada: {motor.hierarquia.num_atalhos} atalhos")
+        sem_hierarquia = [modo for modo, visao in visoes.items() if visao.motor.hierarquia is None]
+        if ALGORITMO_PADRAO == 'ch' and sem_hierarquia:
+            log.warning(f"⚠️ ROTA_ALGORITMO=ch, mas sem hierarquia de contração para {', '.join(sem_hierarquia)}: "
+                        f"esses modos (e os cenários fora do base) usam dijkstra")
         
-        print(f"✅ Sucesso! {len(grafo.nodes())} nós, {len(grafo.edges())} arestas")
+        log.info(f"✅ Sucesso! {snapshot.num_nos} nós, {snapshot.num_arestas} arestas ({time.time() - inicio:.2f}s)")
         return True
     except Exception as e:
-        print(f"❌ Erro ao carregar Maricá: {e}")
+        log.exception(f"❌ Erro ao carregar Maricá: {e}")
         return False
 
-def randomizar_pesos_grafo(grafo):
-    """Aplica randomização nos pesos das arestas conforme requisitos acadêmicos"""
-    print("🔢 Aplicando randomização nos pesos das arestas...")
-    
-    for origem, destino, chave, dados in grafo.edges(keys=True, data=True):
-        # Randomizar o comprimento original (±20% de variação)
-        comprimento_original = dados.get('length', 100)
-        fator_randomico = random.uniform(0.8, 1.2)
-        novo_comprimento = comprimento_original * fator_randomico
-        
-        # Atualizar os dados da aresta
-        grafo[origem][destino][chave]['length'] = novo_comprimento
-        grafo[origem][destino][chave]['length_original'] = comprimento_original
-        grafo[origem][destino][chave]['fator_randomico'] = fator_randomico
+def calcular_estatisticas_grafo(snapshot):
+    """Contagens servidas por /api/info_algoritmo, feitas uma vez sobre os arrays"""
+    randomizadas = int(np.count_nonzero(snapshot.fator_randomico != 1.0))
+    return {
+        'total_nos': int(snapshot.num_nos),
+        'total_arestas': int(snapshot.num_arestas),
+        'arestas_randomizadas': randomizadas,
+        'fator_randomico_min': float(snapshot.fator_randomico.min()) if randomizadas else 1.0,
+        'fator_randomico_max': float(snapshot.fator_randomico.max()) if randomizadas else 1.0,
+    }
+
+def obter_grafo():
+    """
+    Grafo NetworkX reconstruído do snapshot sob demanda. As rotas usam só os
+    arrays; manter o grafo em cada worker custaria uma cópia inteira por processo.
+    """
+    global grafo, grafo_proj
+    with _trava_grafo:
+        if grafo is None and snapshot is not None:
+            grafo, grafo_proj = snapshot_grafo.grafos_do_snapshot(snapshot)
+    return grafo
+
+def criar_app():
+    """Fábrica WSGI para servidores de produção (ver wsgi.py); inicializa uma única vez"""
+    if snapshot is None and not inicializar_sistema():
+        raise RuntimeError('Não foi possível inicializar o sistema')
+    return app
 
 def dijkstra_customizado(grafo, origem_no, destino_no, peso='length'):
     """
     Implementação customizada do algoritmo de Dijkstra com heapq
     Conforme requisitos acadêmicos do projeto
     """
-    print(f"🔍 Calculando rota com Dijkstra customizado: {origem_no} → {destino_no}")
+    log.debug("🔍 Calculando rota com Dijkstra customizado", extra={'campos': {'origem': origem_no, 'destino': destino_no}})
     
     # Inicializar distâncias e nós anteriores
     distancias = {no: float('inf') for no in grafo.nodes()}
@@ -127,150 +389,365 @@ def dijkstra_customizado(grafo, origem_no, destino_no, peso='length'):
     
     caminho.reverse()
     
-    print(f"✅ Rota encontrada: {len(caminho)} nós, {distancia_total:.1f} metros")
+    log.debug("✅ Rota encontrada", extra={'campos': {'nos': len(caminho), 'metros': round(distancia_total, 1)}})
     return caminho, distancia_total
 
-def obter_rota_por_geometria(origem_no, destino_no):
-    """Obtém rota seguindo exatamente a geometria das vias OSM usando Dijkstra customizado"""
+def algoritmo_do_motor(algoritmo, motor):
+    """
+    Algoritmo efetivamente usado no motor: o pedido ou, sem pedido, o padrão;
+    o padrão 'ch' vira 'dijkstra' num motor sem hierarquia de contração
+    """
+    if algoritmo:
+        return algoritmo
+    if ALGORITMO_PADRAO == 'ch' and motor.hierarquia is None:
+        return 'dijkstra'
+    return ALGORITMO_PADRAO
+
+def obter_rota_por_geometria(origem_no, destino_no, algoritmo=None, modo='driving', cenario=None, tolerancia=0.0):
+    """
+    Obtém rota seguindo exatamente a geometria das vias OSM usando o motor CSR do modo no cenário.
+    tolerancia > 0 simplifica a polilinha (m, ver geometria_rotas.py); o cache guarda a completa.
+    """
+    def polilinha(resultado):
+        coords = resultado['caminho']
+        if tolerancia > 0:
+            with etapa('simplificacao'):
+                coords, _ = geometria.simplificar(coords, resultado['niveis'], tolerancia)
+        return coords.tolist()
+    
     try:
-        # Usar implementação customizada de Dijkstra em vez de nx.shortest_path
-        caminho, distancia_total = dijkstra_customizado(grafo, origem_no, destino_no, 'length')
+        cenario = cenarios_pesos.resolver(cenario)
+        visao = cenarios_pesos.visoes(cenario)[modo]
+        motor = visao.motor
+        algoritmo = algoritmo_do_motor(algoritmo, motor)
+        chave = cache_resultados.chave(origem_no, destino_no, modo, cenario, algoritmo)
+        marca = cache_resultados.marca()
+        em_cache = cache_resultados.obter(chave)
+        metricas.CACHE.inc('rotas', 'falha' if em_cache is None else 'acerto')
+        if em_cache is not None:
+            return dict(em_cache, caminho=polilinha(em_cache), niveis=None, cache=True)
+        
+        # Busca sobre CSR por tempo de viagem no modo (sem dicts por consulta)
+        with etapa('busca'):
+            caminho, arcos, duracao, nos_assentados = motor.rota(origem_no, destino_no, algoritmo)
+        metricas.NOS_ASSENTADOS.observar(nos_assentados, algoritmo, modo)
         
         if not caminho:
             return {'sucesso': False, 'erro': 'Não foi possível encontrar caminho'}
         
-        # Coletar todas as coordenadas da geometria das arestas
-        coordenadas_completas = []
+        # Polilinha [lat, lng] reunida das geometrias pré-computadas das arestas
+        with etapa('geometria'):
+            coords, niveis = geometria.montar(motor.arestas_base[arcos], motor.indice_nos[caminho[0]],
+                                              motor.invertidas[arcos], com_niveis=True)
         
-        print(f"=== Processando caminho com {len(caminho)} nós ===")
-        
-        for i in range(len(caminho) - 1):
-            no_origem = caminho[i]
-            no_destino = caminho[i + 1]
-            
-            # Obter dados da aresta
-            aresta = grafo[no_origem][no_destino][0]
-            
-            print(f"Processando aresta {no_origem} -> {no_destino}")
-            print(f"Tem geometria: {'geometry' in aresta}")
-            
-            # Se houver geometria, usar as coordenadas exatas
-            if 'geometry' in aresta:
-                coords = list(aresta['geometry'].coords)
-                print(f"Coordenadas da geometria: {len(coords)} pontos")
-                print(f"Primeiras coordenadas: {coords[:2] if coords else 'vazio'}")
-                
-                # Converter de (lng, lat) para (lat, lng) para Leaflet
-                coords_convertidas = [(lat, lng) for lng, lat in coords]
-                
-                # Evitar duplicação de pontos
-                if coordenadas_completas and coords_convertidas[0] == coordenadas_completas[-1]:
-                    coords_convertidas = coords_convertidas[1:]
-                coordenadas_completas.extend(coords_convertidas)
-            else:
-                # Se não houver geometria, usar coordenadas dos nós
-                lat_origem = grafo.nodes[no_origem]['y']
-                lng_origem = grafo.nodes[no_origem]['x']
-                lat_destino = grafo.nodes[no_destino]['y']
-                lng_destino = grafo.nodes[no_destino]['x']
-                
-                print(f"Usando coordenadas dos nós: ({lat_origem}, {lng_origem}) -> ({lat_destino}, {lng_destino})")
-                
-                # Coordenadas dos nós já vêm no formato correto (lat, lng) para Leaflet
-                # Evitar duplicação de pontos
-                if not coordenadas_completas or (lat_origem, lng_origem) != coordenadas_completas[-1]:
-                    coordenadas_completas.append((lat_origem, lng_origem))
-                coordenadas_completas.append((lat_destino, lng_destino))
-            
-        # Converter para formato [lat, lng] e garantir coordenadas válidas
-        coords_otimizadas = []
-        for coord in coordenadas_completas:
-            if len(coord) >= 2:
-                try:
-                    # Determinar formato da coordenada
-                    if isinstance(coord[0], tuple):  # Formato (lng, lat)
-                        lng, lat = coord[0], coord[1]
-                    else:  # Formato [lat, lng] ou (lat, lng)
-                        lat, lng = coord[0], coord[1]
-                    
-                    # Verificar se não é duplicada da anterior
-                    if coords_otimizadas:
-                        lat_prev, lng_prev = coords_otimizadas[-1]
-                        if abs(lat - lat_prev) < 0.000001 and abs(lng - lng_prev) < 0.000001:
-                            continue  # Pular coordenada duplicada
-                    
-                    # Garantir que são floats válidos
-                    lat_float = float(lat)
-                    lng_float = float(lng)
-                    coords_otimizadas.append([lat_float, lng_float])
-                    
-                except (ValueError, TypeError):
-                    continue
-        
-        print(f"=== Coordenadas finais ===")
-        print(f"Total de coordenadas: {len(coords_otimizadas)}")
-        print(f"Primeiras 5 coordenadas: {coords_otimizadas[:5] if coords_otimizadas else 'vazio'}")
-        print(f"Últimas 5 coordenadas: {coords_otimizadas[-5:] if coords_otimizadas else 'vazio'}")
-        
-        # Verificar se as coordenadas estão no formato correto para Leaflet [lat, lng]
-        if coords_otimizadas:
-            print(f"Formato de coordenadas: {type(coords_otimizadas[0])}")
-            print(f"Exemplo de coordenada: {coords_otimizadas[0]}")
-            if isinstance(coords_otimizadas[0], list) and len(coords_otimizadas[0]) == 2:
-                print(f"Latitude: {coords_otimizadas[0][0]}, Longitude: {coords_otimizadas[0][1]}")
-        
-        return {
+        resultado = {
             'sucesso': True,
-            'caminho': coords_otimizadas,
-            'distancia': distancia_total,
-            'nos_count': len(caminho)
+            'caminho': coords,
+            'niveis': niveis,
+            'distancia': visao.distancia(arcos),
+            'duracao': duracao,
+            'nos_count': len(caminho),
+            'nos_assentados': nos_assentados,
+            'algoritmo': algoritmo,
+            'cenario': cenario
         }
+        cache_resultados.guardar(chave, resultado, motor.arestas_base[arcos], marca)
+        return dict(resultado, caminho=polilinha(resultado), niveis=None, cache=False)
+        
+    except Exception as e:
+        log.exception("Erro ao obter rota por geometria")
+        return {'sucesso': False, 'erro': str(e)}
+
+def obter_alternativas_por_geometria(origem_no, destino_no, quantidade, modo='driving', cenario=None, tolerancia=0.0):
+    """
+    Até `quantidade` rotas bem diferentes entre dois nós (alternativas.py): a
+    mínima com as chaves de obter_rota_por_geometria e as demais em
+    'alternativas'. Não passa pelo cache: as mesmas duas árvores de busca
+    servem a todas as rotas.
+    """
+    try:
+        cenario = cenarios_pesos.resolver(cenario)
+        visao = cenarios_pesos.visoes(cenario)[modo]
+        motor = visao.motor
+        origem = motor.indice_nos.get(int(origem_no))
+        destino = motor.indice_nos.get(int(destino_no))
+        if origem is None or destino is None:
+            return {'sucesso': False, 'erro': 'Não foi possível encontrar caminho'}
+        with etapa('busca'):
+            rotas, nos_assentados = alternativas.rotas_alternativas(
+                motor, origem, destino, quantidade, FOLGA_ALTERNATIVAS, SOBREPOSICAO_ALTERNATIVAS)
+        metricas.NOS_ASSENTADOS.observar(nos_assentados, 'alternativas', modo)
+        
+        if not rotas:
+            return {'sucesso': False, 'erro': 'Não foi possível encontrar caminho'}
+        
+        with etapa('geometria'):
+            trechos = [{
+                'caminho': geometria.montar(motor.arestas_base[rota['arcos']], origem,
+                                            motor.invertidas[rota['arcos']], tolerancia).tolist(),
+                'distancia': visao.distancia(rota['arcos']),
+                'duracao': rota['custo'],
+                'nos_count': len(rota['arcos']) + 1,
+                'esticamento': rota['esticamento'],
+                'sobreposicao': rota['sobreposicao']
+            } for rota in rotas]
+        
+        return dict(trechos[0], sucesso=True, nos_assentados=nos_assentados, algoritmo='alternativas',
+                    cenario=cenario, cache=False, alternativas=trechos[1:])
         
     except Exception as e:
-        print(f"Erro ao obter rota por geometria: {e}")
+        log.exception("Erro ao obter rotas alternativas")
         return {'sucesso': False, 'erro': str(e)}
 
-def calcular_rota_entre_pontos(origem_lat, origem_lng, destino_lat, destino_lng, modo='driving'):
-    """Calcula rota entre dois pontos usando Dijkstra"""
+def cortar_aresta_mais_proxima(lat, lng, papel, modo='driving', cenario=None):
+    """
+    Ajusta um ponto à aresta do modo mais próxima e corta a aresta no ponto projetado.
+    papel='origem' sai do corte até o fim da aresta; papel='destino' chega do
+    início da aresta até o corte. Se houver arco no sentido contrário, usa o
+    sentido com o menor trecho sobre a via.
+    """
+    visao = cenarios_pesos.visoes(cenario)[modo]
+    motor = visao.motor
+    corte = indice.aresta_mais_proxima(lat, lng, visao.mascara)
+    if corte is None:
+        raise ValueError(f'Nenhuma via acessível no modo {modo} perto do ponto')
+    fracao = corte['fracao']
+    segmento = corte['segmento']
+    coords = geometria.coordenadas_aresta(corte['aresta']).tolist()
+
+    u, v = int(snapshot.origens[corte['aresta']]), int(snapshot.destinos[corte['aresta']])
+    arco = motor.aresta_entre(u, v)
+    contrario = motor.aresta_entre(v, u)
+    trecho_longo = (1 - fracao) > fracao if papel == 'origem' else fracao > (1 - fracao)
+    if arco is None or not np.isfinite(motor.pesos[arco]):
+        # Sentido fechado pelo trânsito ao vivo: só o contrário serve
+        arco = None
+        trecho_longo = contrario is not None
+    if contrario is not None and not np.isfinite(motor.pesos[contrario]):
+        contrario = None
+        trecho_longo = False
+    if arco is None and contrario is None:
+        raise ValueError(f'Via mais próxima fechada no modo {modo}')
+    if contrario is not None and trecho_longo:
+        # Mesma via percorrida no outro sentido: geometria invertida
+        arco, u, v = contrario, v, u
+        fracao = 1 - fracao
+        segmento = len(coords) - 2 - segmento
+        coords = coords[::-1]
+
+    ponto = [corte['lat'], corte['lng']]
+    parte = (1 - fracao) if papel == 'origem' else fracao
+    if papel == 'origem':
+        no, trecho = v, [ponto] + coords[segmento + 1:]
+    else:
+        no, trecho = u, coords[:segmento + 1] + [ponto]
+    return {
+        'no': int(motor.no_ids[no]),
+        'trecho': trecho,
+        'extra_distancia': parte * float(visao.comprimentos[arco]),
+        'extra_duracao': parte * float(motor.pesos[arco]),
+        'arco': arco,
+        'fracao': fracao,
+        'segmento': segmento,
+        'ponto': ponto,
+        'coords': coords,
+    }
+
+def calcular_rota_entre_pontos(origem_lat, origem_lng, destino_lat, destino_lng, modo='driving', algoritmo=None, ajuste='no',
+                               cenario=None, alternativas=1, tolerancia=0.0, formato='coordenadas'):
+    """
+    Calcula rota entre dois pontos na rede do modo de transporte.
+    ajuste='no' liga cada ponto ao nó mais próximo; ajuste='aresta' corta a via
+    mais próxima no ponto projetado e inclui o trecho parcial na rota.
+    cenario: cenário de pesos (cenarios.py); omitido, o ativo no início do pedido.
+    alternativas: mais de 1 devolve também até alternativas - 1 rotas
+    diferentes da mínima em 'alternativas' (o algoritmo é ignorado).
+    tolerancia (m) > 0 simplifica os caminhos; formato 'polyline'/'polyline6'
+    devolve cada caminho como polilinha codificada.
+    """
+    def simplificar_trecho(trecho):
+        if tolerancia <= 0:
+            return trecho
+        coords = np.asarray(trecho, dtype=np.float64)
+        return geometria.simplificar(coords, np.full(len(coords), np.inf), tolerancia)[0].tolist()
+    
+    def formatar(caminho):
+        if formato == 'coordenadas':
+            return caminho
+        with etapa('codificacao'):
+            return geometria_rotas.codificar_polilinha(caminho, geometria_rotas.PRECISOES_POLILINHA[formato])
+    
     try:
-        # Encontrar nós mais próximos das coordenadas (com projeção quando disponível)
+        # Um único cenário do início ao fim, mesmo que o ativo troque no meio do pedido
+        cenario = cenarios_pesos.resolver(cenario)
+        # Encontrar nós (ou arestas) mais próximos pelo índice espacial do modo
         try:
-            if grafo_proj is not None:
-                from shapely.geometry import Point
-                p_origem = Point(origem_lng, origem_lat)
-                p_destino = Point(destino_lng, destino_lat)
-                p_origem_proj, _ = ox.projection.project_geometry(p_origem, to_crs=grafo_proj.graph.get('crs'))
-                p_destino_proj, _ = ox.projection.project_geometry(p_destino, to_crs=grafo_proj.graph.get('crs'))
-                origem_no = ox.nearest_nodes(grafo_proj, p_origem_proj.x, p_origem_proj.y)
-                destino_no = ox.nearest_nodes(grafo_proj, p_destino_proj.x, p_destino_proj.y)
-            else:
-                origem_no = ox.nearest_nodes(grafo, origem_lng, origem_lat)
-                destino_no = ox.nearest_nodes(grafo, destino_lng, destino_lat)
+            with etapa('ajuste'):
+                corte_origem = corte_destino = None
+                if ajuste == 'aresta':
+                    corte_origem = cortar_aresta_mais_proxima(origem_lat, origem_lng, 'origem', modo, cenario)
+                    corte_destino = cortar_aresta_mais_proxima(destino_lat, destino_lng, 'destino', modo, cenario)
+                    origem_no, destino_no = corte_origem['no'], corte_destino['no']
+                else:
+                    nos, _ = indice.nos_mais_proximos([origem_lat, destino_lat], [origem_lng, destino_lng], modo)
+                    origem_no, destino_no = int(snapshot.no_ids[nos[0]]), int(snapshot.no_ids[nos[1]])
         except Exception as e:
             return {'sucesso': False, 'erro': f'Erro ao encontrar nos mais proximos: {str(e)}'}
 
+        # Origem e destino sobre o mesmo arco, no sentido dele: trecho direto
+        if (corte_origem and corte_origem['arco'] == corte_destino['arco']
+                and corte_origem['fracao'] <= corte_destino['fracao']):
+            trecho = ([corte_origem['ponto']]
+                      + corte_origem['coords'][corte_origem['segmento'] + 1:corte_destino['segmento'] + 1]
+                      + [corte_destino['ponto']])
+            parte = corte_destino['fracao'] - corte_origem['fracao']
+            visao = cenarios_pesos.visoes(cenario)[modo]
+            motor = visao.motor
+            return {
+                'sucesso': True,
+                'caminho': formatar(simplificar_trecho(trecho)),
+                'formato': formato,
+                'simplificacao_m': tolerancia,
+                'distancia': parte * float(visao.comprimentos[corte_origem['arco']]),
+                'duracao': parte * float(motor.pesos[corte_origem['arco']]),
+                'nos_count': 0,
+                'nos_assentados': 0,
+                'algoritmo': algoritmo_do_motor(algoritmo, motor),
+                'cache': False,
+                'modo': modo,
+                'cenario': cenario,
+                'alternativas': []
+            }
+
         if origem_no is None or destino_no is None:
             return {'sucesso': False, 'erro': 'Nao foi possivel encontrar nos validos para as coordenadas fornecidas'}
 
         # Usar a função de geometria para obter rota precisa
-        resultado = obter_rota_por_geometria(origem_no, destino_no)
+        if alternativas > 1:
+            resultado = obter_alternativas_por_geometria(origem_no, destino_no, alternativas, modo, cenario, tolerancia)
+        else:
+            resultado = obter_rota_por_geometria(origem_no, destino_no, algoritmo, modo, cenario, tolerancia)
+        
+        if corte_origem:
+            trecho_origem = simplificar_trecho(corte_origem['trecho'])
+            trecho_destino = simplificar_trecho(corte_destino['trecho'])
+        
+        def com_cortes(rota):
+            caminho = rota['caminho']
+            distancia = rota['distancia']
+            duracao = rota['duracao']
+            if corte_origem:
+                # Os trechos terminam/começam exatamente nos nós de ligação da rota
+                caminho = trecho_origem[:-1] + caminho + trecho_destino[1:]
+                distancia += corte_origem['extra_distancia'] + corte_destino['extra_distancia']
+                duracao += corte_origem['extra_duracao'] + corte_destino['extra_duracao']
+            return formatar(caminho), distancia, duracao
         
         if resultado['sucesso']:
+            caminho, distancia, duracao = com_cortes(resultado)
+            outras = []
+            for rota in resultado.get('alternativas', []):
+                caminho_alt, distancia_alt, duracao_alt = com_cortes(rota)
+                outras.append(dict(rota, caminho=caminho_alt, distancia=distancia_alt, duracao=duracao_alt))
             return {
                 'sucesso': True,
-                'caminho': resultado['caminho'],
-                'distancia': resultado['distancia'],
+                'caminho': caminho,
+                'formato': formato,
+                'simplificacao_m': tolerancia,
+                'distancia': distancia,
+                'duracao': duracao,
                 'nos_count': resultado['nos_count'],
-                'modo': modo
+                'nos_assentados': resultado['nos_assentados'],
+                'algoritmo': resultado['algoritmo'],
+                'cache': resultado['cache'],
+                'modo': modo,
+                'cenario': cenario,
+                'alternativas': outras
             }
         else:
             return {'sucesso': False, 'erro': resultado.get('erro', 'Erro desconhecido')}
             
     except Exception as e:
-        import traceback
-        print(f"Erro completo ao calcular rota: {traceback.format_exc()}")
+        log.exception("Erro ao calcular rota")
         return {'sucesso': False, 'erro': f'Erro ao calcular rota: {str(e)}'}
 
+@app.before_request
+def iniciar_medicao():
+    g.inicio_pedido = time.perf_counter()
+    g.token_etapas = metricas.iniciar_pedido()
+
+@app.before_request
+def sincronizar_trafego():
+    """
+    Aplica neste processo os lotes de trânsito gravados por qualquer worker e
+    invalida só as rotas em cache que passam pelas arestas alteradas. Se algum
+    peso desceu no modo, uma rota que evitava a aresta pode ter deixado de ser
+    a mínima: todas as rotas do modo saem.
+    """
+    if cenarios_pesos is None:
+        return
+    alteradas = cenarios_pesos.sincronizar_trafego()
+    if not alteradas:
+        return
+    mascaras = {}
+    for modo, (arestas, desceu) in alteradas.items():
+        if desceu:
+            mascaras[modo] = None
+            continue
+        mascaras[modo] = np.zeros(snapshot.num_arestas, dtype=bool)
+        mascaras[modo][arestas] = True
+    invalidadas = cache_resultados.invalidar_arestas(mascaras)
+    metricas.CACHE.inc('rotas', 'invalidada', valor=invalidadas)
+    log.info("🚦 Trânsito aplicado", extra={'campos': {
+        'versao': trafego_ao_vivo.versao, 'arestas': sum(len(a) for a, _ in alteradas.values()),
+        'modos_descartados': sorted(modo for modo, mascara in mascaras.items() if mascara is None),
+        'rotas_invalidadas': invalidadas}})
+
+@app.after_request
+def registrar_medicao(resposta):
+    """Duração por endpoint, cabeçalho Server-Timing com as etapas e log estruturado (DEBUG)"""
+    token = g.pop('token_etapas', None)
+    if token is None:
+        return resposta
+    duracao = time.perf_counter() - g.inicio_pedido
+    etapas = metricas.encerrar_pedido(token)
+    endpoint = request.endpoint or 'desconhecido'
+    metricas.REQUISICOES.observar(duracao, endpoint, str(resposta.status_code))
+    if etapas:
+        resposta.headers['Server-Timing'] = metricas.server_timing(etapas)
+    log.debug('requisição', extra={'campos': {
+        'endpoint': endpoint, 'status': resposta.status_code, 'ms': round(duracao * 1000, 2),
+        **{f'{nome}_ms': round(d * 1000, 2) for nome, d in etapas}}})
+    metricas.registro.gravar()
+    return resposta
+
+@app.after_request
+def comprimir_resposta(resposta):
+    """
+    gzip de respostas JSON/texto a partir de MIN_BYTES_COMPRESSAO, se o
+    cliente aceitar. Registrado depois de registrar_medicao, roda antes dela:
+    a compressão entra na duração e no Server-Timing.
+    """
+    if (NIVEL_COMPRESSAO <= 0 or resposta.direct_passthrough or resposta.is_streamed
+            or resposta.status_code != 200 or 'Content-Encoding' in resposta.headers
+            or resposta.mimetype not in TIPOS_COMPRIMIDOS):
+        return resposta
+    resposta.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', '').lower():
+        return resposta
+    dados = resposta.get_data()
+    if len(dados) < MIN_BYTES_COMPRESSAO:
+        return resposta
+    with etapa('compressao'):
+        resposta.set_data(gzip.compress(dados, NIVEL_COMPRESSAO, mtime=0))
+    resposta.headers['Content-Encoding'] = 'gzip'
+    return resposta
+
+@app.route('/metrics')
+def api_metricas():
+    """Histogramas e contadores no formato de exposição do Prometheus"""
+    return Response(metricas.registro.texto_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -296,20 +773,32 @@ def api_buscar_endereco():
         except (ValueError, AttributeError):
             pass
         
+        # Índice local de vias e pontos primeiro; Nominatim só como alternativa
+        locais = indice_nomes.buscar(query, 5) if indice_nomes is not None else []
+        if locais and not locais[0]['aproximado']:
+            return jsonify({
+                'sucesso': True,
+                'resultados': locais,
+                'fonte': 'local'
+            })
+        
         # Adicionar "Maricá RJ" à busca para melhor precisão
         query_completa = f"{query}, Maricá, Rio de Janeiro, Brazil"
         
-        # Fazer geocoding
-        location = geocode_com_rate_limit(query_completa)
+        # Fazer geocoding (consultas repetidas saem do cache)
+        location = geocodificar(query_completa)
         
         if location:
             return jsonify({
                 'sucesso': True,
-                'resultados': [{
-                    'nome': location.address,
-                    'lat': location.latitude,
-                    'lng': location.longitude
-                }]
+                'resultados': [location],
+                'fonte': 'nominatim'
+            })
+        elif locais:
+            return jsonify({
+                'sucesso': True,
+                'resultados': locais,
+                'fonte': 'local'
             })
         else:
             return jsonify({
@@ -323,6 +812,30 @@ def api_buscar_endereco():
             'mensagem': f'Erro ao buscar endereço: {str(e)}'
         })
 
+@app.route('/api/autocompletar')
+def api_autocompletar():
+    """Sugestões de vias e pontos turísticos pelo índice local (Nominatim se nada for encontrado)"""
+    try:
+        query = request.args.get('q', '').strip()
+        limite = min(int(request.args.get('limite', 8)), 20)
+        
+        if not query:
+            return jsonify({'sucesso': True, 'resultados': [], 'fonte': 'local'})
+        
+        resultados = indice_nomes.buscar(query, limite) if indice_nomes is not None else []
+        if resultados:
+            return jsonify({'sucesso': True, 'resultados': resultados, 'fonte': 'local'})
+        
+        # Nada no índice local: uma consulta (com cache) ao Nominatim
+        if len(query) >= 3:
+            location = geocodificar(f"{query}, Maricá, Rio de Janeiro, Brazil")
+            if location:
+                return jsonify({'sucesso': True, 'resultados': [location], 'fonte': 'nominatim'})
+        
+        return jsonify({'sucesso': True, 'resultados': [], 'fonte': 'local'})
+    except Exception as e:
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao autocompletar: {str(e)}'})
+
 @app.route('/api/reverse_geocode', methods=['POST'])
 def api_reverse_geocode_route():
     """Faz reverse geocoding (coordenadas -> endereço)"""
@@ -341,13 +854,9 @@ def api_reverse_geocode_route():
 def api_reverse_geocode(lat, lng):
     """Função auxiliar para reverse geocoding"""
     try:
-        location = reverse_geocode_com_rate_limit(f"{lat}, {lng}")
+        location = geocodificar_reverso(lat, lng)
         if location:
-            return jsonify({'sucesso': True, 'resultados': [{
-                'nome': location.address,
-                'lat': location.latitude,
-                'lng': location.longitude
-            }]})
+            return jsonify({'sucesso': True, 'resultados': [location]})
         else:
             return jsonify({'sucesso': False, 'mensagem': 'Endereço não encontrado para essas coordenadas'})
     except Exception as e:
@@ -355,7 +864,11 @@ def api_reverse_geocode(lat, lng):
 
 @app.route('/api/calcular_rota', methods=['POST'])
 def api_calcular_rota():
-    """Calcula rota entre dois pontos"""
+    """
+    Calcula rota entre dois pontos. A polilinha vem completa, a não ser que o
+    pedido informe 'zoom' do mapa ou 'simplificacao_m' (prevalece); 'formato'
+    'polyline' ou 'polyline6' a devolve codificada.
+    """
     try:
         dados = request.json
         origem_lat = dados.get('origem_lat')
@@ -363,6 +876,10 @@ def api_calcular_rota():
         destino_lat = dados.get('destino_lat')
         destino_lng = dados.get('destino_lng')
         modo = dados.get('modo', 'driving')
+        algoritmo = dados.get('algoritmo')
+        ajuste = dados.get('ajuste', 'no')
+        quantidade = dados.get('alternativas', 1)
+        formato = dados.get('formato', 'coordenadas')
         
         if not all([origem_lat, origem_lng, destino_lat, destino_lng]):
             return jsonify({
@@ -370,14 +887,77 @@ def api_calcular_rota():
                 'mensagem': 'Coordenadas incompletas'
             })
         
+        if algoritmo is not None and algoritmo not in motor_rotas.ALGORITMOS:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Algoritmo inválido: use um de {", ".join(motor_rotas.ALGORITMOS)}'
+            })
+        
+        if modo not in modos.MODOS:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Modo inválido: use um de {", ".join(modos.MODOS)}'
+            })
+        
+        if (isinstance(quantidade, bool) or not isinstance(quantidade, int)
+                or not 1 <= quantidade <= MAX_ALTERNATIVAS):
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f"'alternativas' deve ser um inteiro entre 1 e {MAX_ALTERNATIVAS} (rotas, contando a mínima)"
+            })
+        
+        if ajuste not in AJUSTES:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Ajuste inválido: use um de {", ".join(AJUSTES)}'
+            })
+        
+        if formato not in FORMATOS_CAMINHO:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Formato inválido: use um de {", ".join(FORMATOS_CAMINHO)}'
+            })
+        
+        try:
+            if dados.get('simplificacao_m') is not None:
+                tolerancia = float(dados['simplificacao_m'])
+            elif dados.get('zoom') is not None:
+                zoom = float(dados['zoom'])
+                if not 0 <= zoom <= geometria_rotas.ZOOM_MAXIMO:
+                    raise ValueError
+                tolerancia = geometria_rotas.tolerancia_do_zoom(zoom, float(origem_lat))
+            else:
+                tolerancia = 0.0
+            if not tolerancia >= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f"'zoom' deve ir de 0 a {geometria_rotas.ZOOM_MAXIMO} e 'simplificacao_m' não pode ser negativa"
+            })
+        
+        try:
+            cenario = cenarios_pesos.resolver(dados.get('cenario'))
+        except ValueError as e:
+            return jsonify({'sucesso': False, 'mensagem': str(e)})
+        
+        if algoritmo == 'ch' and quantidade == 1 and cenarios_pesos.visoes(cenario)[modo].motor.hierarquia is None:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f"Hierarquia de contração não construída para o modo '{modo}' no cenário '{cenario}' "
+                            f"(execute python contracao.py; só o cenário '{cenarios.CENARIO_BASE}' tem CH)"
+            })
+        
         # Calcular rota
-        resultado = calcular_rota_entre_pontos(
+        resultado = pool_buscas.executar(
+            calcular_rota_entre_pontos,
             float(origem_lat), float(origem_lng),
             float(destino_lat), float(destino_lng),
-            modo
+            modo, algoritmo, ajuste, cenario, quantidade, tolerancia, formato
         )
         
-        return jsonify(resultado)
+        with etapa('serializacao'):
+            return jsonify(resultado)
         
     except Exception as e:
         return jsonify({
@@ -385,41 +965,246 @@ def api_calcular_rota():
             'mensagem': f'Erro ao calcular rota: {str(e)}'
         })
 
+@app.route('/api/matriz', methods=['POST'])
+def api_matriz():
+    """
+    Matriz de durações (s) e distâncias (m) entre listas de pontos [lat, lng].
+    Sem 'destinos', usa as próprias origens; caminhos só com incluir_caminhos.
+    """
+    try:
+        dados = request.json
+        origens = dados.get('origens') or []
+        destinos = dados.get('destinos') or origens
+        modo = dados.get('modo', 'driving')
+        incluir_caminhos = bool(dados.get('incluir_caminhos', False))
+        
+        if not origens or not destinos:
+            return jsonify({'sucesso': False, 'mensagem': 'Origens/destinos não fornecidos'})
+        
+        if modo not in modos.MODOS:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Modo inválido: use um de {", ".join(modos.MODOS)}'
+            })
+        
+        if len(origens) * len(destinos) > MAX_CELULAS_MATRIZ:
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Matriz grande demais: máximo de {MAX_CELULAS_MATRIZ} pares'
+            })
+        
+        try:
+            cenario = cenarios_pesos.resolver(dados.get('cenario'))
+        except ValueError as e:
+            return jsonify({'sucesso': False, 'mensagem': str(e)})
+        
+        # Ajuste de todos os pontos ao grafo do modo numa única consulta à KD-tree
+        pontos = [(float(p[0]), float(p[1])) for p in origens] + [(float(p[0]), float(p[1])) for p in destinos]
+        with etapa('ajuste'):
+            nos, _ = indice.nos_mais_proximos([p[0] for p in pontos], [p[1] for p in pontos], modo)
+        nos_origens, nos_destinos = nos[:len(origens)], nos[len(origens):]
+        
+        inicio = time.time()
+        with etapa('busca'):
+            duracoes, distancias, caminhos, assentados = pool_buscas.executar(
+                servico_matriz.calcular, cenarios_pesos.visoes(cenario), geometria, modo, nos_origens, nos_destinos,
+                incluir_caminhos, cenario)
+        
+        resultado = {
+            'sucesso': True,
+            'modo': modo,
+            'cenario': cenario,
+            'duracoes': duracoes,
+            'distancias': distancias,
+            'origens_ajustadas': [[float(snapshot.no_lat[n]), float(snapshot.no_lng[n])] for n in nos_origens],
+            'destinos_ajustados': [[float(snapshot.no_lat[n]), float(snapshot.no_lng[n])] for n in nos_destinos],
+            'nos_assentados': assentados,
+            'tempo_ms': (time.time() - inicio) * 1000
+        }
+        if incluir_caminhos:
+            resultado['caminhos'] = caminhos
+        with etapa('serializacao'):
+            return jsonify(resultado)
+        
+    except Exception as e:
+        return jsonify({
+            'sucesso': False,
+            'mensagem': f'Erro ao calcular matriz: {str(e)}'
+        })
+
+@app.route('/api/isocronas', methods=['POST'])
+def api_isocronas():
+    """
+    Áreas alcançáveis a partir de 'lat'/'lng' no modo, como GeoJSON. 'tipo':
+    'tempo' ('limites' em segundos) ou 'distancia' (em metros); todos os
+    limites saem de uma única busca. 'simplificacao_m' ajusta o Douglas-Peucker.
+    """
+    try:
+        dados = request.json or {}
+        modo = dados.get('modo', 'driving')
+        tipo = dados.get('tipo', 'tempo')
+        if modo not in modos.MODOS:
+            return jsonify({'sucesso': False, 'mensagem': f'Modo inválido: use um de {", ".join(modos.MODOS)}'})
+        if tipo not in isocronas.TIPOS:
+            return jsonify({'sucesso': False, 'mensagem': f'Tipo inválido: use um de {", ".join(isocronas.TIPOS)}'})
+        try:
+            lat, lng = float(dados['lat']), float(dados['lng'])
+            limites = [float(limite) for limite in dados.get('limites') or isocronas.LIMITES_PADRAO[tipo]]
+            tolerancia = float(dados.get('simplificacao_m', isocronas.TOLERANCIA_SIMPLIFICACAO))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'sucesso': False, 'mensagem': 'Informe lat, lng e limites numéricos'})
+        maximo = MAX_LIMITE_ISOCRONA[tipo]
+        if len(limites) > MAX_FAIXAS_ISOCRONA or not all(0 < limite <= maximo for limite in limites):
+            return jsonify({
+                'sucesso': False,
+                'mensagem': f'Informe até {MAX_FAIXAS_ISOCRONA} limites entre 0 e {maximo:g}'
+            })
+        if snapshot is None:
+            return jsonify({'sucesso': False, 'mensagem': 'Sistema não inicializado'})
+        try:
+            cenario = cenarios_pesos.resolver(dados.get('cenario'))
+        except ValueError as e:
+            return jsonify({'sucesso': False, 'mensagem': str(e)})
+        
+        with etapa('ajuste'):
+            origem = indice.no_mais_proximo(lat, lng, modo)[0]
+        inicio = time.time()
+        with etapa('busca'):
+            areas, assentados = pool_buscas.executar(
+                isocronas.calcular_isocronas, cenarios_pesos.visoes(cenario)[modo], geometria, origem, limites, tipo,
+                max(tolerancia, 0.0))
+        metricas.NOS_ASSENTADOS.observar(assentados, 'isocrona', modo)
+        
+        # Maiores primeiro: desenhadas nessa ordem, as menores ficam por cima
+        resultado = {
+            'sucesso': True,
+            'modo': modo,
+            'cenario': cenario,
+            'tipo': tipo,
+            'origem_ajustada': [float(snapshot.no_lat[origem]), float(snapshot.no_lng[origem])],
+            'isocronas': {
+                'type': 'FeatureCollection',
+                'features': [{
+                    'type': 'Feature',
+                    'geometry': area.pop('poligono'),
+                    'properties': area,
+                } for area in reversed(areas)]
+            },
+            'nos_assentados': assentados,
+            'tempo_ms': (time.time() - inicio) * 1000
+        }
+        with etapa('serializacao'):
+            return jsonify(resultado)
+    except Exception as e:
+        log.exception("Erro na API isocronas")
+        return jsonify({'sucesso': False, 'mensagem': f'Erro ao calcular isócronas: {str(e)}'})
+
+@app.route('/api/saude')
+def api_saude():
+    """Verificação de prontidão para o balanceador / servidor de produção"""
+    pronto = snapshot is not None and bool(visoes)
+    return jsonify({'sucesso': pronto, 'pid': os.getpid()}), (200 if pronto else 503)
+
+@app.route('/api/cache_rotas')
+def api_cache_rotas():
+    """Contadores do cache de rotas (acertos, falhas, despejos) para dimensioná-lo"""
+    return jsonify({
+        'sucesso': True,
+        'cache': cache_resultados.estatisticas()
+    })
+
+@app.route('/api/cache_geocodificacao')
+def api_cache_geocodificacao():
+    """Contadores do cache de geocodificação"""
+    return jsonify({
+        'sucesso': True,
+        'cache': cache_geocodificacao_app.estatisticas()
+    })
+
+@app.route('/api/cenarios', methods=['GET', 'POST'])
+def api_cenarios():
+    """
+    Lista os cenários de pesos; POST {'cenario': nome} troca o ativo para todos
+    os workers (com ROTA_ADMIN_TOKEN, exige o cabeçalho X-Rota-Admin).
+    """
+    if cenarios_pesos is None:
+        return jsonify({'sucesso': False, 'mensagem': 'Sistema não inicializado'})
+    if request.method == 'POST':
+        if TOKEN_ADMIN and request.headers.get('X-Rota-Admin') != TOKEN_ADMIN:
+            return jsonify({'sucesso': False, 'mensagem': 'Não autorizado'}), 403
+        nome = (request.json or {}).get('cenario')
+        try:
+            anterior = cenarios_pesos.ativo
+            cenarios_pesos.ativar(nome)
+        except ValueError as e:
+            return jsonify({'sucesso': False, 'mensagem': str(e)})
+        log.info(f"🔀 Cenário de pesos ativo: {anterior} -> {cenarios_pesos.ativo}")
+    return jsonify({'sucesso': True, 'ativo': cenarios_pesos.ativo, 'cenarios': cenarios_pesos.listar()})
+
+@app.route('/api/trafego', methods=['GET', 'POST'])
+def api_trafego():
+    """
+    Trânsito ao vivo. POST {'atualizacoes': [...]} aplica um lote; cada item
+    indica 'via' (way id OSM) ou 'aresta' ([u, v, chave] OSM ou índice), e
+    'fator' (>= 1), 'fechada' ou 'restaurar', com 'modos' opcional. Vale para
+    todos os workers e cenários. Se os pesos só sobem, saem do cache só as
+    rotas que passam pelas arestas; restaurar ou baixar um fator descarta as
+    rotas do modo.
+    """
+    if trafego_ao_vivo is None:
+        return jsonify({'sucesso': False, 'mensagem': 'Sistema não inicializado'})
+    if request.method == 'GET':
+        return jsonify({'sucesso': True, 'trafego': trafego_ao_vivo.estatisticas()})
+    if TOKEN_ADMIN and request.headers.get('X-Rota-Admin') != TOKEN_ADMIN:
+        return jsonify({'sucesso': False, 'mensagem': 'Não autorizado'}), 403
+    itens = (request.json or {}).get('atualizacoes')
+    if not isinstance(itens, list) or not itens or len(itens) > MAX_LOTE_TRAFEGO:
+        return jsonify({'sucesso': False, 'mensagem': f'Informe de 1 a {MAX_LOTE_TRAFEGO} atualizações'})
+    inicio = time.perf_counter()
+    try:
+        alteracoes = trafego.interpretar_lote(snapshot, itens, modos.MODOS)
+    except trafego.AtualizacaoInvalida as e:
+        return jsonify({'sucesso': False, 'mensagem': str(e)})
+    versao = trafego_ao_vivo.gravar(alteracoes)
+    # Este worker aplica já; os demais no próximo pedido que atenderem
+    sincronizar_trafego()
+    return jsonify({
+        'sucesso': True,
+        'versao': versao,
+        'arestas': int(sum(len(arestas) for _, arestas, _ in alteracoes)),
+        'tempo_ms': (time.perf_counter() - inicio) * 1000,
+    })
+
 @app.route('/api/info_algoritmo')
 def api_info_algoritmo():
-    """Retorna informações sobre o algoritmo Dijkstra e estatísticas do grafo"""
+    """Retorna o algoritmo padrão, os disponíveis, as hierarquias carregadas, o cenário ativo e estatísticas do grafo"""
     try:
-        if grafo is None:
+        if not estatisticas_grafo:
             return jsonify({
                 'sucesso': False,
                 'mensagem': 'Sistema não inicializado'
             })
         
-        # Calcular estatísticas do grafo
-        total_nos = len(grafo.nodes())
-        total_arestas = len(grafo.edges())
-        
-        # Verificar quantas arestas têm pesos randomizados
-        arestas_randomizadas = 0
-        for origem, destino, chave, dados in grafo.edges(keys=True, data=True):
-            if 'fator_randomico' in dados:
-                arestas_randomizadas += 1
-        
-        # Informações sobre o algoritmo
+        cenario = cenarios_pesos.cenarios[cenarios_pesos.ativo]
+        modos_ch = [modo for modo, visao in cenarios_pesos.visoes(cenario.nome).items()
+                    if visao.motor.hierarquia is not None]
         info = {
-            'algoritmo': 'Dijkstra Customizado com Heapq',
+            'algoritmo': ALGORITMO_PADRAO,
+            'algoritmos': list(motor_rotas.ALGORITMOS),
+            'modos_com_ch': modos_ch,
             'complexidade_tempo': 'O((V + E) log V)',
             'complexidade_espaco': 'O(V)',
-            'total_nos': total_nos,
-            'total_arestas': total_arestas,
-            'arestas_randomizadas': arestas_randomizadas,
-            'randomizacao_ativa': arestas_randomizadas > 0,
+            **estatisticas_grafo,
+            'randomizacao_ativa': estatisticas_grafo['arestas_randomizadas'] > 0,
+            'cenario_ativo': cenario.nome,
+            'cenario_descricao': cenario.descricao,
             'tipo_grafo': 'Direcionado com pesos positivos',
             'aplicacao': 'Rotas urbanas em Maricá, RJ',
             'idioma': 'Português (Brasil)',
             'caracteristicas': [
-                'Implementação customizada com heapq',
-                'Randomização de pesos (±20%)',
+                f"Busca padrão '{ALGORITMO_PADRAO}' sobre CSR; por pedido: {', '.join(motor_rotas.ALGORITMOS)}",
+                f"Hierarquia de contração: {', '.join(modos_ch) if modos_ch else 'nenhum modo'}",
+                f"Cenário ativo '{cenario.nome}': {cenario.descricao}",
                 'Suporte a múltiplos modos de transporte',
                 'Visualização com geometria real OSM',
                 'Cálculo de tempo estimado por modo'
@@ -441,41 +1226,9 @@ def api_info_algoritmo():
 def api_pontos_turisticos():
     """Retorna pontos turísticos de Maricá"""
     try:
-        # Pontos turísticos reais de Maricá
-        pontos = [
-            {
-                'nome': 'Praia de Maricá',
-                'lat': -22.9189,
-                'lng': -42.8194,
-                'tipo': 'praia',
-                'descricao': 'Principal praia da cidade'
-            },
-            {
-                'nome': 'Lagoa de Maricá',
-                'lat': -22.9200,
-                'lng': -42.8300,
-                'tipo': 'lagoa',
-                'descricao': 'Lagoa costeira com águas calmas'
-            },
-            {
-                'nome': 'Centro de Maricá',
-                'lat': -22.9180,
-                'lng': -42.8190,
-                'tipo': 'centro',
-                'descricao': 'Centro comercial da cidade'
-            },
-            {
-                'nome': 'Barra de Maricá',
-                'lat': -22.9300,
-                'lng': -42.8100,
-                'tipo': 'praia',
-                'descricao': 'Extremidade da praia'
-            }
-        ]
-        
         return jsonify({
             'sucesso': True,
-            'pontos': pontos
+            'pontos': PONTOS_TURISTICOS
         })
         
     except Exception as e:
@@ -487,88 +1240,207 @@ def api_pontos_turisticos():
 # Configuração OSRM (público por padrão; pode ser sobrescrito via env OSRM_URL)
 OSRM_BASE_URL = os.environ.get('OSRM_URL', 'https://router.project-osrm.org')
 
+# Perfis OSRM -> modos do grafo local
+PERFIS_OSRM = {'driving': 'driving', 'car': 'driving', 'walking': 'walking', 'foot': 'walking',
+               'cycling': 'cycling', 'bike': 'cycling'}
+
+# Candidatos avaliados de uma vez por /api/desvio_parada
+MAX_CANDIDATOS_DESVIO = int(os.environ.get('ROTA_DESVIO_MAX_CANDIDATOS', 500))
+
+def rota_local_waypoints(profile, waypoints):
+    """Rota pelos waypoints no roteador local, no formato das respostas OSRM"""
+    modo = PERFIS_OSRM.get(profile)
+    if modo is None or snapshot is None:
+        return {'sucesso': False, 'mensagem': 'Roteador local indisponível para o perfil'}
+    nos, _ = indice.nos_mais_proximos([wp[0] for wp in waypoints], [wp[1] for wp in waypoints], modo)
+    ids = [int(snapshot.no_ids[n]) for n in nos]
+    cenario = cenarios_pesos.ativo
+    coords, distancia, duracao = [], 0.0, 0.0
+    for origem_no, destino_no in zip(ids[:-1], ids[1:]):
+        trecho = obter_rota_por_geometria(origem_no, destino_no, None, modo, cenario)
+        if not trecho['sucesso']:
+            return {'sucesso': False, 'mensagem': trecho.get('erro', 'Sem caminho entre os waypoints')}
+        coords += trecho['caminho'] if not coords else trecho['caminho'][1:]
+        distancia += trecho['distancia']
+        duracao += trecho['duracao']
+    return {
+        'sucesso': True,
+        'distance_m': distancia,
+        'duration_s': duracao,
+        'geometry_geojson': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in coords]},
+        'fonte': 'local'
+    }
+
+# Cliente OSRM com pool de conexões, cache e disjuntor que cai para o roteador local
+cliente_osrm_app = cliente_osrm.ClienteOSRM(
+    OSRM_BASE_URL, rota_local=lambda profile, waypoints: pool_buscas.executar(rota_local_waypoints, profile, waypoints),
+    timeout=float(os.environ.get('OSRM_TIMEOUT', 12)),
+    limite_lento=float(os.environ.get('OSRM_LIMITE_LENTO', 3)))
+
+def validar_waypoints(waypoints):
+    """Mensagem de erro se a lista de waypoints não puder ser roteada; None se válida"""
+    if not waypoints or len(waypoints) < 2:
+        return 'Waypoints insuficientes'
+    if len(waypoints) > 7:
+        return 'Limite excedido: máximo origem + 5 paradas + destino'
+    return None
+
+def resultado_osrm_falho(profile, waypoints, e):
+    """
+    Resposta para uma chamada ao upstream OSRM que terminou em exceção. Se ela
+    nem começou (fila), o roteador local atende. Se expirou em andamento, a
+    thread segue com a rede ou com o fallback local do próprio cliente: não
+    repete o trabalho.
+    """
+    if isinstance(e, (io_assincrono.ExpirouNaFila, io_assincrono.FilaCheia)):
+        return cliente_osrm_app.alternativa_local(profile, waypoints, f'OSRM sem resposta a tempo: {e!r}')
+    if isinstance(e, io_assincrono.TempoEsgotado):
+        return {'sucesso': False, 'mensagem': f'OSRM sem resposta a tempo: {e!r}'}
+    return {'sucesso': False, 'mensagem': f'Erro ao processar resposta OSRM: {str(e)}'}
+
 def chamar_osrm_route(profile, waypoints):
+    erro = validar_waypoints(waypoints)
+    if erro:
+        return {'sucesso': False, 'mensagem': erro}
     try:
-        if not waypoints or len(waypoints) < 2:
-            return {'sucesso': False, 'mensagem': 'Waypoints insuficientes'}
-        if len(waypoints) > 7:
-            return {'sucesso': False, 'mensagem': 'Limite excedido: máximo origem + 5 paradas + destino'}
-        coords = ';'.join([f"{wp[1]},{wp[0]}" for wp in waypoints])
-        url = f"{OSRM_BASE_URL}/route/v1/{profile}/{coords}?overview=full&geometries=geojson&steps=false"
-        req = urllib.request.Request(url, headers={'User-Agent': 'RotaMarcio/1.0'})
-        with urllib.request.urlopen(req, timeout=12) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
-        if 'routes' not in data or not data['routes']:
-            return {'sucesso': False, 'mensagem': 'OSRM não retornou rotas'}
-        r0 = data['routes'][0]
-        return {
-            'sucesso': True,
-            'distance_m': r0.get('distance'),
-            'duration_s': r0.get('duration'),
-            'geometry_geojson': r0.get('geometry')
-        }
-    except urllib.error.URLError as e:
-        return {'sucesso': False, 'mensagem': f'Erro de rede ao chamar OSRM: {e}'}
+        with etapa('osrm'):
+            return laco_io.chamar('osrm', cliente_osrm_app.rota, profile, waypoints)
     except Exception as e:
-        return {'sucesso': False, 'mensagem': f'Erro ao processar resposta OSRM: {str(e)}'}
+        return resultado_osrm_falho(profile, waypoints, e)
 
 @app.route('/api/rota_osrm', methods=['POST'])
 def api_rota_osrm():
     try:
         dados = request.json or {}
         profile = dados.get('profile', 'driving')
-        waypoints = dados.get('waypoints')
-        if not isinstance(waypoints, list):
-            return jsonify({'sucesso': False, 'mensagem': 'Parâmetro waypoints inválido'})
-        wps = []
-        for wp in waypoints:
-            if not isinstance(wp, (list, tuple)) or len(wp) != 2:
-                return jsonify({'sucesso': False, 'mensagem': 'Waypoint inválido'})
-            wps.append([float(wp[0]), float(wp[1])])
-        resultado = chamar_osrm_route(profile, wps)
-        return jsonify(resultado)
+        # 'lote': várias listas de waypoints independentes, enviadas em paralelo
+        lote = dados.get('lote')
+        listas = lote if isinstance(lote, list) else [dados.get('waypoints')]
+        pedidos = []
+        for waypoints in listas:
+            if not isinstance(waypoints, list):
+                return jsonify({'sucesso': False, 'mensagem': 'Parâmetro waypoints inválido'})
+            wps = []
+            for wp in waypoints:
+                if not isinstance(wp, (list, tuple)) or len(wp) != 2:
+                    return jsonify({'sucesso': False, 'mensagem': 'Waypoint inválido'})
+                wps.append([float(wp[0]), float(wp[1])])
+            pedidos.append(wps)
+        if not isinstance(lote, list):
+            return jsonify(chamar_osrm_route(profile, pedidos[0]))
+        for wps in pedidos:
+            erro = validar_waypoints(wps)
+            if erro:
+                return jsonify({'sucesso': False, 'mensagem': erro})
+        with etapa('osrm'):
+            resultados = laco_io.chamar_varios('osrm', cliente_osrm_app.rota, [(profile, wps) for wps in pedidos])
+        for i, resultado in enumerate(resultados):
+            if isinstance(resultado, Exception):
+                resultados[i] = resultado_osrm_falho(profile, pedidos[i], resultado)
+        return jsonify({'sucesso': True, 'resultados': resultados})
     except Exception as e:
-        import traceback
-        print(f"Erro na API rota_osrm: {traceback.format_exc()}")
+        log.exception("Erro na API rota_osrm")
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao calcular rota OSRM: {str(e)}'})
 
+@app.route('/api/osrm_status')
+def api_osrm_status():
+    """Estado do disjuntor e contadores do cliente OSRM"""
+    return jsonify({'sucesso': True, 'osrm': cliente_osrm_app.estatisticas()})
+
+@app.route('/api/upstreams')
+def api_upstreams():
+    """Fila, chamadas em andamento e expiradas por serviço externo (Nominatim, OSRM)"""
+    return jsonify({'sucesso': True, 'upstreams': laco_io.estatisticas()})
+
 @app.route('/api/desvio_parada', methods=['POST'])
 def api_desvio_parada():
+    """
+    Custo de incluir parada(s) candidata(s) numa rota base, calculado no grafo local.
+    Aceita 'candidate' (um ponto) ou 'candidates' (lista, devolvida ordenada pelo
+    acréscimo de tempo). 'posicao': 'final' (antes do destino) ou 'melhor' trecho;
+    'otimizar_ordem' permuta as paradas intermediárias e, com 'posicao' omitida,
+    insere o candidato no melhor trecho de cada ordem.
+    """
     try:
         dados = request.json or {}
-        profile = dados.get('profile', 'driving')
+        modo = PERFIS_OSRM.get(dados.get('profile', 'driving'))
         base = dados.get('base')
         candidate = dados.get('candidate')
+        candidates = dados.get('candidates')
+        otimizar_ordem = bool(dados.get('otimizar_ordem', False))
+        posicao = dados.get('posicao', 'melhor' if otimizar_ordem else 'final')
+        if modo is None:
+            return jsonify({'sucesso': False, 'mensagem': 'Perfil inválido'})
+        if posicao not in desvios.POSICOES:
+            return jsonify({'sucesso': False, 'mensagem': f'Posição inválida: use um de {", ".join(desvios.POSICOES)}'})
         if not isinstance(base, list) or len(base) < 2:
             return jsonify({'sucesso': False, 'mensagem': 'Rota base inválida'})
-        if not isinstance(candidate, (list, tuple)) or len(candidate) != 2:
-            return jsonify({'sucesso': False, 'mensagem': 'Candidato inválido'})
-        base_norm = [[float(wp[0]), float(wp[1])] for wp in base]
-        res_base = chamar_osrm_route(profile, base_norm)
-        if not res_base.get('sucesso'):
-            return jsonify({'sucesso': False, 'mensagem': res_base.get('mensagem', 'Falha ao calcular base')})
-        with_candidate = base_norm[:-1] + [[float(candidate[0]), float(candidate[1])]] + [base_norm[-1]]
-        if len(with_candidate) > 7:
+        unico = candidates is None
+        if unico:
+            if not isinstance(candidate, (list, tuple)) or len(candidate) != 2:
+                return jsonify({'sucesso': False, 'mensagem': 'Candidato inválido'})
+            candidates = [candidate]
+        if not isinstance(candidates, list) or not candidates or len(candidates) > MAX_CANDIDATOS_DESVIO:
+            return jsonify({'sucesso': False, 'mensagem': f'Informe de 1 a {MAX_CANDIDATOS_DESVIO} candidatos'})
+        if len(base) + 1 > desvios.MAX_PONTOS:
             return jsonify({'sucesso': False, 'mensagem': 'Limite excedido ao adicionar parada'})
-        res_cand = chamar_osrm_route(profile, with_candidate)
-        if not res_cand.get('sucesso'):
-            return jsonify({'sucesso': False, 'mensagem': res_cand.get('mensagem', 'Falha ao calcular com parada')})
-        delta_dist = (res_cand.get('distance_m') or 0) - (res_base.get('distance_m') or 0)
-        delta_dur = (res_cand.get('duration_s') or 0) - (res_base.get('duration_s') or 0)
-        return jsonify({
+        if snapshot is None:
+            return jsonify({'sucesso': False, 'mensagem': 'Sistema não inicializado'})
+        try:
+            cenario = cenarios_pesos.resolver(dados.get('cenario'))
+        except ValueError as e:
+            return jsonify({'sucesso': False, 'mensagem': str(e)})
+        
+        # Ajuste de paradas e candidatos ao grafo do modo numa única consulta
+        pontos = [[float(wp[0]), float(wp[1])] for wp in base] + [[float(c[0]), float(c[1])] for c in candidates]
+        with etapa('ajuste'):
+            nos, _ = indice.nos_mais_proximos([p[0] for p in pontos], [p[1] for p in pontos], modo)
+        with etapa('busca'):
+            avaliador = pool_buscas.executar(
+                desvios.AvaliadorDesvios, cenarios_pesos.visoes(cenario)[modo], geometria, nos[:len(base)],
+                nos[len(base):])
+        if not np.isfinite(avaliador.duracao_base):
+            return jsonify({'sucesso': False, 'mensagem': 'Falha ao calcular base: sem caminho entre as paradas'})
+        
+        with etapa('insercao'):
+            avaliacao = pool_buscas.executar(avaliador.avaliar, posicao, otimizar_ordem)
+        delta_dur, delta_dist = avaliacao['delta_duracao'], avaliacao['delta_distancia']
+        alcancaveis = np.flatnonzero(np.isfinite(delta_dur))
+        if not len(alcancaveis):
+            return jsonify({'sucesso': False, 'mensagem': 'Falha ao calcular com parada: candidato inalcançável'})
+        ranking = alcancaveis[np.argsort(delta_dur[alcancaveis], kind='stable')].tolist()
+        
+        melhor = ranking[0]
+        with etapa('geometria'):
+            preview = avaliador.geometria_plano(melhor, avaliacao['ordens'][melhor])
+        resultado = {
             'sucesso': True,
-            'delta_distance_m': delta_dist,
-            'delta_duration_s': delta_dur,
-            'preview_geometry_geojson': res_cand.get('geometry_geojson')
-        })
+            'delta_distance_m': float(delta_dist[melhor]),
+            'delta_duration_s': float(delta_dur[melhor]),
+            'ordem': avaliacao['ordens'][melhor],
+            'preview_geometry_geojson': {'type': 'LineString', 'coordinates': preview[:, ::-1].tolist()},
+            'nos_assentados': avaliador.nos_assentados
+        }
+        if not unico:
+            resultado['candidatos'] = [{
+                'indice': c,
+                'delta_distance_m': float(delta_dist[c]),
+                'delta_duration_s': float(delta_dur[c]),
+                'ordem': avaliacao['ordens'][c]
+            } for c in ranking]
+            resultado['inalcancaveis'] = np.flatnonzero(~np.isfinite(delta_dur)).tolist()
+        return jsonify(resultado)
     except Exception as e:
-        import traceback
-        print(f"Erro na API desvio_parada: {traceback.format_exc()}")
+        log.exception("Erro na API desvio_parada")
         return jsonify({'sucesso': False, 'mensagem': f'Erro ao calcular desvio: {str(e)}'})
 
 if __name__ == '__main__':
+    import sys
+    if '--construir-snapshot' in sys.argv:
+        construir_snapshot()
+        sys.exit(0)
     if inicializar_sistema():
-        print("🚀 Iniciando servidor Flask...")
+        log.info("🚀 Iniciando servidor Flask (produção: gunicorn -c gunicorn.conf.py wsgi:application)...")
         app.run(debug=True, host='0.0.0.0', port=5000)
     else:
-        print("❌ Não foi possível inicializar o sistema")
+        log.error("❌ Não foi possível inicializar o sistema")
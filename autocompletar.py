@@ -0,0 +1,188 @@
+"""
+Índice local de nomes de vias e pontos turísticos para autocompletar endereços.
+
+Cada nome distinto das arestas do snapshot vira uma entrada, com uma
+coordenada sobre a própria via: o ponto médio da aresta mais próxima do
+centro de todas as arestas com esse nome. Os pontos turísticos entram como
+entradas extras. A busca normaliza o texto (minúsculas, sem acentos) e
+procura primeiro por prefixo de palavras (lista ordenada + bisect). Se faltar
+resultado, completa com trigramas, o que tolera erros de digitação.
+"""
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+from snapshot_grafo import SEPARADOR_NOMES
+
+# Tipos de entrada, na ordem de preferência em caso de empate
+TIPO_PONTO = 'ponto'
+TIPO_VIA = 'via'
+
+# Fração mínima de trigramas da consulta presentes no nome para a busca aproximada
+SIMILARIDADE_MINIMA = 0.5
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e com espaços simples"""
+    decomposto = unicodedata.normalize('NFKD', str(texto).lower())
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in sem_acentos).split())
+
+
+def trigramas(texto):
+    texto = f'  {texto} '
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceNomes:
+    """Busca por prefixo e por trigramas sobre nomes de vias e pontos"""
+
+    def __init__(self, nomes, lats, lngs, tipos, pesos):
+        self.nomes = list(nomes)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.tipos = list(tipos)
+        # Popularidade (arestas com o nome; pontos turísticos recebem um valor alto)
+        self.pesos = np.asarray(pesos, dtype=np.float64)
+        self.normalizados = [normalizar(nome) for nome in self.nomes]
+
+        # Pares (palavra, entrada) ordenados para busca de prefixo por bisect
+        pares = sorted((palavra, i) for i, texto in enumerate(self.normalizados) for palavra in set(texto.split()))
+        self._palavras = [palavra for palavra, _ in pares]
+        self._entradas_palavra = np.array([i for _, i in pares], dtype=np.int64)
+
+        # Trigrama -> entradas que o contêm
+        por_trigrama = {}
+        for i, texto in enumerate(self.normalizados):
+            for trigrama in trigramas(texto):
+                por_trigrama.setdefault(trigrama, []).append(i)
+        self._trigramas = {t: np.array(ids, dtype=np.int64) for t, ids in por_trigrama.items()}
+
+    @classmethod
+    def do_snapshot(cls, snapshot, pontos=()):
+        """Uma entrada por nome de via do snapshot, mais os pontos informados"""
+        vocabulario = [str(nome) for nome in np.asarray(snapshot.vocabulario_nomes).tolist()]
+        codigos = np.asarray(snapshot.nome)
+        com_nome = np.flatnonzero(codigos > 0)
+
+        # Ponto médio (vértice do meio da geometria) de cada aresta com nome
+        offsets = np.asarray(snapshot.geom_offsets)
+        meio = np.asarray(snapshot.geom_coords)[(offsets[com_nome] + offsets[com_nome + 1]) // 2]
+
+        # Vias cujo nome composto ('A;B') tem várias partes contam para cada uma
+        nome_parte, id_parte = [], {}
+        partes_codigo = [[] for _ in vocabulario]
+        for codigo in range(1, len(vocabulario)):
+            for parte in vocabulario[codigo].split(SEPARADOR_NOMES):
+                parte = parte.strip()
+                if not parte:
+                    continue
+                if parte not in id_parte:
+                    id_parte[parte] = len(nome_parte)
+                    nome_parte.append(parte)
+                partes_codigo[codigo].append(id_parte[parte])
+
+        # Pares (aresta com nome, nome) para agrupar as arestas de cada nome
+        arestas_idx, grupos = [], []
+        for j, codigo in enumerate(codigos[com_nome].tolist()):
+            for grupo in partes_codigo[codigo]:
+                arestas_idx.append(j)
+                grupos.append(grupo)
+        arestas_idx = np.array(arestas_idx, dtype=np.int64)
+        grupos = np.array(grupos, dtype=np.int64)
+
+        num = len(nome_parte)
+        lats, lngs = np.zeros(num), np.zeros(num)
+        contagem = np.bincount(grupos, minlength=num).astype(np.float64)
+        if len(grupos):
+            pontos_meio = meio[arestas_idx]
+            centro_lat = np.bincount(grupos, pontos_meio[:, 0], minlength=num) / np.maximum(contagem, 1)
+            centro_lng = np.bincount(grupos, pontos_meio[:, 1], minlength=num) / np.maximum(contagem, 1)
+            distancia = (pontos_meio[:, 0] - centro_lat[grupos]) ** 2 + (pontos_meio[:, 1] - centro_lng[grupos]) ** 2
+            # Por grupo, a aresta de menor distância ao centro (primeira após ordenar)
+            ordem = np.lexsort((distancia, grupos))
+            primeiros = ordem[np.r_[True, grupos[ordem][1:] != grupos[ordem][:-1]]]
+            lats[grupos[primeiros]] = pontos_meio[primeiros, 0]
+            lngs[grupos[primeiros]] = pontos_meio[primeiros, 1]
+
+        pontos = list(pontos)
+        peso_ponto = float(contagem.max()) + 1 if num else 1.0
+        return cls(
+            nome_parte + [p['nome'] for p in pontos],
+            np.concatenate([lats, [p['lat'] for p in pontos]]),
+            np.concatenate([lngs, [p['lng'] for p in pontos]]),
+            [TIPO_VIA] * num + [TIPO_PONTO] * len(pontos),
+            np.concatenate([contagem, np.full(len(pontos), peso_ponto)]))
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def _prefixo(self, palavra):
+        inicio = bisect_left(self._palavras, palavra)
+        fim = bisect_left(self._palavras, palavra + '\uffff', inicio)
+        return self._entradas_palavra[inicio:fim]
+
+    def _por_prefixo(self, palavras):
+        """Entradas em que cada palavra da consulta é prefixo de alguma palavra do nome"""
+        candidatas = None
+        # Começa pela palavra mais seletiva (mais longa)
+        for palavra in sorted(palavras, key=len, reverse=True):
+            entradas = self._prefixo(palavra)
+            candidatas = entradas if candidatas is None else np.intersect1d(candidatas, entradas)
+            if not len(candidatas):
+                break
+        return np.unique(candidatas) if candidatas is not None else np.zeros(0, dtype=np.int64)
+
+    def _por_trigrama(self, consulta):
+        grams = [self._trigramas[t] for t in trigramas(consulta) if t in self._trigramas]
+        total = len(trigramas(consulta))
+        if not grams or not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        contagem = np.bincount(np.concatenate(grams), minlength=len(self.nomes))
+        similaridade = contagem / total
+        entradas = np.flatnonzero(similaridade >= SIMILARIDADE_MINIMA)
+        return entradas, similaridade[entradas]
+
+    def buscar(self, consulta, limite=8):
+        """
+        Lista de dicts {'nome', 'lat', 'lng', 'tipo', 'aproximado'} ordenada por
+        relevância: nome começando pela consulta, depois todas as palavras como
+        prefixo, depois semelhança por trigramas.
+        """
+        consulta = normalizar(consulta)
+        if not consulta:
+            return []
+        palavras = consulta.split()
+
+        entradas = self._por_prefixo(palavras)
+        comeca = np.array([self.normalizados[i].startswith(consulta) for i in entradas.tolist()], dtype=bool)
+        eh_ponto = np.array([self.tipos[i] == TIPO_PONTO for i in entradas.tolist()], dtype=bool)
+        # lexsort: última chave é a principal
+        ordem = np.lexsort((
+            [len(self.nomes[i]) for i in entradas.tolist()],
+            -self.pesos[entradas],
+            ~eh_ponto,
+            ~comeca,
+        )) if len(entradas) else np.zeros(0, dtype=np.int64)
+        escolhidas = entradas[ordem][:limite].tolist()
+        aproximadas = set()
+
+        if len(escolhidas) < limite and len(consulta) >= 3:
+            similares, similaridade = self._por_trigrama(consulta)
+            ja = set(escolhidas)
+            ordem = np.lexsort((-self.pesos[similares], -similaridade))
+            for i in similares[ordem].tolist():
+                if len(escolhidas) >= limite:
+                    break
+                if i not in ja:
+                    escolhidas.append(i)
+                    aproximadas.add(i)
+
+        return [{
+            'nome': self.nomes[i],
+            'lat': float(self.lats[i]),
+            'lng': float(self.lngs[i]),
+            'tipo': self.tipos[i],
+            'aproximado': i in aproximadas,
+        } for i in escolhidas]
@@ -0,0 +1,98 @@
+"""
+Benchmark: chamada OSRM antiga (urllib, uma conexão por pedido, em série) x
+ClienteOSRM (pool keep-alive, cache e disjuntor), em série e em paralelo
+pelo laço de E/S do app (io_assincrono.LacoAssincrono.chamar_varios).
+
+Roda sem rede contra o servidor OSRM falso (benchmarks/osrm_falso.py), com
+latência artificial por pedido, e imprime latência média e vazão de cada
+variante. Ao final, deixa o servidor lento e mostra o disjuntor abrindo e as
+rotas passando a vir do roteador local.
+
+    python benchmarks/bench_cliente_osrm.py --pedidos 200 --latencia 40
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cliente_osrm
+import io_assincrono
+import osrm_falso
+
+
+def chamada_antiga(base_url, profile, waypoints):
+    """Mesmo código do chamar_osrm_route original: urlopen novo a cada pedido"""
+    coords = ';'.join([f"{wp[1]},{wp[0]}" for wp in waypoints])
+    url = f"{base_url}/route/v1/{profile}/{coords}?overview=full&geometries=geojson&steps=false"
+    req = urllib.request.Request(url, headers={'User-Agent': 'RotaMarcio/1.0'})
+    with urllib.request.urlopen(req, timeout=12) as resp:
+        data = json.loads(resp.read().decode('utf-8'))
+    return data['routes'][0]
+
+
+def pedidos_aleatorios(quantidade, semente):
+    rng = random.Random(semente)
+    return [('driving', [(rng.uniform(-22.99, -22.90), rng.uniform(-42.95, -42.75)) for _ in range(rng.randint(2, 4))])
+            for _ in range(quantidade)]
+
+
+def relatar(nome, segundos, quantidade):
+    print(f"{nome:<34} {segundos * 1000 / quantidade:8.2f} ms/pedido | {quantidade / segundos:8.1f} pedidos/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pedidos', type=int, default=100)
+    parser.add_argument('--latencia', type=float, default=40, help='latência do OSRM falso (ms)')
+    parser.add_argument('--conexoes', type=int, default=16)
+    parser.add_argument('--semente', type=int, default=7)
+    args = parser.parse_args()
+
+    servidor, url = osrm_falso.iniciar_em_thread(latencia=args.latencia / 1000)
+    pedidos = pedidos_aleatorios(args.pedidos, args.semente)
+    print(f"OSRM falso em {url}, latência {args.latencia:.0f} ms, {args.pedidos} pedidos distintos")
+
+    inicio = time.perf_counter()
+    for profile, waypoints in pedidos:
+        chamada_antiga(url, profile, waypoints)
+    relatar('urllib em série (antigo)', time.perf_counter() - inicio, len(pedidos))
+
+    cliente = cliente_osrm.ClienteOSRM(url, max_conexoes=args.conexoes, limite_lento=10)
+    inicio = time.perf_counter()
+    for profile, waypoints in pedidos:
+        cliente.rota(profile, waypoints)
+    relatar('ClienteOSRM em série (keep-alive)', time.perf_counter() - inicio, len(pedidos))
+
+    cliente = cliente_osrm.ClienteOSRM(url, max_conexoes=args.conexoes, limite_lento=10)
+    laco = io_assincrono.LacoAssincrono(io_assincrono.Upstream('osrm', max_simultaneos=args.conexoes, timeout=60))
+    inicio = time.perf_counter()
+    resultados = laco.chamar_varios('osrm', cliente.rota, pedidos)
+    relatar(f'ClienteOSRM paralelo ({args.conexoes} conexões)', time.perf_counter() - inicio, len(pedidos))
+    assert all(r['sucesso'] for r in resultados)
+
+    inicio = time.perf_counter()
+    laco.chamar_varios('osrm', cliente.rota, pedidos)
+    relatar('ClienteOSRM repetido (cache)', time.perf_counter() - inicio, len(pedidos))
+
+    # Servidor lento: o disjuntor abre e as rotas passam a vir do roteador local.
+    # Aqui o roteador local é uma linha reta instantânea, só para medir o desvio
+    servidor.latencia = 0.3
+    cliente = cliente_osrm.ClienteOSRM(
+        url, limite_lento=0.1, disjuntor=cliente_osrm.Disjuntor(falhas_para_abrir=3, espera=60),
+        rota_local=lambda profile, waypoints: {'sucesso': True, 'fonte': 'local'})
+    lentos = pedidos_aleatorios(20, args.semente + 1)
+    inicio = time.perf_counter()
+    fontes = [cliente.rota(*pedido)['fonte'] for pedido in lentos]
+    relatar('OSRM lento (300 ms) com disjuntor', time.perf_counter() - inicio, len(lentos))
+    print(f"   fontes: {fontes.count('osrm')} osrm, {fontes.count('local')} local | {cliente.estatisticas()}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: latência de /api/calcular_rota com centenas de chamadas OSRM lentas pendentes.
+
+Sobe o gunicorn (um worker) com OSRM_URL apontando para o servidor OSRM falso
+(benchmarks/osrm_falso.py) com latência alta. Dispara `--pendentes` pedidos
+/api/rota_osrm distintos de uma vez e, enquanto eles esperam, mede pedidos
+/api/calcular_rota em série. Compara o worker síncrono antigo (ROTA_THREADS=1,
+uma requisição por vez) com o caminho assíncrono (threads que só esperam o laço
+de E/S, buscas no pool próprio).
+
+    python benchmarks/bench_io_assincrono.py --pendentes 100 --latencia 1000
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import carga_calcular_rota
+import osrm_falso
+
+
+def postar(url, caminho, corpo, timeout=600):
+    req = urllib.request.Request(f'{url}{caminho}', data=json.dumps(corpo).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def rodar(threads, diretorio, url_osrm, porta, rotas, pedidos_osrm):
+    ambiente = dict(os.environ, ROTA_SNAPSHOT_DIR=diretorio, ROTA_WORKERS='1', ROTA_THREADS=str(threads),
+                    ROTA_BIND=f'127.0.0.1:{porta}', ROTA_CACHE_ENTRADAS='0', OSRM_URL=url_osrm,
+                    OSRM_CONEXOES='64', OSRM_LIMITE_LENTO='1000')
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--timeout', '300', 'wsgi:application'],
+        cwd=carga_calcular_rota.RAIZ, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{porta}'
+    try:
+        if not carga_calcular_rota.esperar_pronto(url):
+            raise RuntimeError('gunicorn não ficou pronto')
+        postar(url, '/api/calcular_rota', rotas[0])
+
+        fontes = []
+        inicio_osrm = time.perf_counter()
+
+        def pedir_osrm(corpo):
+            fontes.append(postar(url, '/api/rota_osrm', corpo).get('fonte'))
+
+        pendentes = [threading.Thread(target=pedir_osrm, args=(corpo,)) for corpo in pedidos_osrm]
+        for t in pendentes:
+            t.start()
+        time.sleep(0.5)
+
+        latencias = []
+        for corpo in rotas:
+            inicio = time.perf_counter()
+            assert postar(url, '/api/calcular_rota', corpo)['sucesso']
+            latencias.append(time.perf_counter() - inicio)
+        for t in pendentes:
+            t.join()
+        total_osrm = time.perf_counter() - inicio_osrm
+    finally:
+        servidor.send_signal(signal.SIGTERM)
+        servidor.wait(timeout=30)
+
+    nome = 'síncrono (1 thread)' if threads == 1 else f'assíncrono ({threads} threads)'
+    print(f"{nome:<26} calcular_rota p50 {carga_calcular_rota.percentil(latencias, 50) * 1000:8.1f} ms | "
+          f"p99 {carga_calcular_rota.percentil(latencias, 99) * 1000:8.1f} ms | "
+          f"{len(fontes)} rota_osrm em {total_osrm:6.2f} s ({fontes.count('osrm')} osrm)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pendentes', type=int, default=100, help='pedidos OSRM simultâneos')
+    parser.add_argument('--latencia', type=float, default=1000, help='latência do OSRM falso (ms)')
+    parser.add_argument('--rotas', type=int, default=20, help='pedidos calcular_rota medidos')
+    parser.add_argument('--threads', type=int, default=256)
+    parser.add_argument('--lado', type=int, default=100)
+    parser.add_argument('--porta', type=int, default=5078)
+    parser.add_argument('--semente', type=int, default=7)
+    args = parser.parse_args()
+
+    servidor_osrm, url_osrm = osrm_falso.iniciar_em_thread(latencia=args.latencia / 1000)
+    with tempfile.TemporaryDirectory() as diretorio:
+        faixa_lat, faixa_lng = carga_calcular_rota.gravar_grade(diretorio, args.lado)
+        rng = random.Random(args.semente)
+
+        def ponto():
+            return [rng.uniform(*faixa_lat), rng.uniform(*faixa_lng)]
+
+        rotas = [dict(zip(('origem_lat', 'origem_lng'), ponto()), **dict(zip(('destino_lat', 'destino_lng'), ponto())))
+                 for _ in range(args.rotas)]
+        pedidos_osrm = [{'profile': 'driving', 'waypoints': [ponto(), ponto()]} for _ in range(args.pendentes)]
+        print(f"OSRM falso com latência {args.latencia:.0f} ms | {args.pendentes} rota_osrm pendentes | "
+              f"{args.rotas} calcular_rota medidos")
+        for threads in (1, args.threads):
+            rodar(threads, diretorio, url_osrm, args.porta, rotas, pedidos_osrm)
+    servidor_osrm.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: dijkstra_customizado (dicts + NetworkX) x MotorRotas (CSR).
+
+Roda sem acesso à rede sobre uma grade sintética (ou sobre o snapshot de
+Maricá, se ROTA_SNAPSHOT_DIR apontar para um), confere que os motores
+encontram as mesmas rotas e imprime o tempo médio e os nós assentados por
+consulta de cada algoritmo.
+
+    python benchmarks/bench_motor_rotas.py --lado 150 --consultas 200 --ch
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import networkx as nx
+
+import app
+import contracao
+import motor_rotas
+import snapshot_grafo
+
+
+def grafo_grade(lado, semente=42):
+    """Grade lado x lado bidirecional com pesos aleatórios e algumas arestas paralelas"""
+    rng = random.Random(semente)
+    grafo = nx.MultiDiGraph(crs='epsg:4326')
+    passo = 0.001  # ~100 m
+    for i in range(lado):
+        for j in range(lado):
+            grafo.add_node(i * lado + j, x=-42.90 + j * passo, y=-22.95 + i * passo)
+    for i in range(lado):
+        for j in range(lado):
+            no = i * lado + j
+            vizinhos = []
+            if j + 1 < lado:
+                vizinhos.append(no + 1)
+            if i + 1 < lado:
+                vizinhos.append(no + lado)
+            for vizinho in vizinhos:
+                for u, v in ((no, vizinho), (vizinho, no)):
+                    comprimento = rng.uniform(80, 120)
+                    grafo.add_edge(u, v, key=0, length=comprimento)
+                    # Paralela mais longa: as duas implementações escolhem a chave 0
+                    if rng.random() < 0.05:
+                        grafo.add_edge(u, v, key=1, length=comprimento * 1.5)
+    return grafo
+
+
+def cronometrar(funcao, pares):
+    inicio = time.perf_counter()
+    resultados = [funcao(o, d) for o, d in pares]
+    return (time.perf_counter() - inicio) / len(pares), resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lado', type=int, default=100, help='lado da grade sintética')
+    parser.add_argument('--consultas', type=int, default=100)
+    parser.add_argument('--semente', type=int, default=7)
+    parser.add_argument('--ch', action='store_true', help='constrói e mede a hierarquia de contração')
+    args = parser.parse_args()
+
+    snapshot = None
+    if os.environ.get('ROTA_SNAPSHOT_DIR'):
+        snapshot = snapshot_grafo.carregar_snapshot(os.environ['ROTA_SNAPSHOT_DIR'])
+    if snapshot is not None:
+        grafo, _ = snapshot_grafo.grafos_do_snapshot(snapshot)
+        motor = motor_rotas.MotorRotas.do_snapshot(snapshot)
+    else:
+        grafo = grafo_grade(args.lado)
+        motor = motor_rotas.MotorRotas.do_grafo(grafo)
+    print(f"Grafo: {grafo.number_of_nodes()} nós, {grafo.number_of_edges()} arestas")
+    if args.ch:
+        arrays = contracao.construir_hierarquia(motor.num_nos, motor.origens.tolist(),
+                                                motor.destinos.tolist(), motor.pesos.tolist())
+        motor.hierarquia = contracao.HierarquiaContracao(arrays, contracao.checksum_pesos(motor.pesos))
+
+    rng = random.Random(args.semente)
+    nos = list(grafo.nodes())
+    pares = [(rng.choice(nos), rng.choice(nos)) for _ in range(args.consultas)]
+
+    # Silenciar os prints por consulta de dijkstra_customizado
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        t_antigo, antigos = cronometrar(lambda o, d: app.dijkstra_customizado(grafo, o, d), pares)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(f"{'dijkstra_customizado':24s} {t_antigo * 1000:8.2f} ms/consulta")
+
+    for algoritmo in motor_rotas.ALGORITMOS:
+        if algoritmo == 'ch' and motor.hierarquia is None:
+            continue
+        t_csr, novos = cronometrar(lambda o, d: motor.rota(o, d, algoritmo), pares)
+        divergentes = sum(
+            1 for (caminho_a, dist_a), (caminho_b, _, dist_b, _) in zip(antigos, novos)
+            if caminho_a != caminho_b or abs(dist_a - dist_b) > 1e-6)
+        assentados = sum(r[3] for r in novos) / len(novos)
+        print(f"{'CSR ' + algoritmo:24s} {t_csr * 1000:8.2f} ms/consulta | "
+              f"{t_antigo / t_csr:5.1f}x | {assentados:8.0f} nós assentados | "
+              f"rotas divergentes: {divergentes}/{len(pares)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Teste de carga: /api/calcular_rota servido pelo gunicorn com 1, 2, 4... workers.
+
+Sobe o servidor de produção (wsgi.py + gunicorn.conf.py) sobre um snapshot
+(ROTA_SNAPSHOT_DIR, ou uma grade sintética gravada num diretório temporário),
+dispara pedidos concorrentes de processos clientes e imprime vazão, latência
+p50/p99 e a memória de cada worker: RSS e PSS (a parte proporcional das
+páginas compartilhadas, lida de /proc/<pid>/smaps_rollup). O cache de rotas
+fica desligado para que todo pedido faça a busca.
+
+    python benchmarks/carga_calcular_rota.py --workers 1 2 4 --pedidos 400 --clientes 8
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def gravar_grade(diretorio, lado):
+    import osmnx as ox
+
+    import app
+    import bench_motor_rotas
+    import snapshot_grafo
+    grafo = bench_motor_rotas.grafo_grade(lado)
+    snapshot_grafo.salvar_snapshot(grafo, ox.project_graph(grafo), diretorio, app.PARAMETROS_SNAPSHOT)
+    lats = [d['y'] for _, d in grafo.nodes(data=True)]
+    lngs = [d['x'] for _, d in grafo.nodes(data=True)]
+    return (min(lats), max(lats)), (min(lngs), max(lngs))
+
+
+def limites_snapshot(diretorio):
+    import snapshot_grafo
+    snapshot = snapshot_grafo.carregar_snapshot(diretorio, verificar=False)
+    return ((float(snapshot.no_lat.min()), float(snapshot.no_lat.max())),
+            (float(snapshot.no_lng.min()), float(snapshot.no_lng.max())))
+
+
+def memoria(pid):
+    """(RSS, PSS) em MB de um processo"""
+    valores = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for linha in f:
+            partes = linha.split()
+            if partes[0] in ('Rss:', 'Pss:'):
+                valores[partes[0]] = int(partes[1]) / 1024
+    return valores.get('Rss:', 0.0), valores.get('Pss:', 0.0)
+
+
+def filhos(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def esperar_pronto(url, limite=120):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        try:
+            with urllib.request.urlopen(f'{url}/api/saude', timeout=2) as resp:
+                if json.loads(resp.read())['sucesso']:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def disparar(url, corpos):
+    """Executado em cada processo cliente: latências (s) de uma fatia dos pedidos"""
+    latencias = []
+    for corpo in corpos:
+        dados = json.dumps(corpo).encode('utf-8')
+        req = urllib.request.Request(f'{url}/api/calcular_rota', data=dados,
+                                     headers={'Content-Type': 'application/json'})
+        inicio = time.perf_counter()
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            sucesso = json.loads(resp.read())['sucesso']
+        latencias.append(time.perf_counter() - inicio)
+        if not sucesso:
+            raise RuntimeError(f'Rota falhou: {corpo}')
+    return latencias
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def rodar(workers, diretorio, porta, corpos, clientes):
+    ambiente = dict(os.environ, ROTA_SNAPSHOT_DIR=diretorio, ROTA_WORKERS=str(workers),
+                    ROTA_BIND=f'127.0.0.1:{porta}', ROTA_CACHE_ENTRADAS='0')
+    servidor = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+        cwd=RAIZ, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{porta}'
+    try:
+        if not esperar_pronto(url):
+            raise RuntimeError('gunicorn não ficou pronto')
+        # Aquecimento: cada worker atende alguns pedidos antes da medição
+        disparar(url, corpos[:workers * 4])
+        fatias = [corpos[i::clientes] for i in range(clientes)]
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(clientes) as pool:
+            latencias = [l for parte in pool.map(disparar, [url] * clientes, fatias) for l in parte]
+        duracao = time.perf_counter() - inicio
+        mem = [memoria(pid) for pid in filhos(servidor.pid)]
+        mestre = memoria(servidor.pid)
+    finally:
+        servidor.send_signal(signal.SIGTERM)
+        servidor.wait(timeout=30)
+
+    print(f"{workers:3d} workers | {len(latencias) / duracao:7.1f} req/s | "
+          f"p50 {percentil(latencias, 50) * 1000:7.1f} ms | p99 {percentil(latencias, 99) * 1000:7.1f} ms | "
+          f"mestre RSS {mestre[0]:6.1f} MB | por worker RSS {sum(r for r, _ in mem) / len(mem):6.1f} MB "
+          f"PSS {sum(p for _, p in mem) / len(mem):6.1f} MB | PSS total {mestre[1] + sum(p for _, p in mem):7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--pedidos', type=int, default=400)
+    parser.add_argument('--clientes', type=int, default=8, help='processos clientes concorrentes')
+    parser.add_argument('--lado', type=int, default=150, help='lado da grade sintética')
+    parser.add_argument('--porta', type=int, default=5077)
+    parser.add_argument('--semente', type=int, default=7)
+    args = parser.parse_args()
+
+    temporario = None
+    diretorio = os.environ.get('ROTA_SNAPSHOT_DIR')
+    if diretorio:
+        faixa_lat, faixa_lng = limites_snapshot(diretorio)
+    else:
+        temporario = tempfile.TemporaryDirectory()
+        diretorio = temporario.name
+        faixa_lat, faixa_lng = gravar_grade(diretorio, args.lado)
+
+    rng = random.Random(args.semente)
+    corpos = [{'origem_lat': rng.uniform(*faixa_lat), 'origem_lng': rng.uniform(*faixa_lng),
+               'destino_lat': rng.uniform(*faixa_lat), 'destino_lng': rng.uniform(*faixa_lng)}
+              for _ in range(args.pedidos)]
+    print(f"Snapshot {diretorio} | {args.pedidos} pedidos | {args.clientes} clientes | {os.cpu_count()} CPUs")
+    try:
+        for workers in args.workers:
+            rodar(workers, diretorio, args.porta, corpos, args.clientes)
+    finally:
+        if temporario is not None:
+            temporario.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Servidor OSRM falso para testes e benchmarks sem rede.
+
+Responde a /route/v1/<perfil>/<lng,lat;lng,lat;...> com a linha reta entre
+os waypoints (distância haversine, duração a uma velocidade fixa por perfil)
+depois de uma latência artificial (com `sem_rotas` ligado, responde sem
+rota, como o OSRM entre pontos desconectados). Fala HTTP/1.1 com keep-alive, então
+clientes com pool de conexões reaproveitam a conexão.
+
+    python benchmarks/osrm_falso.py --porta 5001 --latencia 80
+    OSRM_URL=http://127.0.0.1:5001 python app.py
+"""
+import argparse
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+RAIO_TERRA = 6371008.8
+VELOCIDADES = {'driving': 30.0, 'car': 30.0, 'walking': 5.0, 'foot': 5.0, 'cycling': 15.0, 'bike': 15.0}
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * RAIO_TERRA * math.asin(math.sqrt(a))
+
+
+def criar_servidor(porta=0, latencia=0.05, host='127.0.0.1'):
+    """ThreadingHTTPServer configurado; porta=0 escolhe uma porta livre"""
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Cabeçalho e corpo saem em escritas separadas: sem TCP_NODELAY, o
+        # Nagle + ACK atrasado somaria ~40 ms a cada resposta em keep-alive
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            partes = urlsplit(self.path).path.strip('/').split('/')
+            if len(partes) != 4 or partes[:2] != ['route', 'v1']:
+                return self._responder(404, {'code': 'InvalidUrl'})
+            try:
+                pontos = [tuple(map(float, par.split(','))) for par in partes[3].split(';')]
+            except ValueError:
+                return self._responder(400, {'code': 'InvalidQuery'})
+            time.sleep(self.server.latencia)
+            distancia = sum(haversine(a[1], a[0], b[1], b[0]) for a, b in zip(pontos[:-1], pontos[1:]))
+            velocidade = VELOCIDADES.get(partes[2], 30.0) / 3.6
+            self.server.atendidos += 1
+            if self.server.sem_rotas:
+                return self._responder(200, {'code': 'NoRoute', 'routes': []})
+            self._responder(200, {'code': 'Ok', 'routes': [{
+                'distance': distancia,
+                'duration': distancia / velocidade,
+                'geometry': {'type': 'LineString', 'coordinates': [list(p) for p in pontos]},
+            }]})
+
+        def _responder(self, status, corpo):
+            dados = json.dumps(corpo).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+    servidor = ThreadingHTTPServer((host, porta), Manipulador)
+    servidor.daemon_threads = True
+    servidor.latencia = latencia
+    servidor.atendidos = 0
+    servidor.sem_rotas = False
+    return servidor
+
+
+def iniciar_em_thread(porta=0, latencia=0.05):
+    """Sobe o servidor numa thread daemon; retorna (servidor, url base)"""
+    servidor = criar_servidor(porta, latencia)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, porta = servidor.server_address[:2]
+    return servidor, f'http://{host}:{porta}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--porta', type=int, default=5001)
+    parser.add_argument('--latencia', type=float, default=50, help='latência artificial por pedido (ms)')
+    args = parser.parse_args()
+    servidor = criar_servidor(args.porta, args.latencia / 1000)
+    print(f"🛰️ OSRM falso em http://127.0.0.1:{args.porta} (latência {args.latencia:.0f} ms)")
+    servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Suíte reproduzível de benchmarks de roteamento, sem acesso à rede.
+
+Grafos medidos:
+
+- grades sintéticas de tamanhos crescentes (bench_motor_rotas.grafo_grade),
+  com pesos randomizados pela mesma semente;
+- o snapshot real de Maricá, se existir (--snapshot, padrão app.SNAPSHOT_DIR,
+  gerado com python app.py --construir-snapshot).
+
+Cada grade é gravada como snapshot em benchmarks/dados/ e reaproveitada
+entre execuções, assim como a hierarquia de contração do modo driving (--ch).
+
+Cada grafo tem um conjunto fixo de consultas (origem, destino), derivado da
+semente. Casos medidos:
+
+- networkx: dijkstra_customizado no grafo NetworkX (até --max-nos-networkx nós);
+- csr_dijkstra, csr_astar_bidirecional, csr_ch: MotorRotas do modo driving;
+- csr_alternativas_3: até 3 rotas por par (alternativas.py) no mesmo motor;
+- api_calcular_rota, api_calcular_rota_aresta, api_calcular_rota_alternativas
+  (alternativas=3), api_calcular_rota_polyline (polilinha codificada),
+  api_calcular_rota_polyline_z14 (codificada e simplificada para o zoom 14),
+  api_matriz_10x10, api_isocrona_15min (carro, a partir de 20 das origens):
+  endpoints pelo cliente de teste do Flask, com o cache de rotas desligado.
+
+Para cada caso são medidos p50/p99, vazão (consultas/s numa thread), nós
+assentados médios e pico de memória alocada (tracemalloc, numa passada
+separada). Nos casos de /api/calcular_rota também o tamanho médio da
+resposta, sem e com gzip. Os tempos são os da melhor de --rodadas repetições. Os resultados vão para benchmarks/resultados/<data>_<commit>.json.
+Com --comparar BASE.json, a suíte mostra a variação caso a caso e sai com
+código 1 se algum p50 piorar além da tolerância.
+
+    python benchmarks/suite_rotas.py --lados 30 60 120 --consultas 200
+    python benchmarks/suite_rotas.py --comparar benchmarks/resultados/base.json
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, AQUI)
+
+# Antes de importar o app: sem cache de rotas, matriz no próprio processo, logs só de aviso
+os.environ['ROTA_CACHE_ENTRADAS'] = '0'
+os.environ['ROTA_MATRIZ_PROCESSOS'] = '1'
+os.environ.setdefault('ROTA_LOG_NIVEL', 'WARNING')
+
+import numpy as np
+import osmnx as ox
+
+import alternativas
+import app
+import bench_motor_rotas
+import contracao
+import snapshot_grafo
+
+VERSAO_RESULTADOS = 1
+CONSULTAS_MEMORIA = 20
+AQUECIMENTO = 5
+
+
+def preparar_grade(lado, semente, diretorio_base):
+    """Snapshot da grade lado x lado com pesos randomizados pela semente (gravado uma vez)"""
+    diretorio = os.path.join(diretorio_base, f'grade_{lado}_s{semente}')
+    parametros = dict(app.PARAMETROS_SNAPSHOT, semente_pesos=semente)
+    if snapshot_grafo.carregar_snapshot(diretorio, parametros, verificar=False) is None:
+        grafo = bench_motor_rotas.grafo_grade(lado, semente)
+        snapshot_grafo.salvar_snapshot(grafo, ox.project_graph(grafo), diretorio, parametros)
+    return diretorio
+
+
+def carregar_no_app(diretorio, construir_ch):
+    """Inicializa o app sobre o snapshot; constrói e grava a CH do driving se pedida"""
+    app.SNAPSHOT_DIR = diretorio
+    with open(os.path.join(diretorio, snapshot_grafo.ARQUIVO_MANIFESTO), encoding='utf-8') as f:
+        parametros = json.load(f)['parametros']
+    app.PARAMETROS_SNAPSHOT = parametros
+    if not app.inicializar_sistema(usar_snapshot=True):
+        raise RuntimeError(f'Snapshot inválido em {diretorio}')
+    motor = app.visoes['driving'].motor
+    if construir_ch and motor.hierarquia is None:
+        motor.hierarquia = contracao.construir_para_motor(motor, diretorio, 'driving')
+    return motor
+
+
+def consultas_fixas(quantidade, semente):
+    """Pares (origem, destino) de ids OSM entre nós do modo driving, sempre os mesmos por semente"""
+    validos = np.flatnonzero(app.visoes['driving'].nos_validos)
+    rng = random.Random(semente)
+    ids = app.snapshot.no_ids
+    return [(int(ids[rng.choice(validos)]), int(ids[rng.choice(validos)])) for _ in range(quantidade)]
+
+
+def assinatura(pares, manifesto_checksum):
+    dados = json.dumps([manifesto_checksum, pares]).encode('utf-8')
+    return hashlib.sha1(dados).hexdigest()[:16]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def medir(funcao, entradas, rodadas):
+    """
+    Executa funcao(entrada) para cada entrada, `rodadas` vezes; retorna métricas
+    de tempo, nós e memória. Tempos são os da melhor rodada (menos sujeitos a
+    interferência de outros processos).
+    """
+    for entrada in entradas[:AQUECIMENTO]:
+        funcao(entrada)
+    p50, p99, media, vazao = [], [], [], []
+    for _ in range(rodadas):
+        tempos, assentados = [], []
+        inicio_total = time.perf_counter()
+        for entrada in entradas:
+            inicio = time.perf_counter()
+            nos = funcao(entrada)
+            tempos.append(time.perf_counter() - inicio)
+            if nos is not None:
+                assentados.append(nos)
+        total = time.perf_counter() - inicio_total
+        p50.append(percentil(tempos, 50))
+        p99.append(percentil(tempos, 99))
+        media.append(sum(tempos) / len(tempos))
+        vazao.append(len(entradas) / total)
+
+    tracemalloc.start()
+    for entrada in entradas[:CONSULTAS_MEMORIA]:
+        funcao(entrada)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'consultas': len(entradas),
+        'rodadas': rodadas,
+        'p50_ms': min(p50) * 1000,
+        'p99_ms': min(p99) * 1000,
+        'media_ms': min(media) * 1000,
+        'vazao_qps': max(vazao),
+        'nos_assentados_medio': sum(assentados) / len(assentados) if assentados else None,
+        'pico_memoria_kb': pico / 1024,
+    }
+
+
+def tamanho_respostas(cliente, url, corpos):
+    """Tamanho médio (bytes) das respostas do endpoint, sem e com gzip"""
+    tamanhos = [(len(cliente.post(url, json=corpo).data),
+                 len(cliente.post(url, json=corpo, headers={'Accept-Encoding': 'gzip'}).data))
+                for corpo in corpos]
+    return tuple(sum(coluna) / len(tamanhos) for coluna in zip(*tamanhos))
+
+
+def casos_do_grafo(motor, pares, max_nos_networkx, rng):
+    """
+    (nome, função, entradas, url) de cada motor e endpoint para o grafo
+    carregado no app; url é o endpoint cujas respostas são medidas em bytes
+    """
+    casos = []
+    if app.snapshot.num_nos <= max_nos_networkx:
+        grafo = app.obter_grafo()
+
+        def networkx(par):
+            app.dijkstra_customizado(grafo, *par)
+
+        casos.append(('networkx', networkx, pares, None))
+    for algoritmo in ('dijkstra', 'astar_bidirecional', 'ch'):
+        if algoritmo == 'ch' and motor.hierarquia is None:
+            continue
+        casos.append((f'csr_{algoritmo}', lambda par, a=algoritmo: motor.rota(*par, a)[3], pares, None))
+
+    indice_nos = motor.indice_nos
+
+    def rotas_alternativas(par):
+        return alternativas.rotas_alternativas(motor, indice_nos[par[0]], indice_nos[par[1]], 3)[1]
+
+    casos.append(('csr_alternativas_3', rotas_alternativas, pares, None))
+
+    cliente = app.app.test_client()
+    lat, lng = app.snapshot.no_lat, app.snapshot.no_lng
+
+    def ponto(no):
+        # Pequeno deslocamento do nó: o ajuste ao grafo também entra na medida
+        i = indice_nos[no]
+        return float(lat[i]) + rng.uniform(-2e-4, 2e-4), float(lng[i]) + rng.uniform(-2e-4, 2e-4)
+
+    corpos = []
+    for origem, destino in pares:
+        (olat, olng), (dlat, dlng) = ponto(origem), ponto(destino)
+        corpos.append({'origem_lat': olat, 'origem_lng': olng, 'destino_lat': dlat, 'destino_lng': dlng})
+
+    def calcular_rota(corpo):
+        resposta = cliente.post('/api/calcular_rota', json=corpo).get_json()
+        return resposta.get('nos_assentados')
+
+    url = '/api/calcular_rota'
+    casos.append(('api_calcular_rota', calcular_rota, corpos, url))
+    casos.append(('api_calcular_rota_aresta', calcular_rota, [dict(c, ajuste='aresta') for c in corpos], url))
+    casos.append(('api_calcular_rota_alternativas', calcular_rota, [dict(c, alternativas=3) for c in corpos], url))
+    casos.append(('api_calcular_rota_polyline', calcular_rota, [dict(c, formato='polyline') for c in corpos], url))
+    casos.append(('api_calcular_rota_polyline_z14', calcular_rota,
+                  [dict(c, formato='polyline', zoom=14) for c in corpos], url))
+
+    pontos = [[c['origem_lat'], c['origem_lng']] for c in corpos]
+    matrizes = [{'origens': pontos[i:i + 10]} for i in range(0, len(pontos) - 9, 10)]
+
+    def matriz(corpo):
+        return cliente.post('/api/matriz', json=corpo).get_json().get('nos_assentados')
+
+    if matrizes:
+        casos.append(('api_matriz_10x10', matriz, matrizes, None))
+
+    def isocrona(corpo):
+        return cliente.post('/api/isocronas', json=corpo).get_json().get('nos_assentados')
+
+    casos.append(('api_isocrona_15min', isocrona,
+                  [{'lat': c['origem_lat'], 'lng': c['origem_lng'], 'limites': [900]} for c in corpos[:20]], None))
+    return casos
+
+
+def ambiente():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def comparar(atual, base, tolerancia):
+    """Imprime a variação de p50/p99 por caso; retorna o número de regressões"""
+    anteriores = {(c['grafo'], c['caso']): c for c in base['casos']}
+    regressoes = 0
+    print(f"\nComparação com {base['ambiente'].get('commit')} ({base['data']}), tolerância {tolerancia:.0%}")
+    for caso in atual['casos']:
+        anterior = anteriores.get((caso['grafo'], caso['caso']))
+        rotulo = f"{caso['grafo']:<18} {caso['caso']:<30}"
+        if anterior is None:
+            print(f"{rotulo} (novo)")
+            continue
+        if anterior['assinatura_consultas'] != caso['assinatura_consultas']:
+            print(f"{rotulo} consultas diferentes da base, sem comparação")
+            continue
+        variacao_p50 = caso['p50_ms'] / anterior['p50_ms'] - 1 if anterior['p50_ms'] else 0.0
+        variacao_p99 = caso['p99_ms'] / anterior['p99_ms'] - 1 if anterior['p99_ms'] else 0.0
+        # Diferenças abaixo de 0,05 ms são ruído de medição
+        piorou = variacao_p50 > tolerancia and caso['p50_ms'] - anterior['p50_ms'] > 0.05
+        regressoes += piorou
+        print(f"{rotulo} p50 {variacao_p50:+7.1%} | p99 {variacao_p99:+7.1%}{'  <- REGRESSÃO' if piorou else ''}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lados', type=int, nargs='*', default=[30, 60, 120], help='lados das grades sintéticas')
+    parser.add_argument('--snapshot', default=app.SNAPSHOT_DIR, help='snapshot real (ignorado se não existir)')
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--semente', type=int, default=7)
+    parser.add_argument('--rodadas', type=int, default=3, help='repetições de cada caso (vale a melhor)')
+    parser.add_argument('--ch', action='store_true', help='constrói (uma vez) e mede a hierarquia de contração')
+    parser.add_argument('--max-nos-networkx', type=int, default=5000)
+    parser.add_argument('--dados', default=os.path.join(AQUI, 'dados'))
+    parser.add_argument('--saida', default=os.path.join(AQUI, 'resultados'))
+    parser.add_argument('--comparar', help='arquivo de resultados usado como base')
+    parser.add_argument('--tolerancia', type=float, default=0.15)
+    args = parser.parse_args()
+
+    grafos = [(f'grade_{lado}', preparar_grade(lado, args.semente, args.dados)) for lado in args.lados]
+    if os.path.exists(os.path.join(args.snapshot, snapshot_grafo.ARQUIVO_MANIFESTO)):
+        grafos.append(('snapshot', args.snapshot))
+    else:
+        print(f"Sem snapshot real em {args.snapshot}: só grades sintéticas")
+
+    resultado = {
+        'versao': VERSAO_RESULTADOS,
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'ambiente': ambiente(),
+        'parametros': {'consultas': args.consultas, 'semente': args.semente, 'lados': args.lados,
+                       'rodadas': args.rodadas},
+        'casos': [],
+    }
+    print(f"{'grafo':<18} {'caso':<30} {'p50 ms':>9} {'p99 ms':>9} {'cons/s':>9} {'assentados':>11} {'pico KB':>9} "
+          f"{'bytes':>8} {'gzip':>8}")
+    for nome, diretorio in grafos:
+        motor = carregar_no_app(diretorio, args.ch)
+        pares = consultas_fixas(args.consultas, args.semente)
+        chave = assinatura(pares, app.snapshot.manifesto.get('checksum'))
+        cliente = app.app.test_client()
+        for caso, funcao, entradas, url in casos_do_grafo(motor, pares, args.max_nos_networkx,
+                                                          random.Random(args.semente)):
+            metricas = medir(funcao, entradas, args.rodadas)
+            metricas['bytes_resposta_medio'], metricas['bytes_gzip_medio'] = (
+                tamanho_respostas(cliente, url, entradas) if url else (None, None))
+            metricas.update({'grafo': nome, 'caso': caso, 'nos': int(app.snapshot.num_nos),
+                             'arestas': int(app.snapshot.num_arestas), 'assinatura_consultas': chave})
+            resultado['casos'].append(metricas)
+            assentados = metricas['nos_assentados_medio']
+            tamanhos = [metricas['bytes_resposta_medio'], metricas['bytes_gzip_medio']]
+            print(f"{nome:<18} {caso:<30} {metricas['p50_ms']:9.3f} {metricas['p99_ms']:9.3f} "
+                  f"{metricas['vazao_qps']:9.1f} {'-' if assentados is None else f'{assentados:.0f}':>11} "
+                  f"{metricas['pico_memoria_kb']:9.1f} "
+                  + ' '.join('       -' if t is None else f'{t:8.0f}' for t in tamanhos))
+
+    os.makedirs(args.saida, exist_ok=True)
+    arquivo = os.path.join(args.saida, f"{resultado['data'].replace(':', '')}_{resultado['ambiente']['commit']}.json")
+    with open(arquivo, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=1, ensure_ascii=False)
+    print(f"\nResultados em {arquivo}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        if comparar(resultado, base, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Cache de geocodificação em duas camadas (memória e disco).
+
+Cada resposta do Nominatim vira um dict simples {'nome', 'lat', 'lng'} (ou
+None quando nada foi encontrado) guardado numa LRU em memória e num arquivo
+JSON em disco, nomeado pelo SHA1 da chave. As entradas expiram após o TTL e
+as duas camadas têm tamanho limitado. Buscas reversas usam coordenadas
+arredondadas na chave, então cliques vizinhos reaproveitam o mesmo endereço.
+Um acerto não passa pelo RateLimiter.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger('rota')
+
+TTL_PADRAO = 30 * 24 * 3600
+# Respostas vazias expiram antes: o endereço pode passar a existir no OSM
+TTL_NEGATIVO = 24 * 3600
+# 4 casas decimais ~ 11 m
+CASAS_REVERSO = 4
+
+
+def chave_busca(consulta):
+    return 'busca:' + ' '.join(consulta.lower().split())
+
+
+def chave_reversa(lat, lng, casas=CASAS_REVERSO):
+    return f'reverso:{round(lat, casas):.{casas}f},{round(lng, casas):.{casas}f}'
+
+
+class CacheGeocodificacao:
+    """LRU em memória com TTL, respaldada por arquivos JSON em `diretorio`"""
+
+    def __init__(self, diretorio, ttl=TTL_PADRAO, ttl_negativo=TTL_NEGATIVO,
+                 max_memoria=4096, max_disco=50000):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria = OrderedDict()
+        self._trava = threading.Lock()
+        self._arquivos_disco = None
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+
+    def _arquivo(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha1(chave.encode('utf-8')).hexdigest() + '.json')
+
+    def _valida(self, criado, valor):
+        return time.time() - criado < (self.ttl if valor is not None else self.ttl_negativo)
+
+    def _lembrar(self, chave, criado, valor):
+        self._memoria[chave] = (criado, valor)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def obter(self, chave):
+        """(True, valor) num acerto válido; (False, None) caso contrário"""
+        with self._trava:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                if self._valida(*entrada):
+                    self._memoria.move_to_end(chave)
+                    self.acertos_memoria += 1
+                    return True, entrada[1]
+                del self._memoria[chave]
+
+        arquivo = self._arquivo(chave)
+        try:
+            with open(arquivo, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            dados = None
+        if dados is not None and dados.get('chave') == chave and self._valida(dados['criado'], dados['valor']):
+            with self._trava:
+                self._lembrar(chave, dados['criado'], dados['valor'])
+                self.acertos_disco += 1
+            return True, dados['valor']
+        if dados is not None:
+            # Expirada: remove para não ocupar o limite do disco
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
+        with self._trava:
+            self.falhas += 1
+        return False, None
+
+    def guardar(self, chave, valor):
+        criado = time.time()
+        with self._trava:
+            self._lembrar(chave, criado, valor)
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            arquivo = self._arquivo(chave)
+            temporario = f'{arquivo}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump({'chave': chave, 'criado': criado, 'valor': valor}, f, ensure_ascii=False)
+            os.replace(temporario, arquivo)
+            self._limitar_disco()
+        except OSError as e:
+            log.warning(f"⚠️ Falha ao gravar cache de geocodificação: {e}")
+
+    def _limitar_disco(self):
+        # Contagem feita uma vez e mantida aproximada; a varredura só ocorre ao estourar o limite
+        with self._trava:
+            if self._arquivos_disco is None:
+                self._arquivos_disco = sum(1 for nome in os.listdir(self.diretorio) if nome.endswith('.json'))
+            else:
+                self._arquivos_disco += 1
+            if self._arquivos_disco <= self.max_disco:
+                return
+            arquivos = []
+            for entrada in os.scandir(self.diretorio):
+                if entrada.name.endswith('.json'):
+                    try:
+                        arquivos.append((entrada.stat().st_mtime, entrada.path))
+                    except OSError:
+                        pass
+            caminhos = [caminho for _, caminho in sorted(arquivos)]
+            # Remove os mais antigos até 90% do limite
+            excesso = len(caminhos) - int(self.max_disco * 0.9)
+            for caminho in caminhos[:max(excesso, 0)]:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+            self._arquivos_disco = len(caminhos) - max(excesso, 0)
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                'entradas_memoria': len(self._memoria),
+                'arquivos_disco': self._arquivos_disco,
+                'acertos_memoria': self.acertos_memoria,
+                'acertos_disco': self.acertos_disco,
+                'falhas': self.falhas,
+            }
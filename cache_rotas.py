@@ -0,0 +1,122 @@
+"""
+Cache LRU de rotas calculadas.
+
+As entradas são chaveadas por (nó de origem, nó de destino, modo, cenário de
+pesos, algoritmo, versão dos pesos): cliques em coordenadas diferentes que
+caem nos mesmos nós reaproveitam a mesma rota. O algoritmo entra na chave
+porque o resultado guarda os nós assentados e o algoritmo da busca. O cache é limitado tanto em número de
+entradas quanto em memória estimada (a polilinha domina o tamanho). Uma troca
+geral de pesos chama `nova_versao()`, que descarta tudo. O trânsito ao vivo
+chama `invalidar_arestas()`, que descarta só as rotas que passam pelas arestas
+alteradas (pesos que subiram); para isso cada entrada guarda as arestas do
+snapshot que percorre. Pesos que desceram descartam todas as rotas do modo.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Custo fixo estimado por entrada (dict, chave, números), além dos arrays
+BYTES_POR_ENTRADA = 512
+
+
+def tamanho_resultado(resultado):
+    """Memória estimada (bytes) de um resultado de rota com polilinha (e níveis dos pontos) em numpy"""
+    return BYTES_POR_ENTRADA + sum(valor.nbytes for valor in resultado.values() if isinstance(valor, np.ndarray))
+
+
+class CacheRotas:
+    """LRU thread-safe com limite de entradas e de bytes e contadores de uso"""
+
+    def __init__(self, max_entradas=2048, max_bytes=64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.versao = 0
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.invalidacoes = 0
+        # Muda a cada invalidação parcial: rota calculada antes dela não entra (ver marca())
+        self._geracao = 0
+
+    def chave(self, origem_no, destino_no, modo, cenario=None, algoritmo=None):
+        return (origem_no, destino_no, modo, cenario, algoritmo, self.versao)
+
+    def obter(self, chave):
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[0]
+
+    def marca(self):
+        """Tomada antes de calcular a rota e passada a guardar()"""
+        return self._geracao
+
+    def guardar(self, chave, resultado, arestas=None, marca=None):
+        """`arestas`: arestas do snapshot percorridas, para a invalidação parcial"""
+        if arestas is not None:
+            arestas = np.asarray(arestas, dtype=np.int32)
+        tamanho = tamanho_resultado(resultado) + (arestas.nbytes if arestas is not None else 0)
+        with self._trava:
+            # Resultado calculado com pesos que já mudaram: não entra
+            if chave[-1] != self.versao or tamanho > self.max_bytes:
+                return
+            if marca is not None and marca != self._geracao:
+                return
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._entradas[chave] = (resultado, tamanho, arestas)
+            self._bytes += tamanho
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                _, (_, tamanho_antigo, _) = self._entradas.popitem(last=False)
+                self._bytes -= tamanho_antigo
+                self.despejos += 1
+
+    def invalidar_arestas(self, mascaras):
+        """
+        Descarta as rotas que passam por arestas alteradas. `mascaras`: {modo:
+        array booleano por aresta do snapshot, ou None para descartar todas as
+        rotas do modo}. Devolve quantas saíram.
+        """
+        with self._trava:
+            self._geracao += 1
+            removidas = [chave for chave, (_, _, arestas) in self._entradas.items()
+                         if chave[2] in mascaras and (arestas is None or mascaras[chave[2]] is None
+                                                      or mascaras[chave[2]][arestas].any())]
+            for chave in removidas:
+                self._bytes -= self._entradas.pop(chave)[1]
+            self.invalidacoes += len(removidas)
+            return len(removidas)
+
+    def nova_versao(self):
+        """Pesos alterados: nova versão e descarte de todas as entradas"""
+        with self._trava:
+            self.versao += 1
+            self.invalidacoes += len(self._entradas)
+            self._entradas.clear()
+            self._bytes = 0
+            return self.versao
+
+    def estatisticas(self):
+        with self._trava:
+            consultas = self.acertos + self.falhas
+            return {
+                'versao_pesos': self.versao,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'despejos': self.despejos,
+                'invalidacoes': self.invalidacoes,
+                'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+            }
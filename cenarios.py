@@ -0,0 +1,184 @@
+"""
+Cenários de pesos das arestas, lado a lado sobre o mesmo grafo.
+
+Um cenário é uma coluna NumPy de comprimentos (metros), alinhada ao índice de
+arestas do snapshot, mais fatores opcionais de tempo de viagem por modo
+(trânsito em horários de pico). As colunas são geradas de forma vetorizada a
+partir de `comprimento_original` e de uma semente; nada é escrito no grafo.
+
+Cada cenário tem suas visões por modo (`VisaoModo.com_pesos`). Elas
+compartilham máscaras, índices e a topologia CSR das visões base e só trocam
+a coluna de pesos. O cenário ativo é um índice em memória compartilhada:
+criado antes do fork, vale para todos os workers do gunicorn, e a troca é uma
+única escrita, atômica para os pedidos. O trânsito ao vivo (trafego.py) é
+aplicado por cima de todos os cenários montados.
+"""
+import multiprocessing
+import threading
+
+import numpy as np
+
+# Cenário das visões base (pesos gravados no snapshot)
+CENARIO_BASE = 'randomizado'
+
+# Variação dos comprimentos nos cenários randomizados (±20%)
+AMPLITUDE_RANDOMICA = 0.2
+
+# Multiplicador do tempo de viagem de carro por tipo de via em cada faixa de
+# horário; tipos ausentes usam 'padrao'. A pé e de bicicleta não mudam.
+FAIXAS_HORARIO = {
+    'pico_manha': {
+        'descricao': 'Pico da manhã (7h-9h)',
+        'fatores': {'motorway': 1.6, 'motorway_link': 1.8, 'trunk': 1.8, 'trunk_link': 1.9, 'primary': 1.9,
+                    'primary_link': 1.8, 'secondary': 1.6, 'secondary_link': 1.5, 'tertiary': 1.4, 'padrao': 1.15},
+    },
+    'entre_picos': {
+        'descricao': 'Entre picos (10h-16h)',
+        'fatores': {'trunk': 1.2, 'primary': 1.25, 'secondary': 1.15, 'tertiary': 1.1, 'padrao': 1.0},
+    },
+    'pico_tarde': {
+        'descricao': 'Pico da tarde (17h-19h)',
+        'fatores': {'motorway': 1.7, 'motorway_link': 1.9, 'trunk': 2.0, 'trunk_link': 2.0, 'primary': 2.1,
+                    'primary_link': 1.9, 'secondary': 1.7, 'secondary_link': 1.6, 'tertiary': 1.5, 'padrao': 1.2},
+    },
+}
+MODOS_COM_TRANSITO = ('driving',)
+
+
+def fatores_randomicos(num_arestas, semente, amplitude=AMPLITUDE_RANDOMICA):
+    """Fatores uniformes em [1 - amplitude, 1 + amplitude), um por aresta, reproduzíveis pela semente"""
+    return np.random.default_rng(semente).uniform(1 - amplitude, 1 + amplitude, num_arestas)
+
+
+def fatores_por_via(snapshot, fatores):
+    """Coluna por aresta com o fator do tipo de via (highway) de cada uma"""
+    vocabulario = [str(tipo) for tipo in np.asarray(snapshot.vocabulario_highway).tolist()]
+    por_tipo = np.array([float(fatores.get(tipo, fatores['padrao'])) for tipo in vocabulario], dtype=np.float64)
+    return por_tipo[np.asarray(snapshot.highway)]
+
+
+class Cenario:
+    """Comprimentos (m) por aresta e fatores de tempo por modo ({modo: coluna})"""
+
+    def __init__(self, nome, descricao, comprimentos, fatores_tempo=None, semente=None):
+        self.nome = nome
+        self.descricao = descricao
+        self.comprimentos = comprimentos
+        self.fatores_tempo = fatores_tempo or {}
+        self.semente = semente
+
+    def resumo(self):
+        return {
+            'nome': self.nome,
+            'descricao': self.descricao,
+            'semente': self.semente,
+            'modos_com_transito': sorted(self.fatores_tempo),
+        }
+
+
+def cenarios_do_snapshot(snapshot, semente, sementes_extras=()):
+    """
+    Cenários padrão: 'original' (comprimentos do OSM), 'randomizado' (a coluna
+    do snapshot, gerada com `semente`), as faixas de horário sobre ela e um
+    'randomizado_s<n>' por semente extra.
+    """
+    originais = np.asarray(snapshot.comprimento_original)
+    randomizados = np.asarray(snapshot.pesos)
+    cenarios = [
+        Cenario('original', 'Comprimentos originais do OSM', originais),
+        Cenario(CENARIO_BASE, f'Comprimentos com ±{AMPLITUDE_RANDOMICA:.0%} de variação aleatória',
+                randomizados, semente=semente),
+    ]
+    for nome, faixa in FAIXAS_HORARIO.items():
+        fatores = fatores_por_via(snapshot, faixa['fatores'])
+        cenarios.append(Cenario(nome, faixa['descricao'], randomizados,
+                                {modo: fatores for modo in MODOS_COM_TRANSITO}, semente=semente))
+    for extra in sementes_extras:
+        cenarios.append(Cenario(
+            f'randomizado_s{extra}', f'Comprimentos randomizados com a semente {extra}',
+            originais * fatores_randomicos(len(originais), extra), semente=extra))
+    return cenarios
+
+
+class ConjuntoCenarios:
+    """Visões por modo de cada cenário e o cenário ativo, trocado atomicamente"""
+
+    def __init__(self, visoes_base, cenarios, ativo=CENARIO_BASE, preconstruir=True, trafego=None):
+        self.cenarios = {cenario.nome: cenario for cenario in cenarios}
+        self.nomes = list(self.cenarios)
+        if ativo not in self.cenarios:
+            raise ValueError(f"Cenário desconhecido: {ativo}")
+        self.visoes_base = visoes_base
+        self.trafego = trafego
+        self._visoes = {CENARIO_BASE: visoes_base}
+        self._trava = threading.Lock()
+        self._ativo = multiprocessing.RawValue('i', self.nomes.index(ativo))
+        if preconstruir:
+            for nome in self.nomes:
+                self.visoes(nome)
+
+    @property
+    def ativo(self):
+        return self.nomes[self._ativo.value]
+
+    def resolver(self, nome=None):
+        """Nome do cenário de um pedido: o informado ou, se omitido, o ativo; ValueError se desconhecido"""
+        if not nome:
+            return self.ativo
+        if nome not in self.cenarios:
+            raise ValueError(f"Cenário desconhecido: {nome}. Use um de {', '.join(self.nomes)}")
+        return nome
+
+    def ativar(self, nome):
+        """Troca o cenário ativo; as visões são montadas antes da troca"""
+        nome = self.resolver(nome)
+        self.visoes(nome)
+        self._ativo.value = self.nomes.index(nome)
+        return nome
+
+    def visoes(self, nome=None):
+        """{modo: VisaoModo} do cenário (o ativo se omitido), montadas na primeira vez"""
+        nome = self.resolver(nome)
+        visoes = self._visoes.get(nome)
+        if visoes is None:
+            with self._trava:
+                visoes = self._visoes.get(nome)
+                if visoes is None:
+                    visoes = self._visoes[nome] = self._montar(self.cenarios[nome])
+        return visoes
+
+    def sincronizar_trafego(self):
+        """Aplica nas visões montadas o trânsito ainda não visto por este processo; {modo: (arestas, desceu)}"""
+        if self.trafego is None:
+            return {}
+        with self._trava:
+            return self.trafego.sincronizar(self._aplicar_fatores)
+
+    def _aplicar_fatores(self, modo, arestas, fatores):
+        aplicadas = set()
+        for visoes in self._visoes.values():
+            # Visões reaproveitadas da base aparecem em vários cenários: uma vez só
+            if id(visoes[modo]) not in aplicadas:
+                aplicadas.add(id(visoes[modo]))
+                visoes[modo].aplicar_fatores(arestas, fatores)
+
+    def _montar(self, cenario):
+        base = self.cenarios[CENARIO_BASE]
+        visoes = {}
+        for modo, visao in self.visoes_base.items():
+            fator = cenario.fatores_tempo.get(modo)
+            if cenario.comprimentos is base.comprimentos and fator is None:
+                # Mesmos pesos da base neste modo: a visão é a mesma
+                visoes[modo] = visao
+            else:
+                visoes[modo] = visao.com_pesos(cenario.comprimentos, fator)
+                if self.trafego is not None:
+                    # Trânsito já aplicado nas demais visões deste processo
+                    arestas, fatores = self.trafego.alterados(modo)
+                    if len(arestas):
+                        visoes[modo].aplicar_fatores(arestas, fatores)
+        return visoes
+
+    def listar(self):
+        return [dict(self.cenarios[nome].resumo(), ativo=nome == self.ativo, montado=nome in self._visoes)
+                for nome in self.nomes]
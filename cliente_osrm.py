@@ -0,0 +1,181 @@
+"""
+Cliente OSRM com conexões persistentes, cache e disjuntor.
+
+Todas as chamadas compartilham uma requests.Session com pool de conexões
+keep-alive. As rotas encontradas ficam numa LRU chaveada pelo perfil e pelas
+coordenadas arredondadas dos waypoints; respostas sem rota não entram. O
+envio em paralelo fica com o laço de E/S (io_assincrono). O disjuntor (circuit breaker) abre após
+algumas falhas ou respostas lentas seguidas. Enquanto está aberto, as rotas
+vêm do roteador local (função `rota_local`) sem tocar a rede. Passado o
+tempo de espera, um pedido de teste decide se ele volta a fechar.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+MEIO_ABERTO = 'meio_aberto'
+
+# 5 casas decimais ~ 1 m
+CASAS_CACHE = 5
+
+
+class Disjuntor:
+    """Circuit breaker por contagem de falhas consecutivas"""
+
+    def __init__(self, falhas_para_abrir=3, espera=30.0):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.espera = espera
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.aberto_em = 0.0
+        self.aberturas = 0
+        self._trava = threading.Lock()
+
+    def permite(self):
+        """True se o pedido pode ir à rede (fechado, ou o único teste do meio-aberto)"""
+        with self._trava:
+            if self.estado == FECHADO:
+                return True
+            if self.estado == ABERTO and time.monotonic() - self.aberto_em >= self.espera:
+                self.estado = MEIO_ABERTO
+                return True
+            return False
+
+    def sucesso(self):
+        with self._trava:
+            self.estado = FECHADO
+            self.falhas_seguidas = 0
+
+    def falha(self):
+        with self._trava:
+            self.falhas_seguidas += 1
+            if self.estado == MEIO_ABERTO or self.falhas_seguidas >= self.falhas_para_abrir:
+                if self.estado != ABERTO:
+                    self.aberturas += 1
+                self.estado = ABERTO
+                self.aberto_em = time.monotonic()
+
+
+class ClienteOSRM:
+    """Rotas OSRM (/route/v1) com pool de conexões, cache LRU e fallback local"""
+
+    def __init__(self, base_url, rota_local=None, timeout=12.0, limite_lento=3.0,
+                 max_conexoes=16, max_cache=1024, disjuntor=None):
+        self.base_url = base_url.rstrip('/')
+        self.rota_local = rota_local
+        self.timeout = timeout
+        # Respostas mais lentas que isso contam como falha para o disjuntor
+        self.limite_lento = limite_lento
+        self.max_conexoes = max_conexoes
+        self.max_cache = max_cache
+        self.disjuntor = disjuntor or Disjuntor()
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=max_conexoes)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.headers['User-Agent'] = 'RotaMarcio/1.0'
+
+        self._cache = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas_cache = 0
+        self.chamadas_rede = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def chave(profile, waypoints):
+        return (profile,) + tuple((round(lat, CASAS_CACHE), round(lng, CASAS_CACHE)) for lat, lng in waypoints)
+
+    def _do_cache(self, chave):
+        with self._trava:
+            resultado = self._cache.get(chave)
+            if resultado is None:
+                self.falhas_cache += 1
+                return None
+            self._cache.move_to_end(chave)
+            self.acertos += 1
+            return resultado
+
+    def _guardar(self, chave, resultado):
+        with self._trava:
+            self._cache[chave] = resultado
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+
+    def _consultar_rede(self, profile, waypoints):
+        coords = ';'.join(f"{lng},{lat}" for lat, lng in waypoints)
+        url = f"{self.base_url}/route/v1/{profile}/{coords}"
+        inicio = time.monotonic()
+        resp = self.sessao.get(url, params={'overview': 'full', 'geometries': 'geojson', 'steps': 'false'},
+                               timeout=self.timeout)
+        decorrido = time.monotonic() - inicio
+        resp.raise_for_status()
+        data = resp.json()
+        if 'routes' not in data or not data['routes']:
+            # Resposta válida sem rota: não é falha do servidor
+            return {'sucesso': False, 'mensagem': 'OSRM não retornou rotas'}, decorrido
+        r0 = data['routes'][0]
+        return {
+            'sucesso': True,
+            'distance_m': r0.get('distance'),
+            'duration_s': r0.get('duration'),
+            'geometry_geojson': r0.get('geometry'),
+            'fonte': 'osrm'
+        }, decorrido
+
+    def alternativa_local(self, profile, waypoints, motivo):
+        """Rota do roteador local (ou erro com `motivo`) quando o OSRM não serve"""
+        if self.rota_local is None:
+            return {'sucesso': False, 'mensagem': motivo}
+        with self._trava:
+            self.fallbacks += 1
+        resultado = self.rota_local(profile, waypoints)
+        if not resultado.get('sucesso'):
+            resultado.setdefault('mensagem', motivo)
+        return resultado
+
+    def rota(self, profile, waypoints):
+        """Mesmo formato de resposta da API antiga ({'sucesso', 'distance_m', ...}) mais 'fonte'"""
+        waypoints = [(float(lat), float(lng)) for lat, lng in waypoints]
+        chave = self.chave(profile, waypoints)
+        resultado = self._do_cache(chave)
+        if resultado is not None:
+            return resultado
+
+        if not self.disjuntor.permite():
+            return self.alternativa_local(profile, waypoints, 'OSRM indisponível (disjuntor aberto)')
+
+        try:
+            with self._trava:
+                self.chamadas_rede += 1
+            resultado, decorrido = self._consultar_rede(profile, waypoints)
+        except (requests.RequestException, ValueError) as e:
+            self.disjuntor.falha()
+            return self.alternativa_local(profile, waypoints, f'Erro de rede ao chamar OSRM: {e}')
+
+        if decorrido > self.limite_lento:
+            self.disjuntor.falha()
+        else:
+            self.disjuntor.sucesso()
+        if resultado['sucesso']:
+            self._guardar(chave, resultado)
+        return resultado
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                'disjuntor': self.disjuntor.estado,
+                'aberturas_disjuntor': self.disjuntor.aberturas,
+                'entradas_cache': len(self._cache),
+                'acertos_cache': self.acertos,
+                'falhas_cache': self.falhas_cache,
+                'chamadas_rede': self.chamadas_rede,
+                'fallbacks_locais': self.fallbacks,
+            }
@@ -0,0 +1,393 @@
+"""
+Contraction Hierarchies (CH) sobre o grafo CSR de Maricá.
+
+O pré-processamento (offline) contrai os nós um a um, na ordem dada pela
+diferença de arestas, inserindo atalhos sempre que a busca de testemunha não
+encontra um caminho alternativo tão curto quanto o que passa pelo nó
+contraído. O resultado — ordem dos nós e grafo de atalhos — é gravado ao lado
+do snapshot, um por modo de transporte, vinculado ao checksum dos pesos usados.
+
+A consulta é um Dijkstra bidirecional que só sobe na hierarquia (com
+stall-on-demand) e devolve as arestas originais desempacotando os atalhos,
+de modo que a montagem da geometria continua igual à do Dijkstra comum.
+
+    python contracao.py [diretorio_do_snapshot]
+"""
+import hashlib
+import heapq
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import modos
+import snapshot_grafo
+from motor_rotas import BuffersBusca, vista
+
+log = logging.getLogger('rota')
+
+VERSAO_FORMATO = 1
+PREFIXO_SUBDIRETORIO = 'ch_'
+
+# Nós assentados por busca de testemunha; ao atingir o limite o atalho é
+# inserido mesmo sem prova de necessidade (nunca afeta a exatidão)
+LIMITE_TESTEMUNHA = 500
+
+
+def checksum_pesos(pesos):
+    """Identifica a coluna de pesos para a qual a hierarquia foi construída"""
+    return hashlib.sha1(np.ascontiguousarray(pesos, dtype=np.float64).tobytes()).hexdigest()
+
+
+class _Construtor:
+    """Estado mutável da contração (usado apenas no pré-processamento)"""
+
+    def __init__(self, num_nos, origens, destinos, pesos, limite_testemunha):
+        self.num_nos = num_nos
+        self.limite_testemunha = limite_testemunha
+        self.saida = [dict() for _ in range(num_nos)]
+        self.entrada = [dict() for _ in range(num_nos)]
+        self.arco_origem = []
+        self.arco_destino = []
+        self.arco_peso = []
+        self.arco_filho_a = []
+        self.arco_filho_b = []
+        self.arco_aresta = []
+        self.vizinhos_contraidos = [0] * num_nos
+
+        # Um arco por par (u, v): a aresta paralela de menor peso
+        for aresta, (u, v, peso) in enumerate(zip(origens, destinos, pesos)):
+            if u == v:
+                continue
+            existente = self.saida[u].get(v)
+            if existente is None or peso < self.arco_peso[existente]:
+                self._novo_arco(u, v, peso, -1, -1, aresta)
+
+    def _novo_arco(self, u, v, peso, filho_a, filho_b, aresta):
+        arco = len(self.arco_peso)
+        self.arco_origem.append(u)
+        self.arco_destino.append(v)
+        self.arco_peso.append(peso)
+        self.arco_filho_a.append(filho_a)
+        self.arco_filho_b.append(filho_b)
+        self.arco_aresta.append(aresta)
+        self.saida[u][v] = arco
+        self.entrada[v][u] = arco
+        return arco
+
+    def _testemunhas(self, origem, ignorado, limite):
+        """Dijkstra local a partir de `origem` sem passar por `ignorado`"""
+        dist = {origem: 0.0}
+        fila = [(0.0, origem)]
+        assentados = 0
+        saida, arco_peso = self.saida, self.arco_peso
+        while fila and assentados < self.limite_testemunha:
+            d, no = heapq.heappop(fila)
+            if d > dist[no]:
+                continue
+            if d > limite:
+                break
+            assentados += 1
+            for vizinho, arco in saida[no].items():
+                if vizinho == ignorado:
+                    continue
+                nd = d + arco_peso[arco]
+                if nd <= limite and nd < dist.get(vizinho, math.inf):
+                    dist[vizinho] = nd
+                    heapq.heappush(fila, (nd, vizinho))
+        return dist
+
+    def atalhos_necessarios(self, no):
+        """Lista de atalhos (u, w, peso, arco_uv, arco_vw) exigidos ao contrair `no`"""
+        atalhos = []
+        arco_peso = self.arco_peso
+        for u, arco_uv in self.entrada[no].items():
+            peso_uv = arco_peso[arco_uv]
+            alvos = [(w, peso_uv + arco_peso[arco_vw], arco_vw)
+                     for w, arco_vw in self.saida[no].items() if w != u]
+            if not alvos:
+                continue
+            dist = self._testemunhas(u, no, max(custo for _, custo, _ in alvos))
+            for w, custo, arco_vw in alvos:
+                if dist.get(w, math.inf) > custo:
+                    atalhos.append((u, w, custo, arco_uv, arco_vw))
+        return atalhos
+
+    def prioridade(self, no):
+        # Diferença de arestas + vizinhos já contraídos (espalha a contração)
+        grau = len(self.entrada[no]) + len(self.saida[no])
+        return len(self.atalhos_necessarios(no)) - grau + self.vizinhos_contraidos[no]
+
+    def contrair(self, no):
+        """Contrai `no`; retorna (arcos para cima, arcos para baixo) dele"""
+        atalhos = self.atalhos_necessarios(no)
+        subida = list(self.saida[no].values())
+        descida = list(self.entrada[no].values())
+
+        for w in self.saida[no]:
+            del self.entrada[w][no]
+            self.vizinhos_contraidos[w] += 1
+        for u in self.entrada[no]:
+            del self.saida[u][no]
+            self.vizinhos_contraidos[u] += 1
+        self.saida[no] = {}
+        self.entrada[no] = {}
+
+        for u, w, custo, arco_uv, arco_vw in atalhos:
+            existente = self.saida[u].get(w)
+            if existente is None or custo < self.arco_peso[existente]:
+                self._novo_arco(u, w, custo, arco_uv, arco_vw, -1)
+        return subida, descida
+
+
+def construir_hierarquia(num_nos, origens, destinos, pesos, limite_testemunha=LIMITE_TESTEMUNHA):
+    """Pré-processa a hierarquia e devolve o dicionário de arrays a persistir"""
+    inicio = time.time()
+    construtor = _Construtor(num_nos, list(origens), list(destinos), list(pesos), limite_testemunha)
+
+    fila = [(construtor.prioridade(no), no) for no in range(num_nos)]
+    heapq.heapify(fila)
+    rank = np.zeros(num_nos, dtype=np.int32)
+    subida = [None] * num_nos
+    descida = [None] * num_nos
+    contraidos = 0
+
+    # Atualização preguiçosa: recalcula a prioridade do topo antes de contrair
+    while fila:
+        _, no = heapq.heappop(fila)
+        if subida[no] is not None:
+            continue
+        prioridade = construtor.prioridade(no)
+        if fila and prioridade > fila[0][0]:
+            heapq.heappush(fila, (prioridade, no))
+            continue
+        subida[no], descida[no] = construtor.contrair(no)
+        rank[no] = contraidos
+        contraidos += 1
+        if contraidos % 5000 == 0:
+            log.info(f"   {contraidos}/{num_nos} nós contraídos ({time.time() - inicio:.0f}s)")
+
+    def csr(listas):
+        offsets = np.zeros(num_nos + 1, dtype=np.int64)
+        np.cumsum([len(l) for l in listas], out=offsets[1:])
+        arcos = np.fromiter((a for l in listas for a in l), dtype=np.int32, count=int(offsets[-1]))
+        return offsets, arcos
+
+    subida_offsets, subida_arcos = csr(subida)
+    descida_offsets, descida_arcos = csr(descida)
+    atalhos = sum(1 for a in construtor.arco_aresta if a == -1)
+    log.info(f"✅ Hierarquia construída: {atalhos} atalhos ({time.time() - inicio:.1f}s)")
+
+    return {
+        'rank': rank,
+        'subida_offsets': subida_offsets,
+        'subida_arcos': subida_arcos,
+        'descida_offsets': descida_offsets,
+        'descida_arcos': descida_arcos,
+        'arco_origem': np.asarray(construtor.arco_origem, dtype=np.int32),
+        'arco_destino': np.asarray(construtor.arco_destino, dtype=np.int32),
+        'arco_peso': np.asarray(construtor.arco_peso, dtype=np.float64),
+        'arco_filho_a': np.asarray(construtor.arco_filho_a, dtype=np.int32),
+        'arco_filho_b': np.asarray(construtor.arco_filho_b, dtype=np.int32),
+        'arco_aresta': np.asarray(construtor.arco_aresta, dtype=np.int32),
+    }
+
+
+class HierarquiaContracao:
+    """Consultas ponto a ponto sobre a hierarquia pré-processada"""
+
+    def __init__(self, arrays, checksum):
+        self.checksum = checksum
+        self.num_nos = len(arrays['rank'])
+        self.rank = arrays['rank']
+        self.num_arcos = len(arrays['arco_peso'])
+        self.num_atalhos = int(np.count_nonzero(np.asarray(arrays['arco_aresta']) == -1))
+
+        # memoryviews sobre os arrays (mapeados do disco ao carregar): nada é copiado por worker
+        self._subida_offsets = vista(arrays['subida_offsets'])
+        self._subida_arcos = vista(arrays['subida_arcos'])
+        self._descida_offsets = vista(arrays['descida_offsets'])
+        self._descida_arcos = vista(arrays['descida_arcos'])
+        self._arco_origem = vista(arrays['arco_origem'])
+        self._arco_destino = vista(arrays['arco_destino'])
+        self._arco_peso = vista(arrays['arco_peso'])
+        self._arco_filho_a = vista(arrays['arco_filho_a'])
+        self._arco_filho_b = vista(arrays['arco_filho_b'])
+        self._arco_aresta = vista(arrays['arco_aresta'])
+
+        self._local = threading.local()
+
+    def _buffers(self):
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = (BuffersBusca(self.num_nos), BuffersBusca(self.num_nos))
+        return buffers
+
+    def desempacotar(self, arco, saida):
+        """Expande um arco (possivelmente atalho) nas arestas originais do CSR"""
+        pilha = [arco]
+        filho_a, filho_b, aresta = self._arco_filho_a, self._arco_filho_b, self._arco_aresta
+        while pilha:
+            atual = pilha.pop()
+            if aresta[atual] >= 0:
+                saida.append(aresta[atual])
+            else:
+                pilha.append(filho_b[atual])
+                pilha.append(filho_a[atual])
+
+    def consultar(self, origem, destino):
+        """
+        Caminho mínimo entre índices de nós.
+        Retorna (arestas originais, distância, nós assentados); arestas None se não houver caminho.
+        """
+        if origem == destino:
+            return [], 0.0, 1
+
+        frente, tras = self._buffers()
+        geracao_f, geracao_r = frente.nova_geracao(), tras.nova_geracao()
+        dist_f, pai_f, ger_f = frente.dist, frente.pai_aresta, frente.geracao
+        dist_r, pai_r, ger_r = tras.dist, tras.pai_aresta, tras.geracao
+        subida_offsets, subida_arcos = self._subida_offsets, self._subida_arcos
+        descida_offsets, descida_arcos = self._descida_offsets, self._descida_arcos
+        arco_origem, arco_destino, arco_peso = self._arco_origem, self._arco_destino, self._arco_peso
+
+        dist_f[origem], pai_f[origem], ger_f[origem] = 0.0, -1, geracao_f
+        dist_r[destino], pai_r[destino], ger_r[destino] = 0.0, -1, geracao_r
+        fila_f = [(0.0, origem)]
+        fila_r = [(0.0, destino)]
+        melhor = math.inf
+        encontro = -1
+        assentados = 0
+
+        while fila_f or fila_r:
+            # Cada direção para quando seu topo já não pode melhorar o melhor caminho
+            if fila_f and fila_f[0][0] >= melhor:
+                fila_f = []
+            if fila_r and fila_r[0][0] >= melhor:
+                fila_r = []
+            if not fila_f and not fila_r:
+                break
+
+            if fila_f and (not fila_r or fila_f[0][0] <= fila_r[0][0]):
+                distancia_atual, no = heapq.heappop(fila_f)
+                if distancia_atual > dist_f[no]:
+                    continue
+                assentados += 1
+                if ger_r[no] == geracao_r and distancia_atual + dist_r[no] < melhor:
+                    melhor = distancia_atual + dist_r[no]
+                    encontro = no
+                # Stall-on-demand: algum vizinho mais alto já chega aqui mais barato
+                parado = False
+                for i in range(descida_offsets[no], descida_offsets[no + 1]):
+                    arco = descida_arcos[i]
+                    acima = arco_origem[arco]
+                    if ger_f[acima] == geracao_f and dist_f[acima] + arco_peso[arco] < distancia_atual:
+                        parado = True
+                        break
+                if parado:
+                    continue
+                for i in range(subida_offsets[no], subida_offsets[no + 1]):
+                    arco = subida_arcos[i]
+                    vizinho = arco_destino[arco]
+                    distancia = distancia_atual + arco_peso[arco]
+                    if ger_f[vizinho] != geracao_f or distancia < dist_f[vizinho]:
+                        ger_f[vizinho] = geracao_f
+                        dist_f[vizinho] = distancia
+                        pai_f[vizinho] = arco
+                        heapq.heappush(fila_f, (distancia, vizinho))
+            else:
+                distancia_atual, no = heapq.heappop(fila_r)
+                if distancia_atual > dist_r[no]:
+                    continue
+                assentados += 1
+                if ger_f[no] == geracao_f and distancia_atual + dist_f[no] < melhor:
+                    melhor = distancia_atual + dist_f[no]
+                    encontro = no
+                parado = False
+                for i in range(subida_offsets[no], subida_offsets[no + 1]):
+                    arco = subida_arcos[i]
+                    acima = arco_destino[arco]
+                    if ger_r[acima] == geracao_r and dist_r[acima] + arco_peso[arco] < distancia_atual:
+                        parado = True
+                        break
+                if parado:
+                    continue
+                for i in range(descida_offsets[no], descida_offsets[no + 1]):
+                    arco = descida_arcos[i]
+                    vizinho = arco_origem[arco]
+                    distancia = distancia_atual + arco_peso[arco]
+                    if ger_r[vizinho] != geracao_r or distancia < dist_r[vizinho]:
+                        ger_r[vizinho] = geracao_r
+                        dist_r[vizinho] = distancia
+                        pai_r[vizinho] = arco
+                        heapq.heappush(fila_r, (distancia, vizinho))
+
+        if encontro == -1:
+            return None, 0.0, assentados
+
+        arcos = []
+        arco = pai_f[encontro]
+        while arco != -1:
+            arcos.append(arco)
+            arco = pai_f[arco_origem[arco]]
+        arcos.reverse()
+        arco = pai_r[encontro]
+        while arco != -1:
+            arcos.append(arco)
+            arco = pai_r[arco_destino[arco]]
+
+        arestas = []
+        for arco in arcos:
+            self.desempacotar(arco, arestas)
+        return arestas, melhor, assentados
+
+
+def salvar_hierarquia(arrays, diretorio_snapshot, modo, checksum):
+    diretorio = os.path.join(diretorio_snapshot, PREFIXO_SUBDIRETORIO + modo)
+    snapshot_grafo.gravar_arrays(diretorio, arrays, VERSAO_FORMATO, {'checksum_pesos': checksum}, {
+        'num_arcos': int(len(arrays['arco_peso'])),
+    })
+    log.info(f"💾 Hierarquia gravada em {diretorio}")
+
+
+def carregar_hierarquia(diretorio_snapshot, modo, checksum):
+    """Carrega a hierarquia do modo construída para a coluna de pesos `checksum` (ou None)"""
+    lido = snapshot_grafo.ler_arrays(os.path.join(diretorio_snapshot, PREFIXO_SUBDIRETORIO + modo), VERSAO_FORMATO,
+                                     {'checksum_pesos': checksum}, rotulo='hierarquia de contração')
+    if lido is None:
+        return None
+    arrays, _ = lido
+    return HierarquiaContracao(arrays, checksum)
+
+
+def construir_para_motor(motor, diretorio_snapshot, modo):
+    """Constrói e grava a hierarquia para os pesos de um motor de rotas"""
+    checksum = checksum_pesos(motor.pesos)
+    log.info(f"🏗️ Construindo hierarquia de contração '{modo}' ({motor.num_nos} nós)...")
+    arrays = construir_hierarquia(motor.num_nos, motor.origens.tolist(),
+                                  motor.destinos.tolist(), motor.pesos.tolist())
+    salvar_hierarquia(arrays, diretorio_snapshot, modo, checksum)
+    return HierarquiaContracao(arrays, checksum)
+
+
+def construir_para_snapshot(diretorio_snapshot):
+    """Etapa de build: constrói e grava a hierarquia de cada modo para o snapshot em disco"""
+    snapshot = snapshot_grafo.carregar_snapshot(diretorio_snapshot)
+    if snapshot is None:
+        log.error(f"❌ Snapshot inválido ou ausente em {diretorio_snapshot}")
+        return None
+    return {modo: construir_para_motor(visao.motor, diretorio_snapshot, modo)
+            for modo, visao in modos.construir_visoes(snapshot).items()}
+
+
+if __name__ == '__main__':
+    import metricas
+    metricas.configurar_logging()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    diretorio = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(
+        'ROTA_SNAPSHOT_DIR', os.path.join(base_dir, 'dados', 'grafo_marica'))
+    sys.exit(0 if construir_para_snapshot(diretorio) is not None else 1)
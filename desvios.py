@@ -0,0 +1,137 @@
+"""
+Avaliação local de desvios para incluir uma parada numa rota com várias paradas.
+
+Em vez de recalcular a rota inteira para cada candidato, cada parada da rota
+base faz uma busca para frente (até as demais paradas e todos os candidatos)
+e uma busca reversa (de todos os candidatos até ela). Com essas árvores, o
+custo de inserir o candidato c entre as paradas a e b é
+
+    d(a, c) + d(c, b) - d(a, b)
+
+calculado de uma vez para todos os candidatos com numpy. No modo de otimizar
+a ordem, as paradas intermediárias são permutadas por força bruta, o que é
+viável dentro do limite de 7 pontos; o candidato entra no melhor trecho de
+cada permutação ou, com posicao='final', sempre antes do destino.
+"""
+import itertools
+
+import numpy as np
+
+# Origem + 5 paradas + destino, como no endpoint OSRM
+MAX_PONTOS = 7
+
+POSICOES = ('final', 'melhor')
+
+
+class AvaliadorDesvios:
+    """Custos de inserção de candidatos numa rota base sobre a visão de um modo"""
+
+    def __init__(self, visao, geometria, paradas, candidatos):
+        """`paradas` e `candidatos` são índices de nós no grafo"""
+        self.visao = visao
+        self.motor = visao.motor
+        self.geometria = geometria
+        self.paradas = [int(p) for p in paradas]
+        self.candidatos = [int(c) for c in candidatos]
+        k, n = len(self.paradas), len(self.candidatos)
+
+        # dur_*/dist_*: segundos e metros; inf quando não há caminho
+        self.dur_paradas = np.full((k, k), np.inf)
+        self.dist_paradas = np.full((k, k), np.inf)
+        self.dur_ida = np.full((k, n), np.inf)      # parada -> candidato
+        self.dist_ida = np.full((k, n), np.inf)
+        self.dur_volta = np.full((n, k), np.inf)    # candidato -> parada
+        self.dist_volta = np.full((n, k), np.inf)
+        self._arcos_paradas = {}
+        self._arcos_ida = {}
+        self._arcos_volta = {}
+        self.nos_assentados = 0
+
+        alvos = self.paradas + self.candidatos
+        for i, parada in enumerate(self.paradas[:-1]):
+            custos, arcos, assentados = self.motor.um_para_muitos(parada, alvos)
+            self.nos_assentados += assentados
+            for j, (custo, caminho) in enumerate(zip(custos, arcos)):
+                if caminho is None:
+                    continue
+                distancia = visao.distancia(caminho)
+                if j < k:
+                    self.dur_paradas[i, j], self.dist_paradas[i, j] = custo, distancia
+                    self._arcos_paradas[i, j] = caminho
+                else:
+                    self.dur_ida[i, j - k], self.dist_ida[i, j - k] = custo, distancia
+                    self._arcos_ida[i, j - k] = caminho
+
+        for j, parada in enumerate(self.paradas[1:], start=1):
+            custos, arcos, assentados = self.motor.muitos_para_um(parada, self.candidatos)
+            self.nos_assentados += assentados
+            for c, (custo, caminho) in enumerate(zip(custos, arcos)):
+                if caminho is not None:
+                    self.dur_volta[c, j], self.dist_volta[c, j] = custo, visao.distancia(caminho)
+                    self._arcos_volta[c, j] = caminho
+
+        base = list(range(k))
+        self.duracao_base = self._custo_sequencia(self.dur_paradas, base)
+        self.distancia_base = self._custo_sequencia(self.dist_paradas, base)
+
+    @staticmethod
+    def _custo_sequencia(matriz, sequencia):
+        return float(sum(matriz[a, b] for a, b in zip(sequencia[:-1], sequencia[1:])))
+
+    def avaliar(self, posicao='final', otimizar_ordem=False):
+        """
+        Melhor inserção de cada candidato. posicao='final' põe o candidato
+        logo antes do destino, também com otimizar_ordem (que então só
+        reordena as paradas intermediárias). Retorna dict com arrays (um valor
+        por candidato): delta_duracao, delta_distancia e a ordem resultante
+        das paradas (índices em paradas; o candidato é len(paradas)).
+        """
+        k, n = len(self.paradas), len(self.candidatos)
+        melhor_dur = np.full(n, np.inf)
+        melhor_dist = np.full(n, np.inf)
+        melhor_plano = [None] * n
+
+        if otimizar_ordem:
+            sequencias = [[0, *perm, k - 1] for perm in itertools.permutations(range(1, k - 1))]
+        else:
+            sequencias = [list(range(k))]
+
+        for sequencia in sequencias:
+            dur_seq = self._custo_sequencia(self.dur_paradas, sequencia)
+            dist_seq = self._custo_sequencia(self.dist_paradas, sequencia)
+            trechos = range(len(sequencia) - 1)
+            if posicao == 'final':
+                trechos = [len(sequencia) - 2]
+            for t in trechos:
+                a, b = sequencia[t], sequencia[t + 1]
+                # Vetorizado sobre todos os candidatos
+                dur = dur_seq - self.dur_paradas[a, b] + self.dur_ida[a] + self.dur_volta[:, b]
+                melhora = dur < melhor_dur
+                if not melhora.any():
+                    continue
+                dist = dist_seq - self.dist_paradas[a, b] + self.dist_ida[a] + self.dist_volta[:, b]
+                melhor_dur[melhora] = dur[melhora]
+                melhor_dist[melhora] = dist[melhora]
+                plano = sequencia[:t + 1] + [k] + sequencia[t + 1:]
+                for c in np.flatnonzero(melhora).tolist():
+                    melhor_plano[c] = plano
+
+        return {
+            'delta_duracao': melhor_dur - self.duracao_base,
+            'delta_distancia': melhor_dist - self.distancia_base,
+            'ordens': melhor_plano,
+        }
+
+    def geometria_plano(self, candidato, ordem):
+        """Polilinha (lat, lng) da rota com o candidato, seguindo `ordem`"""
+        k = len(self.paradas)
+        arcos = []
+        for a, b in zip(ordem[:-1], ordem[1:]):
+            if b == k:
+                arcos += self._arcos_ida[a, candidato]
+            elif a == k:
+                arcos += self._arcos_volta[candidato, b]
+            else:
+                arcos += self._arcos_paradas[a, b]
+        motor = self.motor
+        return self.geometria.montar(motor.arestas_base[arcos], self.paradas[ordem[0]], motor.invertidas[arcos])
@@ -0,0 +1,212 @@
+"""
+Geometria das arestas achatada em arrays para montagem de polilinhas.
+
+Todas as coordenadas de todas as arestas ficam num único array (K, 2) já em
+ordem (lat, lng), com offsets por aresta. Montar a polilinha de uma rota é só
+reunir as fatias das arestas do caminho (invertidas quando a aresta é
+percorrida no sentido contrário), descartando o primeiro ponto de cada aresta
+seguinte (igual ao último da anterior).
+
+Cada ponto guarda também o seu nível de simplificação: a maior tolerância
+(m) de Douglas-Peucker, dentro da própria aresta, com que ele ainda fica. As
+pontas das arestas ficam sempre (nível inf). Simplificar uma rota para uma
+tolerância é então filtrar os pontos pelo nível e passar Douglas-Peucker (do
+GEOS) só sobre o que sobra, em geral poucos pontos além dos nós. A tolerância pode
+vir do zoom do mapa (um pixel na latitude da rota).
+
+Polilinhas podem ser devolvidas no formato codificado do Google (encoded
+polyline), bem menor que a lista de pares em JSON.
+"""
+import math
+
+import numpy as np
+import shapely
+
+# Pontos consecutivos mais próximos que isso (em graus) são considerados duplicados
+TOLERANCIA_DUPLICADO = 1e-6
+
+# Raio médio da Terra (m), usado nas projeções locais de todos os módulos
+RAIO_TERRA = 6371008.8
+
+# Metros por pixel no equador no zoom 0 (tiles de 256 px, Web Mercator)
+METROS_PIXEL_ZOOM_0 = 2 * math.pi * RAIO_TERRA / 256
+
+# Tolerância da simplificação pelo zoom, em pixels
+PIXELS_TOLERANCIA = 1.0
+
+ZOOM_MAXIMO = 22
+
+# Casas decimais das coordenadas no formato codificado ('polyline' e 'polyline6', como no OSRM)
+PRECISOES_POLILINHA = {'polyline': 5, 'polyline6': 6}
+
+
+def sequencia(tamanhos):
+    """Posição de cada elemento dentro do seu grupo: [2, 3] -> [0, 1, 0, 1, 2]"""
+    return np.arange(tamanhos.sum()) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+
+
+def _metros(coords, lat_referencia):
+    """(lat, lng) -> (x, y) em metros numa projeção equiretangular local"""
+    escala = RAIO_TERRA * math.pi / 180
+    return coords[:, 1] * escala * math.cos(math.radians(lat_referencia)), coords[:, 0] * escala
+
+
+def niveis_douglas_peucker(offsets, coords):
+    """
+    Nível de simplificação (m) de cada ponto das polilinhas delimitadas por
+    `offsets`: com tolerância t, Douglas-Peucker mantém o ponto se e só se
+    t < nível. As pontas ficam com inf. Todas as polilinhas avançam juntas,
+    um nível de recursão por rodada.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    coords = np.asarray(coords, dtype=np.float64)
+    niveis = np.full(len(coords), np.inf)
+    if not len(coords):
+        return niveis
+    x, y = _metros(coords, float(coords[:, 0].mean()))
+
+    # Trechos (inicio, fim) ainda com pontos internos, com o nível do ponto que os criou
+    inicios, fins = offsets[:-1], offsets[1:] - 1
+    herdados = np.full(len(inicios), np.inf)
+    while True:
+        abertos = fins - inicios > 1
+        inicios, fins, herdados = inicios[abertos], fins[abertos], herdados[abertos]
+        if not len(inicios):
+            return niveis
+
+        internos = fins - inicios - 1
+        trecho = np.repeat(np.arange(len(inicios)), internos)
+        ponto = inicios[trecho] + 1 + sequencia(internos)
+        # Distância de cada ponto interno ao segmento entre as pontas do trecho
+        ax, ay = x[inicios][trecho], y[inicios][trecho]
+        bx, by = x[fins][trecho] - ax, y[fins][trecho] - ay
+        px, py = x[ponto] - ax, y[ponto] - ay
+        comprimento = bx * bx + by * by
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(comprimento > 0, (px * bx + py * by) / comprimento, 0.0), 0.0, 1.0)
+        distancia = np.hypot(px - t * bx, py - t * by)
+
+        # Ponto mais distante de cada trecho (o primeiro, em caso de empate)
+        primeiros = np.cumsum(internos) - internos
+        maximo = np.maximum.reduceat(distancia, primeiros)
+        candidatos = np.flatnonzero(distancia == maximo[trecho])
+        _, posicao = np.unique(trecho[candidatos], return_index=True)
+        divisao = ponto[candidatos[posicao]]
+        nivel = np.minimum(maximo, herdados)
+        niveis[divisao] = nivel
+
+        inicios, fins = np.concatenate([inicios, divisao]), np.concatenate([divisao, fins])
+        herdados = np.concatenate([nivel, nivel])
+
+
+def tolerancia_do_zoom(zoom, lat):
+    """Tolerância (m) equivalente a PIXELS_TOLERANCIA pixels no `zoom` do mapa, na latitude `lat`"""
+    return METROS_PIXEL_ZOOM_0 * math.cos(math.radians(lat)) / 2 ** zoom * PIXELS_TOLERANCIA
+
+
+def codificar_polilinha(coords, precisao=5):
+    """
+    Polilinha (lat, lng) no formato codificado do Google: deltas das
+    coordenadas arredondadas, em zigue-zague, quebrados em blocos de 5 bits
+    que viram caracteres ASCII 63..126
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    inteiros = np.round(coords * 10 ** precisao).astype(np.int64)
+    deltas = np.diff(inteiros, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    valores = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Até 7 blocos (35 bits) por valor: sobra para deltas de 180 graus com 6 casas
+    blocos = np.stack([(valores >> (5 * k)) & 0x1f for k in range(7)], axis=1)
+    quantidade = 1 + sum((valores >> (5 * k)) > 0 for k in range(1, 7))
+    coluna = np.arange(7)
+    # Todo bloco menos o último de cada valor leva o bit de continuação (0x20)
+    caracteres = blocos + 63 + 0x20 * (coluna < quantidade[:, None] - 1)
+    return caracteres[coluna < quantidade[:, None]].astype(np.uint8).tobytes().decode('ascii')
+
+
+class GeometriaArestas:
+    """Coordenadas (lat, lng) de todas as arestas com offsets e níveis de simplificação por ponto"""
+
+    def __init__(self, geom_offsets, geom_coords, no_lat, no_lng, geom_niveis=None):
+        self.offsets = np.asarray(geom_offsets, dtype=np.int64)
+        self.coords = np.asarray(geom_coords, dtype=np.float64)
+        self.no_lat = np.asarray(no_lat, dtype=np.float64)
+        self.no_lng = np.asarray(no_lng, dtype=np.float64)
+        if geom_niveis is None:
+            geom_niveis = niveis_douglas_peucker(self.offsets, self.coords)
+        self.niveis = np.asarray(geom_niveis)
+
+    @classmethod
+    def do_snapshot(cls, snapshot):
+        return cls(snapshot.geom_offsets, snapshot.geom_coords, snapshot.no_lat, snapshot.no_lng,
+                   snapshot.geom_niveis)
+
+    def coordenadas_aresta(self, aresta):
+        return self.coords[self.offsets[aresta]:self.offsets[aresta + 1]]
+
+    def indices_caminho(self, arestas, invertidas=None):
+        """Índices em `coords` da polilinha formada pela sequência de arestas"""
+        arestas = np.asarray(arestas, dtype=np.int64)
+        if invertidas is None:
+            invertidas = np.zeros(len(arestas), dtype=bool)
+        inicios = self.offsets[arestas]
+        fins = self.offsets[arestas + 1]
+        pular = np.ones(len(arestas), dtype=np.int64)
+        pular[0] = 0
+        tamanhos = fins - inicios - pular
+        # Concatenação vetorizada dos intervalos de cada aresta, em ordem
+        # crescente ou decrescente conforme o sentido percorrido
+        primeiros = np.where(invertidas, fins - 1 - pular, inicios + pular)
+        passos = np.where(invertidas, -1, 1)
+        return np.repeat(primeiros, tamanhos) + np.repeat(passos, tamanhos) * sequencia(tamanhos)
+
+    def montar(self, arestas, no_inicial=None, invertidas=None, tolerancia=0.0, com_niveis=False):
+        """
+        Polilinha (N, 2) em (lat, lng) das arestas do caminho.
+        Um caminho sem arestas vira o ponto do nó inicial (se informado).
+        tolerancia > 0 simplifica a polilinha (ver simplificar); com_niveis
+        devolve (polilinha, níveis) para simplificar depois.
+        """
+        if len(arestas) == 0:
+            if no_inicial is None:
+                coords = np.zeros((0, 2), dtype=np.float64)
+            else:
+                coords = np.array([[self.no_lat[no_inicial], self.no_lng[no_inicial]]])
+            return (coords, np.full(len(coords), np.inf)) if com_niveis else coords
+
+        indices = self.indices_caminho(arestas, invertidas)
+        if tolerancia > 0:
+            # Pontos que já caem dentro da própria aresta, antes de copiar as coordenadas
+            indices = indices[self.niveis[indices] > tolerancia]
+        coords = self.coords[indices]
+        niveis = self.niveis[indices]
+        if len(coords) > 1:
+            passos = np.abs(np.diff(coords, axis=0))
+            manter = np.ones(len(coords), dtype=bool)
+            manter[1:] = (passos[:, 0] >= TOLERANCIA_DUPLICADO) | (passos[:, 1] >= TOLERANCIA_DUPLICADO)
+            coords, niveis = coords[manter], niveis[manter]
+        if tolerancia > 0:
+            coords, niveis = self.simplificar(coords, niveis, tolerancia)
+        return (coords, niveis) if com_niveis else coords
+
+    def simplificar(self, coords, niveis, tolerancia):
+        """
+        Douglas-Peucker com `tolerancia` (m) sobre uma polilinha montada: os
+        pontos com nível até a tolerância caem (simplificação de cada aresta) e
+        o caminho que sobra, com os nós, passa por Douglas-Peucker inteiro. O
+        desvio fica em até duas vezes a tolerância. Retorna (polilinha, níveis).
+        """
+        if len(coords) <= 2:
+            return coords, niveis
+        manter = niveis > tolerancia
+        manter[[0, -1]] = True
+        coords, niveis = coords[manter], niveis[manter]
+        if len(coords) > 2:
+            # Douglas-Peucker do GEOS (bem mais rápido para uma linha só); o índice
+            # de cada ponto vai no z para voltar às coordenadas e níveis originais
+            x, y = _metros(coords, float(coords[:, 0].mean()))
+            linha = shapely.linestrings(x, y, np.arange(len(coords), dtype=np.float64))
+            simplificada = shapely.simplify(linha, tolerancia, preserve_topology=False)
+            manter = shapely.get_coordinates(simplificada, include_z=True)[:, 2].astype(np.int64)
+            coords, niveis = coords[manter], niveis[manter]
+        return coords, niveis
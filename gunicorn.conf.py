@@ -0,0 +1,46 @@
+"""
+Configuração do gunicorn (servidor prefork) para o modo de produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Variáveis de ambiente: ROTA_WORKERS (padrão: núcleos), ROTA_THREADS (padrão 256),
+ROTA_BIND (padrão 0.0.0.0:5000).
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('ROTA_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('ROTA_WORKERS', multiprocessing.cpu_count()))
+# Threads por worker: pedidos esperando Nominatim/OSRM ficam parados numa thread sem
+# segurar o worker; as buscas de rota rodam no pool próprio (ROTA_BUSCAS_SIMULTANEAS)
+threads = int(os.environ.get('ROTA_THREADS', 256))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# Carrega o grafo uma vez no mestre; os workers compartilham as páginas após o fork
+preload_app = True
+timeout = 60
+
+# Os workers já ocupam os núcleos: a matriz de distâncias roda dentro de cada um
+os.environ.setdefault('ROTA_MATRIZ_PROCESSOS', '1')
+# Instantâneos das métricas de cada worker, somados por /metrics (ver metricas.py)
+os.environ.setdefault('ROTA_METRICAS_DIR', os.path.join(tempfile.gettempdir(), f'rota_metricas_{os.getpid()}'))
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['ROTA_METRICAS_DIR'], ignore_errors=True)
+
+
+def when_ready(server):
+    # Objetos criados na carga saem do alcance do GC: coletas nos workers não
+    # tocam (e não duplicam) as páginas herdadas do mestre
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # Instantâneo do worker que saiu não entra mais na soma do /metrics
+    try:
+        os.remove(os.path.join(os.environ['ROTA_METRICAS_DIR'], f'{worker.pid}.json'))
+    except OSError:
+        pass
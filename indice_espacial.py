@@ -0,0 +1,129 @@
+"""
+Índice espacial para ajustar coordenadas ao grafo.
+
+Uma KD-tree (scipy) sobre as coordenadas dos nós numa projeção
+equiretangular local (metros) responde ao nó mais próximo em microssegundos,
+inclusive para arrays inteiros de coordenadas numa única chamada. Uma segunda
+KD-tree sobre os vértices da geometria das arestas permite ajustar um ponto à
+aresta mais próxima, devolvendo o ponto de corte sobre a via. Cada modo de
+transporte pode ter sua própria árvore, restrita aos nós que ele alcança.
+"""
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from geometria_rotas import RAIO_TERRA
+
+# Vértices de geometria consultados para escolher a aresta mais próxima
+CANDIDATOS_ARESTA = 16
+
+
+class IndiceEspacial:
+    """KD-trees de nós e de vértices de aresta em metros"""
+
+    def __init__(self, no_lat, no_lng, geom_offsets, geom_coords):
+        no_lat = np.asarray(no_lat, dtype=np.float64)
+        no_lng = np.asarray(no_lng, dtype=np.float64)
+        self.lat_ref = math.radians(float(no_lat.mean())) if len(no_lat) else 0.0
+        self.cos_ref = math.cos(self.lat_ref)
+
+        self.no_xy = np.column_stack(self.projetar(no_lat, no_lng))
+        self.arvore_nos = cKDTree(self.no_xy)
+        # modo -> (árvore sobre os nós válidos no modo, índices globais desses nós)
+        self.arvores_modo = {}
+
+        self.geom_offsets = np.asarray(geom_offsets)
+        self.geom_coords = np.asarray(geom_coords)
+        self._arvore_vertices = None
+        self._vertice_aresta = None
+
+    @classmethod
+    def do_snapshot(cls, snapshot):
+        return cls(snapshot.no_lat, snapshot.no_lng, snapshot.geom_offsets, snapshot.geom_coords)
+
+    def projetar(self, lats, lngs):
+        """(lat, lng) em graus -> (x, y) em metros; aceita escalares ou arrays"""
+        x = RAIO_TERRA * np.radians(lngs) * self.cos_ref
+        y = RAIO_TERRA * np.radians(lats)
+        return x, y
+
+    def adicionar_modo(self, modo, nos_validos):
+        """Árvore restrita aos nós marcados em `nos_validos` (máscara booleana)"""
+        globais = np.flatnonzero(nos_validos)
+        self.arvores_modo[modo] = (cKDTree(self.no_xy[globais]), globais)
+
+    def nos_mais_proximos(self, lats, lngs, modo=None):
+        """Índices dos nós mais próximos e distâncias (m) para arrays de coordenadas"""
+        x, y = self.projetar(np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64))
+        pontos = np.column_stack((np.ravel(x), np.ravel(y)))
+        if modo in self.arvores_modo:
+            arvore, globais = self.arvores_modo[modo]
+            distancias, indices = arvore.query(pontos)
+            return globais[indices], distancias
+        distancias, indices = self.arvore_nos.query(pontos)
+        return indices, distancias
+
+    def no_mais_proximo(self, lat, lng, modo=None):
+        """Índice do nó mais próximo de (lat, lng) e a distância em metros"""
+        indices, distancias = self.nos_mais_proximos([lat], [lng], modo)
+        return int(indices[0]), float(distancias[0])
+
+    def _vertices(self):
+        # Construída sob demanda: só é usada quando se pede ajuste à aresta
+        if self._arvore_vertices is None:
+            num_arestas = len(self.geom_offsets) - 1
+            self._vertice_aresta = np.repeat(np.arange(num_arestas), np.diff(self.geom_offsets))
+            self._vx, self._vy = self.projetar(self.geom_coords[:, 0], self.geom_coords[:, 1])
+            self._arvore_vertices = cKDTree(np.column_stack((self._vx, self._vy)))
+        return self._arvore_vertices
+
+    def aresta_mais_proxima(self, lat, lng, mascara=None):
+        """
+        Ajusta (lat, lng) à aresta mais próxima (entre as marcadas em `mascara`).
+        Retorna dict com a aresta, o ponto de corte (lat, lng), o índice do
+        segmento da geometria onde ele cai, a fração do comprimento da aresta
+        até o corte e a distância do ponto à via em metros; None se nenhuma
+        aresta permitida estiver por perto.
+        """
+        arvore = self._vertices()
+        px, py = self.projetar(lat, lng)
+        candidatas = np.zeros(0, dtype=np.int64)
+        for k in (CANDIDATOS_ARESTA, CANDIDATOS_ARESTA * 16):
+            _, vertices = arvore.query((px, py), k=min(k, arvore.n))
+            candidatas = np.unique(self._vertice_aresta[np.atleast_1d(vertices)])
+            if mascara is not None:
+                candidatas = candidatas[mascara[candidatas]]
+            if len(candidatas):
+                break
+        if not len(candidatas):
+            return None
+
+        # Todos os segmentos das arestas candidatas, avaliados de uma vez
+        inicios = np.concatenate([np.arange(self.geom_offsets[a], self.geom_offsets[a + 1] - 1)
+                                  for a in candidatas.tolist()])
+        ax, ay = self._vx[inicios], self._vy[inicios]
+        dx, dy = self._vx[inicios + 1] - ax, self._vy[inicios + 1] - ay
+        comprimento2 = dx * dx + dy * dy
+        t = ((px - ax) * dx + (py - ay) * dy) / np.where(comprimento2 > 0, comprimento2, 1.0)
+        t = np.clip(np.where(comprimento2 > 0, t, 0.0), 0.0, 1.0)
+        distancias = np.hypot(ax + t * dx - px, ay + t * dy - py)
+
+        melhor = int(np.argmin(distancias))
+        vertice = int(inicios[melhor])
+        aresta = int(self._vertice_aresta[vertice])
+        inicio, fim = int(self.geom_offsets[aresta]), int(self.geom_offsets[aresta + 1])
+        comprimentos = np.hypot(np.diff(self._vx[inicio:fim]), np.diff(self._vy[inicio:fim]))
+        segmento = vertice - inicio
+        total = float(comprimentos.sum())
+        percorrido = float(comprimentos[:segmento].sum() + comprimentos[segmento] * t[melhor])
+
+        a, b = self.geom_coords[vertice], self.geom_coords[vertice + 1]
+        return {
+            'aresta': aresta,
+            'lat': float(a[0] + t[melhor] * (b[0] - a[0])),
+            'lng': float(a[1] + t[melhor] * (b[1] - a[1])),
+            'segmento': segmento,
+            'fracao': percorrido / total if total > 0 else 0.0,
+            'distancia': float(distancias[melhor]),
+        }
@@ -0,0 +1,203 @@
+"""
+Chamadas a serviços externos (Nominatim, OSRM) num laço asyncio por processo.
+
+Cada processo tem um único laço de eventos, numa thread de fundo. Os
+endpoints entregam a chamada a ele e só esperam o resultado. Cada serviço
+externo (upstream) tem:
+
+- um limite de chamadas simultâneas;
+- um intervalo mínimo entre inícios, que substitui o sleep bloqueante do
+  RateLimiter do geopy;
+- uma fila máxima;
+- um tempo limite por pedido, contando a espera na fila. A vaga só é
+  devolvida quando a thread termina, mesmo que o pedido já tenha expirado:
+  o limite de simultâneas vale para o trabalho de fato em andamento.
+
+Os clientes HTTP (geopy, requests) são síncronos. Eles rodam num pool de
+threads do próprio upstream, do tamanho do limite de simultâneas. Pedidos na
+fila são corrotinas esperando a vez, não threads presas num sleep ou socket.
+
+As buscas de rota (CPU) vão para outro pool (`PoolBuscas`). Poucas buscas
+rodam ao mesmo tempo, em ordem de chegada, em vez de disputarem o GIL com
+dezenas de threads de requisição.
+
+Laço e pools são criados sob demanda e recriados se o PID mudar. Assim, cada
+worker do gunicorn (fork após o preload) tem os seus.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Exceção de asyncio.wait_for ao esgotar o tempo: o próprio TimeoutError a partir
+# do Python 3.11, uma classe à parte nas versões anteriores
+TempoEsgotado = asyncio.TimeoutError
+
+
+class FilaCheia(Exception):
+    """Upstream com a fila de espera lotada; o pedido é recusado na hora"""
+
+
+class ExpirouNaFila(TempoEsgotado):
+    """Tempo limite esgotado antes de a chamada começar: funcao nem chegou a rodar"""
+
+
+class Upstream:
+    """Limites de um serviço externo: simultâneas, intervalo, fila e tempo limite"""
+
+    def __init__(self, nome, max_simultaneos=8, timeout=10.0, intervalo_minimo=0.0, max_fila=1000):
+        self.nome = nome
+        self.max_simultaneos = max_simultaneos
+        self.timeout = timeout
+        self.intervalo_minimo = intervalo_minimo
+        self.max_fila = max_fila
+        self.chamadas = 0
+        self.em_andamento = 0
+        self.aguardando = 0
+        self.expirados = 0
+        self.recusados = 0
+        self.erros = 0
+        # Criados por LacoAssincrono no processo que vai usá-los (ver _novo_processo)
+        self._semaforo = self._trava_intervalo = self._executor = None
+        self._proximo_inicio = 0.0
+
+    def _novo_processo(self):
+        # Primitivas asyncio e threads não sobrevivem ao fork: recriadas por processo
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._semaforo = asyncio.Semaphore(self.max_simultaneos)
+        self._trava_intervalo = asyncio.Lock()
+        self._proximo_inicio = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_simultaneos, thread_name_prefix=self.nome)
+
+    async def _esperar_vez(self, laco):
+        if self.intervalo_minimo <= 0:
+            return
+        async with self._trava_intervalo:
+            espera = self._proximo_inicio - laco.time()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            self._proximo_inicio = laco.time() + self.intervalo_minimo
+
+    def _liberar(self, futuro=None):
+        if futuro is not None and not futuro.cancelled():
+            # Resultado de um pedido que já expirou: ninguém mais o lê
+            futuro.exception()
+        self.em_andamento -= 1
+        self._semaforo.release()
+
+    async def _executar(self, laco, funcao, args, estado):
+        await self._semaforo.acquire()
+        estado['na_fila'] = False
+        self.aguardando -= 1
+        self.em_andamento += 1
+        futuro = None
+        try:
+            await self._esperar_vez(laco)
+            futuro = laco.run_in_executor(self._executor, funcao, *args)
+            estado['iniciado'] = True
+            # A vaga volta quando a thread termina, não quando o pedido expira
+            futuro.add_done_callback(self._liberar)
+            return await asyncio.shield(futuro)
+        finally:
+            if futuro is None:
+                self._liberar()
+
+    async def chamar(self, funcao, *args):
+        """
+        Executa funcao(*args) respeitando os limites. FilaCheia, ExpirouNaFila
+        (não começou) ou TempoEsgotado (começou e segue até o fim na thread).
+        """
+        if self.aguardando >= self.max_fila:
+            self.recusados += 1
+            raise FilaCheia(f'{self.nome}: {self.aguardando} pedidos na fila')
+        self.chamadas += 1
+        self.aguardando += 1
+        estado = {'na_fila': True, 'iniciado': False}
+        try:
+            return await asyncio.wait_for(
+                self._executar(asyncio.get_running_loop(), funcao, args, estado), self.timeout)
+        except TempoEsgotado:
+            self.expirados += 1
+            if not estado['iniciado']:
+                raise ExpirouNaFila(f'{self.nome}: tempo limite de {self.timeout:g} s na fila') from None
+            raise
+        except Exception:
+            self.erros += 1
+            raise
+        finally:
+            # Expirou ainda na fila, sem chegar a ocupar uma vaga
+            if estado['na_fila']:
+                self.aguardando -= 1
+
+    def estatisticas(self):
+        return {
+            'max_simultaneos': self.max_simultaneos,
+            'timeout_s': self.timeout,
+            'intervalo_minimo_s': self.intervalo_minimo,
+            'chamadas': self.chamadas,
+            'em_andamento': self.em_andamento,
+            'aguardando': self.aguardando,
+            'expirados': self.expirados,
+            'recusados': self.recusados,
+            'erros': self.erros,
+        }
+
+
+class LacoAssincrono:
+    """Laço asyncio numa thread de fundo que atende os upstreams registrados"""
+
+    def __init__(self, *upstreams):
+        self.upstreams = {u.nome: u for u in upstreams}
+        self._laco = None
+        self._pid = None
+        self._trava = threading.Lock()
+
+    def _obter_laco(self):
+        with self._trava:
+            if self._pid != os.getpid():
+                self._laco = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                for upstream in self.upstreams.values():
+                    upstream._novo_processo()
+                threading.Thread(target=self._laco.run_forever, name='laco-io', daemon=True).start()
+            return self._laco
+
+    def chamar(self, nome, funcao, *args):
+        """Bloqueia só a thread chamadora até o resultado de funcao(*args) no upstream `nome`"""
+        coro = self.upstreams[nome].chamar(funcao, *args)
+        return asyncio.run_coroutine_threadsafe(coro, self._obter_laco()).result()
+
+    def chamar_varios(self, nome, funcao, lista_args):
+        """Várias chamadas ao mesmo upstream, concorrentes; exceções voltam no lugar do resultado"""
+        upstream = self.upstreams[nome]
+
+        async def todas():
+            return await asyncio.gather(*(upstream.chamar(funcao, *args) for args in lista_args),
+                                        return_exceptions=True)
+
+        return asyncio.run_coroutine_threadsafe(todas(), self._obter_laco()).result()
+
+    def estatisticas(self):
+        return {nome: upstream.estatisticas() for nome, upstream in self.upstreams.items()}
+
+
+class PoolBuscas:
+    """Pool de threads para as buscas de rota (CPU), separado das threads de E/S"""
+
+    def __init__(self, max_simultaneas=1):
+        self.max_simultaneas = max_simultaneas
+        self._executor = None
+        self._pid = None
+        self._trava = threading.Lock()
+
+    def executar(self, funcao, *args, **kwargs):
+        with self._trava:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_simultaneas, thread_name_prefix='busca')
+                self._pid = os.getpid()
+        # O contexto (etapas do pedido em metricas.py) acompanha a busca até a thread do pool
+        contexto = contextvars.copy_context()
+        return self._executor.submit(contexto.run, funcao, *args, **kwargs).result()
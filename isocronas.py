@@ -0,0 +1,205 @@
+"""
+Isócronas: área alcançável a partir de um ponto em até T segundos (ou D metros).
+
+Uma única busca limitada (MotorRotas.alcance) até o maior limite dá o custo
+de cada nó alcançado. Os arcos que saem desses nós são amostrados a cada
+célula da grade (no trecho reto entre os nós), cada amostra com seu custo:
+custo(u) + fração x peso, só até onde o maior limite chega. Cada limite
+filtra as mesmas amostras:
+
+- as células com amostras formam a grade de ocupação;
+- um fechamento morfológico (scipy.ndimage) preenche os quarteirões entre
+  as vias alcançadas, e vazios cercados menores que AREA_MINIMA_VAZIO
+  também são preenchidos;
+- as sequências de células ocupadas de cada linha viram retângulos, unidos
+  num polígono (ver _poligono_ocupacao);
+- o contorno é simplificado por Douglas-Peucker com tolerância em metros.
+
+Tudo numa projeção local centrada na origem. O custo fica na busca e
+cresce com a área, não com o número de limites.
+"""
+import math
+
+import numpy as np
+import shapely
+from scipy import ndimage
+from shapely.geometry import mapping
+
+from geometria_rotas import RAIO_TERRA, sequencia
+
+
+TIPOS = ('tempo', 'distancia')
+
+# Segundos (tempo) ou metros (distância)
+LIMITES_PADRAO = {'tempo': (300, 600, 900), 'distancia': (1000, 2500, 5000)}
+
+# Lado (m) das células da grade de ocupação
+CELULA = 50.0
+
+# Vãos entre vias alcançadas menores que ~2x isso (m) entram na área
+RAIO_FECHAMENTO = 150.0
+
+# Vazios cercados pela área menores que isso (km²) são preenchidos; lagoas e morros maiores ficam
+AREA_MINIMA_VAZIO = 0.5
+
+# Tolerância (m) do Douglas-Peucker sobre o contorno
+TOLERANCIA_SIMPLIFICACAO = 50.0
+
+
+def _pesos_distancia(visao):
+    """Metros por arco do modo; arcos fechados pelo trânsito seguem intransitáveis"""
+    return np.where(np.isinf(visao.motor.pesos), math.inf, visao.comprimentos)
+
+
+def _amostras(motor, no_x, no_y, custo_no, pesos, limite, celula):
+    """
+    (x, y, custo) de pontos a cada `celula` metros dentro dos arcos que saem
+    dos nós alcançados, até o fim do arco ou o ponto onde o limite se esgota
+    (as pontas já entram como nós)
+    """
+    # Arcos fechados pelo trânsito (peso inf) não levam a lugar nenhum
+    arcos = np.flatnonzero(np.isfinite(custo_no[motor.origens]) & np.isfinite(pesos))
+    u, v = motor.origens[arcos], motor.destinos[arcos]
+    custo_u, peso = custo_no[u], pesos[arcos]
+    dx, dy = no_x[v] - no_x[u], no_y[v] - no_y[u]
+    completo = custo_u + peso <= limite
+    # Fração do arco percorrida até o limite (1 se o arco inteiro cabe)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fracao = np.clip(np.where(completo, 1.0, (limite - custo_u) / peso), 0.0, 1.0)
+    passos = np.floor(np.hypot(dx, dy) * fracao / celula).astype(np.int64) + 1
+    # Amostras j = 1..n em t = fracao x j / n; a última de um arco completo é o próprio nó v
+    quantidade = passos - completo
+
+    arco = np.repeat(np.arange(len(arcos)), quantidade)
+    j = sequencia(quantidade) + 1
+    t = fracao[arco] * j / passos[arco]
+    x = no_x[u[arco]] + dx[arco] * t
+    y = no_y[u[arco]] + dy[arco] * t
+    custo = custo_u[arco] + t * peso[arco]
+    return x, y, custo
+
+
+def _poligono_ocupacao(ocupadas, x0, y0, celula):
+    """
+    Polígono (m) das células ocupadas. Cada sequência de células de uma linha
+    vira um retângulo com vértices extras onde começam ou terminam as
+    sequências das linhas vizinhas: as arestas coincidem vértice a vértice, e
+    o conjunto é uma cobertura válida, unida de uma vez por
+    coverage_union_all (bem mais rápido que union_all).
+    """
+    largura = ocupadas.shape[1] + 1
+    bordas = np.diff(np.pad(ocupadas, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    linha, inicio = np.nonzero(bordas == 1)
+    _, fim = np.nonzero(bordas == -1)
+
+    # Vértices sobre cada linha horizontal k da grade (chave k x largura + coluna):
+    # as pontas das sequências das linhas k - 1 e k
+    chaves = np.unique(np.concatenate([
+        linha * largura + inicio, linha * largura + fim,
+        (linha + 1) * largura + inicio, (linha + 1) * largura + fim]))
+    embaixo, em_cima = linha * largura, (linha + 1) * largura
+    primeiro_baixo = np.searchsorted(chaves, embaixo + inicio, 'right')
+    extras_baixo = np.searchsorted(chaves, embaixo + fim, 'left') - primeiro_baixo
+    ultimo_cima = np.searchsorted(chaves, em_cima + fim, 'left') - 1
+    extras_cima = ultimo_cima + 1 - np.searchsorted(chaves, em_cima + inicio, 'right')
+
+    # Anel anti-horário: canto inferior esquerdo, extras de baixo (crescentes),
+    # dois cantos da direita, extras de cima (decrescentes), canto superior esquerdo
+    tamanhos = extras_baixo + extras_cima + 4
+    inicio_anel = np.cumsum(tamanhos) - tamanhos
+    xs = np.empty(int(tamanhos.sum()))
+    ys = np.empty(len(xs))
+    xs[inicio_anel], ys[inicio_anel] = inicio, linha
+    direita = inicio_anel + 1 + extras_baixo
+    xs[direita], ys[direita] = fim, linha
+    xs[direita + 1], ys[direita + 1] = fim, linha + 1
+    xs[inicio_anel + tamanhos - 1], ys[inicio_anel + tamanhos - 1] = inicio, linha + 1
+
+    anel = np.repeat(np.arange(len(linha)), extras_baixo)
+    k = sequencia(extras_baixo)
+    posicao = inicio_anel[anel] + 1 + k
+    xs[posicao], ys[posicao] = chaves[primeiro_baixo[anel] + k] - embaixo[anel], linha[anel]
+    anel = np.repeat(np.arange(len(linha)), extras_cima)
+    k = sequencia(extras_cima)
+    posicao = direita[anel] + 2 + k
+    xs[posicao], ys[posicao] = chaves[ultimo_cima[anel] - k] - em_cima[anel], linha[anel] + 1
+
+    aneis = shapely.linearrings(np.column_stack((x0 + xs * celula, y0 + ys * celula)),
+                                indices=np.repeat(np.arange(len(linha)), tamanhos))
+    return shapely.coverage_union_all(shapely.polygons(aneis))
+
+
+def calcular_isocronas(visao, geometria, origem, limites, tipo='tempo', tolerancia=TOLERANCIA_SIMPLIFICACAO,
+                       celula=CELULA, raio_fechamento=RAIO_FECHAMENTO):
+    """
+    Polígonos alcançáveis a partir do nó `origem` para cada limite (ordem
+    crescente), com uma única busca. Retorna ([{'limite', 'poligono' (GeoJSON),
+    'nos_alcancados', 'area_km2'}, ...], nós assentados).
+    """
+    motor = visao.motor
+    limites = sorted(float(limite) for limite in limites)
+    if tipo == 'distancia':
+        pesos = _pesos_distancia(visao)
+        nos, custos = motor.alcance(origem, limites[-1], pesos.tolist())
+    else:
+        pesos = motor.pesos
+        nos, custos = motor.alcance(origem, limites[-1])
+    custos = np.asarray(custos)
+
+    custo_no = np.full(motor.num_nos, np.inf)
+    custo_no[nos] = custos
+
+    # Projeção equiretangular centrada na origem (m)
+    lat0, lng0 = float(geometria.no_lat[origem]), float(geometria.no_lng[origem])
+    escala_y = RAIO_TERRA * math.pi / 180
+    escala_x = escala_y * math.cos(math.radians(lat0))
+    no_x = (geometria.no_lng - lng0) * escala_x
+    no_y = (geometria.no_lat - lat0) * escala_y
+
+    x, y, custo = _amostras(motor, no_x, no_y, custo_no, pesos, limites[-1], celula)
+    nos = np.asarray(nos, dtype=np.int64)
+    x = np.concatenate([no_x[nos], x])
+    y = np.concatenate([no_y[nos], y])
+    custo = np.concatenate([custos, custo])
+
+    # Células de cada amostra numa grade única; cada limite recorta a sua parte,
+    # com margem para o fechamento e a dilatação não cortarem a borda
+    margem = max(int(math.ceil(raio_fechamento / celula)), 1) + 2
+    x0, y0 = float(x.min()), float(y.min())
+    coluna = ((x - x0) // celula).astype(np.int64)
+    linha = ((y - y0) // celula).astype(np.int64)
+    estrutura = ndimage.generate_binary_structure(2, 1)
+    celulas_vazio = AREA_MINIMA_VAZIO * 1e6 / celula ** 2
+
+    def para_lng_lat(xy):
+        return np.column_stack((lng0 + xy[:, 0] / escala_x, lat0 + xy[:, 1] / escala_y))
+
+    isocronas = []
+    for limite in limites:
+        dentro = custo <= limite
+        linhas, colunas = linha[dentro], coluna[dentro]
+        linha0, coluna0 = int(linhas.min()) - margem, int(colunas.min()) - margem
+        ocupadas = np.zeros((int(linhas.max()) - linha0 + margem + 1, int(colunas.max()) - coluna0 + margem + 1),
+                            dtype=bool)
+        ocupadas[linhas - linha0, colunas - coluna0] = True
+        # Quarteirões entre vias alcançadas, uma célula de folga em volta das vias
+        # (une trechos que só se tocam na diagonal) e vazios pequenos preenchidos
+        ocupadas |= ndimage.binary_closing(ocupadas, estrutura, iterations=margem - 2)
+        ocupadas = ndimage.binary_dilation(ocupadas, np.ones((3, 3), dtype=bool))
+        vazios, _ = ndimage.label(~ocupadas)
+        pequenos = np.bincount(vazios.ravel()) < celulas_vazio
+        pequenos[vazios[0, 0]] = False
+        ocupadas |= pequenos[vazios]
+
+        contorno = _poligono_ocupacao(ocupadas, x0 + coluna0 * celula, y0 + linha0 * celula, celula)
+        # Douglas-Peucker simples é bem mais rápido; o que preserva a topologia só se o resultado sair inválido
+        area_alcancada = shapely.simplify(contorno, tolerancia, preserve_topology=False)
+        if not area_alcancada.is_valid or area_alcancada.is_empty:
+            area_alcancada = shapely.simplify(contorno, tolerancia, preserve_topology=True)
+        isocronas.append({
+            'limite': limite,
+            'poligono': mapping(shapely.transform(area_alcancada, para_lng_lat)),
+            'nos_alcancados': int(np.count_nonzero(custos <= limite)),
+            'area_km2': area_alcancada.area / 1e6,
+        })
+    return isocronas, len(nos)
@@ -0,0 +1,141 @@
+"""
+Matriz de distâncias e durações (um-para-muitos / muitos-para-muitos).
+
+Em vez de N x M rotas independentes, cada origem faz uma única busca de
+Dijkstra que para assim que todos os destinos foram assentados. As origens
+são distribuídas entre processos: cada processo mapeia os mesmos arquivos
+.npy do snapshot (as páginas ficam compartilhadas no cache do sistema) e
+monta suas próprias visões por modo uma única vez (as de outros cenários de
+pesos, na primeira matriz que os usar). Sem snapshot em disco, ou
+para matrizes pequenas, as linhas são calculadas no próprio processo.
+"""
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cenarios
+import geometria_rotas
+import modos
+import snapshot_grafo
+import trafego
+
+log = logging.getLogger('rota')
+
+# Abaixo disso o custo de despachar para o pool não compensa
+MIN_ORIGENS_POOL = 4
+
+# Estado de cada processo do pool (cenários e geometria sobre o snapshot mapeado)
+_cenarios = None
+_geometria = None
+
+
+def _iniciar_trabalhador(diretorio, parametros, sementes_cenarios, trafego_compartilhado):
+    global _cenarios, _geometria
+    snapshot = snapshot_grafo.carregar_snapshot(diretorio, parametros, verificar=False)
+    if snapshot is None:
+        raise RuntimeError(f'Snapshot indisponível em {diretorio}')
+    trafego_ao_vivo = None
+    if trafego_compartilhado is not None:
+        trafego_ao_vivo = trafego.TrafegoAoVivo(modos.MODOS, snapshot.num_arestas, trafego_compartilhado)
+    _cenarios = cenarios.ConjuntoCenarios(
+        modos.construir_visoes(snapshot),
+        cenarios.cenarios_do_snapshot(snapshot, (parametros or {}).get('semente_pesos'), sementes_cenarios),
+        preconstruir=False, trafego=trafego_ao_vivo)
+    _geometria = geometria_rotas.GeometriaArestas.do_snapshot(snapshot)
+
+
+def calcular_linhas(visoes, geometria, modo, origens, destinos, incluir_caminhos=False):
+    """
+    Linhas da matriz para os índices de nós `origens` x `destinos`.
+    Retorna (durações, distâncias, caminhos, nós assentados); None onde não há caminho.
+    """
+    visao = visoes[modo]
+    motor = visao.motor
+    duracoes, distancias, caminhos = [], [], []
+    assentados = 0
+    for origem in origens:
+        custos, arestas_alvos, assentados_linha = motor.um_para_muitos(origem, destinos)
+        assentados += assentados_linha
+        duracoes.append([None if math.isinf(c) else c for c in custos])
+        distancias.append([None if arcos is None else visao.distancia(arcos) for arcos in arestas_alvos])
+        if incluir_caminhos:
+            caminhos.append([
+                None if arcos is None else geometria.montar(
+                    motor.arestas_base[arcos], origem, motor.invertidas[arcos]).tolist()
+                for arcos in arestas_alvos])
+    return duracoes, distancias, caminhos, assentados
+
+
+def _calcular_linhas_trabalhador(cenario, modo, origens, destinos, incluir_caminhos):
+    # Trânsito gravado pelo servidor desde a última tarefa
+    _cenarios.sincronizar_trafego()
+    return calcular_linhas(_cenarios.visoes(cenario), _geometria, modo, origens, destinos, incluir_caminhos)
+
+
+class ServicoMatriz:
+    """Calcula matrizes no processo atual ou num pool de processos sobre o snapshot"""
+
+    def __init__(self, diretorio_snapshot=None, parametros=None, processos=None, sementes_cenarios=(),
+                 trafego_compartilhado=None):
+        self.diretorio_snapshot = diretorio_snapshot
+        self.parametros = parametros
+        self.sementes_cenarios = tuple(sementes_cenarios)
+        # Memória compartilhada do trafego.TrafegoAoVivo do servidor
+        self.trafego_compartilhado = trafego_compartilhado
+        self.processos = (os.cpu_count() or 1) if processos is None else processos
+        self._pool = None
+
+    def _obter_pool(self):
+        if self._pool is None:
+            # spawn: processos limpos, sem herdar threads do servidor web
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_trabalhador,
+                initargs=(self.diretorio_snapshot, self.parametros, self.sementes_cenarios,
+                          self.trafego_compartilhado))
+        return self._pool
+
+    def usa_pool(self, num_origens):
+        return (self.diretorio_snapshot is not None and self.processos > 1
+                and num_origens >= MIN_ORIGENS_POOL)
+
+    def calcular(self, visoes, geometria, modo, origens, destinos, incluir_caminhos=False, cenario=None):
+        """
+        Matriz completa; `visoes`/`geometria` do processo atual são usadas sem pool.
+        No pool, `cenario` escolhe as visões (None: o cenário base).
+        """
+        origens, destinos = [int(o) for o in origens], [int(d) for d in destinos]
+        if not self.usa_pool(len(origens)):
+            return calcular_linhas(visoes, geometria, modo, origens, destinos, incluir_caminhos)
+
+        # Blocos contíguos de origens, alguns por processo para equilibrar a carga
+        num_blocos = min(len(origens), self.processos * 2)
+        tamanho = math.ceil(len(origens) / num_blocos)
+        blocos = [origens[i:i + tamanho] for i in range(0, len(origens), tamanho)]
+        duracoes, distancias, caminhos = [], [], []
+        assentados = 0
+        try:
+            cenario = cenario or cenarios.CENARIO_BASE
+            futuros = [self._obter_pool().submit(
+                _calcular_linhas_trabalhador, cenario, modo, bloco, destinos, incluir_caminhos) for bloco in blocos]
+            for futuro in futuros:
+                d, m, c, a = futuro.result()
+                duracoes += d
+                distancias += m
+                caminhos += c
+                assentados += a
+        except BrokenProcessPool as e:
+            # Um processo morreu (ou não iniciou): descarta o pool e calcula aqui mesmo
+            log.warning(f"⚠️ Pool da matriz indisponível ({e}); calculando no processo atual")
+            self.encerrar()
+            return calcular_linhas(visoes, geometria, modo, origens, destinos, incluir_caminhos)
+        return duracoes, distancias, caminhos, assentados
+
+    def encerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
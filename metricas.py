@@ -0,0 +1,287 @@
+"""
+Logging estruturado, etapas cronometradas por pedido e métricas no formato Prometheus.
+
+- `configurar_logging()`: logger 'rota' com nível de ROTA_LOG_NIVEL (padrão INFO)
+  e saída em texto ou JSON por linha (ROTA_LOG_FORMATO=json). Campos extras vão
+  em `extra={'campos': {...}}`.
+- `etapa(nome)`: context manager que mede uma etapa (ajuste, busca, geometria,
+  serialização, geocodificação, osrm...) e registra no histograma
+  rota_etapa_segundos e na lista de etapas do pedido corrente. A lista vive
+  num ContextVar e acompanha o pedido para as threads do PoolBuscas.
+- `registro.texto_prometheus()`: exposição para o endpoint /metrics.
+
+Com vários workers do gunicorn cada processo tem seu registro. Se
+ROTA_METRICAS_DIR estiver definido, cada processo grava um instantâneo ali
+(no máximo uma vez por segundo) e a exposição soma os dos processos vivos; o
+instantâneo de um worker que morreu é apagado (os contadores dele somem da
+soma, como num reinício do processo).
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+log = logging.getLogger('rota')
+
+# Segundos: de 0,5 ms a 30 s
+BALDES_TEMPO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BALDES_NOS = (10, 100, 1000, 5000, 10000, 25000, 50000, 100000, 250000)
+
+_etapas_pedido = contextvars.ContextVar('etapas_pedido', default=None)
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro, com os campos de extra={'campos': {...}}"""
+
+    def format(self, registro):
+        dados = {
+            'ts': round(registro.created, 3),
+            'nivel': registro.levelname,
+            'logger': registro.name,
+            'msg': registro.getMessage(),
+            'pid': registro.process,
+        }
+        dados.update(getattr(registro, 'campos', None) or {})
+        if registro.exc_info:
+            dados['excecao'] = self.formatException(registro.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FormatadorTexto(logging.Formatter):
+    """Mensagem seguida dos campos como chave=valor"""
+
+    def format(self, registro):
+        texto = super().format(registro)
+        campos = getattr(registro, 'campos', None)
+        if campos:
+            texto += ' ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        return texto
+
+
+def configurar_logging(nivel=None, formato=None):
+    """Configura o logger 'rota' uma única vez (chamadas repetidas só ajustam o nível)"""
+    nivel = (nivel or os.environ.get('ROTA_LOG_NIVEL', 'INFO')).upper()
+    formato = formato or os.environ.get('ROTA_LOG_FORMATO', 'texto')
+    log.setLevel(nivel)
+    if not log.handlers:
+        saida = logging.StreamHandler(sys.stdout)
+        saida.setFormatter(FormatadorJSON() if formato == 'json' else FormatadorTexto('%(message)s'))
+        log.addHandler(saida)
+        log.propagate = False
+    return log
+
+
+def _rotulos(nomes, valores):
+    return ','.join(f'{n}="{v}"' for n, v in zip(nomes, valores))
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.valores = {}
+        self._trava = threading.Lock()
+
+    def inc(self, *rotulos, valor=1):
+        with self._trava:
+            self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def exportar(self):
+        with self._trava:
+            return {'|'.join(r): v for r, v in self.valores.items()}
+
+    @staticmethod
+    def somar(exportados):
+        total = {}
+        for dados in exportados:
+            for chave, valor in dados.items():
+                total[chave] = total.get(chave, 0) + valor
+        return total
+
+    def linhas(self, dados):
+        yield f'# HELP {self.nome} {self.ajuda}'
+        yield f'# TYPE {self.nome} counter'
+        for chave, valor in sorted(dados.items()):
+            rotulos = _rotulos(self.rotulos, chave.split('|') if self.rotulos else ())
+            yield f'{self.nome}{{{rotulos}}} {valor}' if rotulos else f'{self.nome} {valor}'
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_TEMPO):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        self.baldes = tuple(baldes)
+        # rótulos -> [contagem por balde..., soma, total]
+        self.valores = {}
+        self._trava = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        with self._trava:
+            serie = self.valores.get(rotulos)
+            if serie is None:
+                serie = self.valores[rotulos] = [0] * len(self.baldes) + [0.0, 0]
+            for i, limite in enumerate(self.baldes):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self):
+        with self._trava:
+            return {'|'.join(r): list(s) for r, s in self.valores.items()}
+
+    @staticmethod
+    def somar(exportados):
+        total = {}
+        for dados in exportados:
+            for chave, serie in dados.items():
+                if chave in total:
+                    total[chave] = [a + b for a, b in zip(total[chave], serie)]
+                else:
+                    total[chave] = list(serie)
+        return total
+
+    def linhas(self, dados):
+        yield f'# HELP {self.nome} {self.ajuda}'
+        yield f'# TYPE {self.nome} histogram'
+        for chave, serie in sorted(dados.items()):
+            base = _rotulos(self.rotulos, chave.split('|') if self.rotulos else ())
+            separador = ',' if base else ''
+            acumulado = 0
+            for limite, contagem in zip(self.baldes, serie):
+                acumulado += contagem
+                yield f'{self.nome}_bucket{{{base}{separador}le="{limite:g}"}} {acumulado}'
+            yield f'{self.nome}_bucket{{{base}{separador}le="+Inf"}} {serie[-1]}'
+            sufixo = f'{{{base}}}' if base else ''
+            yield f'{self.nome}_sum{sufixo} {serie[-2]}'
+            yield f'{self.nome}_count{sufixo} {serie[-1]}'
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, mas de outro usuário
+        return True
+    return True
+
+
+class Registro:
+    """Métricas do processo, com agregação opcional entre workers via diretório"""
+
+    def __init__(self, diretorio=None, intervalo_gravacao=1.0):
+        self.metricas = {}
+        self.diretorio = diretorio
+        self.intervalo_gravacao = intervalo_gravacao
+        self._ultima_gravacao = 0.0
+        # Uma gravação por vez: as demais threads do pedido seguem sem esperar
+        self._trava_gravacao = threading.Lock()
+
+    def contador(self, nome, ajuda, rotulos=()):
+        self.metricas[nome] = Contador(nome, ajuda, rotulos)
+        return self.metricas[nome]
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_TEMPO):
+        self.metricas[nome] = Histograma(nome, ajuda, rotulos, baldes)
+        return self.metricas[nome]
+
+    def exportar(self):
+        return {nome: metrica.exportar() for nome, metrica in self.metricas.items()}
+
+    def gravar(self, forcar=False):
+        """Instantâneo deste processo em <diretorio>/<pid>.json (atômico, com intervalo mínimo)"""
+        if not self.diretorio or not self._trava_gravacao.acquire(blocking=forcar):
+            return
+        try:
+            agora = time.monotonic()
+            if not forcar and agora - self._ultima_gravacao < self.intervalo_gravacao:
+                return
+            self._ultima_gravacao = agora
+            os.makedirs(self.diretorio, exist_ok=True)
+            destino = os.path.join(self.diretorio, f'{os.getpid()}.json')
+            temporario = f'{destino}.{threading.get_ident()}.tmp'
+            with open(temporario, 'w') as f:
+                json.dump(self.exportar(), f)
+            os.replace(temporario, destino)
+        except OSError as e:
+            log.warning('falha ao gravar métricas', extra={'campos': {'erro': str(e)}})
+        finally:
+            self._trava_gravacao.release()
+
+    def _instantaneos(self):
+        proprio = self.exportar()
+        if not self.diretorio or not os.path.isdir(self.diretorio):
+            return [proprio]
+        outros = []
+        for arquivo in os.listdir(self.diretorio):
+            pid = arquivo[:-len('.json')]
+            if not arquivo.endswith('.json') or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            caminho = os.path.join(self.diretorio, arquivo)
+            try:
+                if not _processo_vivo(int(pid)):
+                    os.remove(caminho)
+                    continue
+                with open(caminho) as f:
+                    outros.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return [proprio] + outros
+
+    def texto_prometheus(self):
+        """Exposição em texto (text/plain; version=0.0.4) somando todos os processos"""
+        instantaneos = self._instantaneos()
+        linhas = []
+        for nome, metrica in self.metricas.items():
+            dados = type(metrica).somar(i.get(nome, {}) for i in instantaneos)
+            linhas.extend(metrica.linhas(dados))
+        return '\n'.join(linhas) + '\n'
+
+
+registro = Registro(os.environ.get('ROTA_METRICAS_DIR'))
+
+ETAPAS = registro.histograma('rota_etapa_segundos', 'Duração de cada etapa do atendimento', ('etapa',))
+REQUISICOES = registro.histograma(
+    'rota_requisicao_segundos', 'Duração total das requisições HTTP', ('endpoint', 'status'))
+NOS_ASSENTADOS = registro.histograma(
+    'rota_nos_assentados', 'Nós assentados por busca de rota', ('algoritmo', 'modo'), BALDES_NOS)
+CACHE = registro.contador('rota_cache_total', 'Consultas aos caches por resultado', ('cache', 'resultado'))
+
+
+@contextlib.contextmanager
+def etapa(nome):
+    """Cronometra o bloco como a etapa `nome` do pedido corrente"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        ETAPAS.observar(duracao, nome)
+        etapas = _etapas_pedido.get()
+        if etapas is not None:
+            etapas.append((nome, duracao))
+
+
+def iniciar_pedido():
+    """Abre a lista de etapas do pedido; devolve o token para encerrar_pedido"""
+    return _etapas_pedido.set([])
+
+
+def encerrar_pedido(token):
+    """Fecha a lista de etapas do pedido e a devolve como [(nome, segundos), ...]"""
+    etapas = _etapas_pedido.get() or []
+    _etapas_pedido.reset(token)
+    return etapas
+
+
+def server_timing(etapas):
+    """Cabeçalho Server-Timing (ms) com as etapas do pedido, somando repetidas"""
+    totais = {}
+    for nome, duracao in etapas:
+        totais[nome] = totais.get(nome, 0.0) + duracao
+    return ', '.join(f'{nome};dur={duracao * 1000:.2f}' for nome, duracao in totais.items())
@@ -0,0 +1,145 @@
+"""
+Perfis de transporte (carro, a pé, bicicleta) sobre o grafo único de Maricá.
+
+O grafo é carregado uma vez com network_type='all'. Cada modo é uma visão
+sobre os mesmos arrays do snapshot: uma máscara das arestas permitidas pelo
+tipo de via (highway) e uma coluna própria de pesos em tempo de viagem
+(segundos), derivada da velocidade do modo na via. `com_pesos` deriva a
+visão de outro cenário de pesos (cenarios.py) sem refazer a topologia. A pé as ruas de mão única
+também podem ser percorridas no sentido contrário, então a visão de
+caminhada inclui os arcos invertidos dessas arestas.
+"""
+import copy
+
+import numpy as np
+
+import motor_rotas
+from geometria_rotas import sequencia
+
+MODOS = ('driving', 'walking', 'cycling')
+
+# Tipos de via que nunca fazem parte de nenhum modo
+_FORA_DE_USO = {'abandoned', 'construction', 'proposed', 'planned', 'razed', 'raceway', 'bus_guideway',
+                'platform', 'elevator', 'escalator'}
+
+PERFIS = {
+    'driving': {
+        'proibidos': _FORA_DE_USO | {'footway', 'pedestrian', 'path', 'steps', 'cycleway', 'bridleway',
+                                     'corridor', 'track'},
+        # km/h por tipo de via quando não há maxspeed
+        'velocidades': {
+            'motorway': 80, 'motorway_link': 60, 'trunk': 70, 'trunk_link': 50,
+            'primary': 60, 'primary_link': 40, 'secondary': 50, 'secondary_link': 35,
+            'tertiary': 40, 'tertiary_link': 30, 'unclassified': 30, 'residential': 30,
+            'living_street': 10, 'service': 15, 'road': 30,
+        },
+        'velocidade_padrao': 25,
+        'usa_maxspeed': True,
+        'contramao': False,
+    },
+    'walking': {
+        'proibidos': _FORA_DE_USO | {'motorway', 'motorway_link', 'cycleway'},
+        'velocidades': {'steps': 2.5},
+        'velocidade_padrao': 5,
+        'usa_maxspeed': False,
+        'contramao': True,
+    },
+    'cycling': {
+        'proibidos': _FORA_DE_USO | {'motorway', 'motorway_link', 'footway', 'steps', 'corridor'},
+        'velocidades': {'cycleway': 18, 'path': 12, 'track': 10, 'pedestrian': 8},
+        'velocidade_padrao': 15,
+        'usa_maxspeed': False,
+        'contramao': False,
+    },
+}
+
+
+def velocidades_arestas(snapshot, modo):
+    """Velocidade (km/h) do modo em cada aresta do snapshot; 0 onde o modo é proibido"""
+    perfil = PERFIS[modo]
+    vocabulario = [str(tipo) for tipo in np.asarray(snapshot.vocabulario_highway).tolist()]
+    por_tipo = np.array([
+        0.0 if tipo in perfil['proibidos'] else float(perfil['velocidades'].get(tipo, perfil['velocidade_padrao']))
+        for tipo in vocabulario], dtype=np.float64)
+    velocidades = por_tipo[np.asarray(snapshot.highway)]
+    if perfil['usa_maxspeed']:
+        maxspeed = np.asarray(snapshot.maxspeed, dtype=np.float64)
+        com_limite = (velocidades > 0) & np.isfinite(maxspeed) & (maxspeed > 0)
+        velocidades[com_limite] = maxspeed[com_limite]
+    return velocidades
+
+
+class VisaoModo:
+    """Máscara de arestas, pesos em tempo e motor de rotas de um modo de transporte"""
+
+    def __init__(self, snapshot, modo):
+        self.modo = modo
+        self.velocidades = velocidades_arestas(snapshot, modo)
+        self.mascara = self.velocidades > 0
+        self.tempos = self._tempos(snapshot.pesos)
+
+        arestas = np.flatnonzero(self.mascara)
+        invertidas = np.zeros(len(arestas), dtype=bool)
+        if PERFIS[modo]['contramao']:
+            mao_unica = arestas[np.asarray(snapshot.mao_unica)[arestas]]
+            arestas = np.concatenate([arestas, mao_unica])
+            invertidas = np.concatenate([invertidas, np.ones(len(mao_unica), dtype=bool)])
+
+        origens = np.where(invertidas, snapshot.destinos[arestas], snapshot.origens[arestas])
+        destinos = np.where(invertidas, snapshot.origens[arestas], snapshot.destinos[arestas])
+        self.motor = motor_rotas.MotorRotas.de_arcos(
+            snapshot, origens, destinos, self.tempos[arestas], arestas, invertidas)
+
+        # Nós com pelo menos um arco no modo (candidatos ao ajuste de coordenadas)
+        self.nos_validos = np.zeros(snapshot.num_nos, dtype=bool)
+        self.nos_validos[origens] = True
+        self.nos_validos[destinos] = True
+
+        # Comprimento (m) de cada arco, para reportar a distância da rota
+        self.comprimentos = np.asarray(snapshot.pesos)[self.motor.arestas_base]
+
+        # Arcos ordenados pela aresta do snapshot, para achar os arcos de uma aresta
+        self._ordem_arcos = np.argsort(self.motor.arestas_base, kind='stable')
+        self._arestas_ordenadas = self.motor.arestas_base[self._ordem_arcos]
+
+    def _tempos(self, comprimentos, fator_tempo=None):
+        """Segundos por aresta = metros / (km/h / 3.6), vezes o fator de tempo; 0 fora do modo"""
+        tempos = np.zeros(len(self.velocidades), dtype=np.float64)
+        tempos[self.mascara] = np.asarray(comprimentos)[self.mascara] / (self.velocidades[self.mascara] / 3.6)
+        if fator_tempo is not None:
+            tempos[self.mascara] *= np.asarray(fator_tempo)[self.mascara]
+        return tempos
+
+    def com_pesos(self, comprimentos, fator_tempo=None):
+        """Visão do mesmo modo com outra coluna de comprimentos (e fator de tempo), sem copiar a topologia"""
+        nova = copy.copy(self)
+        nova.tempos = self._tempos(comprimentos, fator_tempo)
+        nova.motor = self.motor.com_pesos(nova.tempos[self.motor.arestas_base])
+        nova.comprimentos = np.asarray(comprimentos)[self.motor.arestas_base]
+        return nova
+
+    def arcos_das_arestas(self, arestas):
+        """
+        Arcos do motor que percorrem as arestas do snapshot (a pé, uma aresta de
+        mão única tem dois) e, para cada arco, a posição da aresta em `arestas`
+        """
+        arestas = np.asarray(arestas)
+        inicio = np.searchsorted(self._arestas_ordenadas, arestas, 'left')
+        contagem = np.searchsorted(self._arestas_ordenadas, arestas, 'right') - inicio
+        return self._ordem_arcos[np.repeat(inicio, contagem) + sequencia(contagem)], np.repeat(np.arange(len(arestas)), contagem)
+
+    def aplicar_fatores(self, arestas, fatores):
+        """Peso dos arcos das arestas = tempo do cenário x fator de trânsito, no lugar; devolve os arcos"""
+        arcos, posicoes = self.arcos_das_arestas(arestas)
+        if len(arcos):
+            fatores = np.asarray(fatores, dtype=np.float64)[posicoes]
+            self.motor.atualizar_pesos(arcos, self.tempos[self.motor.arestas_base[arcos]] * fatores, fatores != 1.0)
+        return arcos
+
+    def distancia(self, arcos):
+        return float(self.comprimentos[arcos].sum()) if len(arcos) else 0.0
+
+
+def construir_visoes(snapshot):
+    """Uma visão por modo de transporte, todas sobre os mesmos arrays do snapshot"""
+    return {modo: VisaoModo(snapshot, modo) for modo in MODOS}
@@ -0,0 +1,593 @@
+"""
+Motor de rotas sobre o grafo em CSR (arrays indexados por inteiros).
+
+O grafo é convertido uma única vez em offsets/destinos/pesos; cada consulta
+reaproveita buffers de distância e de aresta-pai pré-alocados por thread,
+invalidados por um contador de geração em vez de serem reinicializados.
+Arestas paralelas ficam todas no CSR, então a relaxação sempre escolhe a de
+menor peso.
+
+A busca A* bidirecional usa como heurística a distância em linha reta entre
+os nós, escalada pelo menor peso por metro entre todas as arestas do grafo:
+com a randomização de ±20% isso fica em torno de 0.8, e a heurística continua
+admissível e consistente para qualquer coluna de pesos.
+"""
+import copy
+import heapq
+import math
+import threading
+
+import numpy as np
+
+import snapshot_grafo
+from geometria_rotas import RAIO_TERRA
+
+ALGORITMOS = ('dijkstra', 'astar_bidirecional', 'ch')
+
+
+class BuffersBusca:
+    """Buffers de busca reaproveitados entre consultas de uma mesma thread"""
+
+    def __init__(self, num_nos):
+        self.dist = [0.0] * num_nos
+        self.pai_aresta = [-1] * num_nos
+        self.geracao = [0] * num_nos
+        self.geracao_atual = 0
+
+    def nova_geracao(self):
+        self.geracao_atual += 1
+        return self.geracao_atual
+
+
+def vista(array):
+    """
+    memoryview sobre o array, para o laço interno: indexá-la custa o mesmo que
+    indexar uma lista Python (e bem menos que indexar o ndarray), sem copiar
+    nada. Os arrays do snapshot (.npy mapeados) e os montados antes do fork
+    continuam em páginas compartilhadas entre os workers.
+    """
+    return memoryview(np.ascontiguousarray(array))
+
+
+class MotorRotas:
+    """Dijkstra e A* bidirecional sobre CSR com buffers reutilizáveis"""
+
+    def __init__(self, offsets, origens, destinos, pesos, no_ids, no_lat, no_lng,
+                 arestas_base=None, invertidas=None):
+        self.offsets = np.asarray(offsets)
+        self.origens = np.asarray(origens)
+        self.destinos = np.asarray(destinos)
+        self.pesos = np.asarray(pesos)
+        self.no_ids = np.asarray(no_ids)
+        # Aresta do snapshot que cada arco percorre (e se no sentido contrário)
+        if arestas_base is None:
+            arestas_base = np.arange(len(self.destinos))
+        self.arestas_base = np.asarray(arestas_base)
+        self.invertidas = np.asarray(invertidas) if invertidas is not None else np.zeros(len(self.destinos), dtype=bool)
+        self.num_nos = len(self.no_ids)
+        self.indice_nos = {int(no): i for i, no in enumerate(self.no_ids.tolist())}
+
+        # CSR reverso (arestas de entrada) para a busca para trás
+        ordem_reversa = np.argsort(self.destinos, kind='stable')
+        self.offsets_reversos = np.zeros(self.num_nos + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.destinos, minlength=self.num_nos), out=self.offsets_reversos[1:])
+        self.arestas_reversas = ordem_reversa.astype(np.int32)
+
+        # Projeção equiretangular local (metros) para a heurística
+        lat = np.radians(np.asarray(no_lat, dtype=np.float64))
+        lng = np.radians(np.asarray(no_lng, dtype=np.float64))
+        lat_ref = float(lat.mean()) if len(lat) else 0.0
+        self.no_mx = RAIO_TERRA * lng * math.cos(lat_ref)
+        self.no_my = RAIO_TERRA * lat
+        self.fator_heuristica = self._fator_admissivel(self.pesos)
+        # Pesos sem trânsito, nunca escritos (ver atualizar_pesos)
+        self.pesos_originais = self.pesos
+
+        # Vistas do laço interno (ver vistas): as da topologia são
+        # compartilhadas com os motores de com_pesos, as dos pesos não
+        self._topologia = {
+            'offsets': vista(self.offsets),
+            'origens': vista(self.origens),
+            'destinos': vista(self.destinos),
+            'offsets_reversos': vista(self.offsets_reversos),
+            'arestas_reversas': vista(self.arestas_reversas),
+        }
+        self._montar_vistas()
+
+        # Hierarquia de contração opcional (contracao.HierarquiaContracao)
+        self.hierarquia = None
+        # Arcos com peso acima do original por trânsito ao vivo (ver atualizar_pesos)
+        self.arcos_alterados = set()
+
+        self._local = threading.local()
+
+    @classmethod
+    def do_snapshot(cls, snapshot):
+        return cls(snapshot.offsets, snapshot.origens, snapshot.destinos, snapshot.pesos,
+                   snapshot.no_ids, snapshot.no_lat, snapshot.no_lng)
+
+    @classmethod
+    def do_grafo(cls, grafo):
+        arrays = snapshot_grafo.arrays_do_grafo(grafo, None)
+        return cls(arrays['offsets'], arrays['origens'], arrays['destinos'], arrays['pesos'],
+                   arrays['no_ids'], arrays['no_lat'], arrays['no_lng'])
+
+    @classmethod
+    def de_arcos(cls, snapshot, origens, destinos, pesos, arestas_base, invertidas):
+        """Motor sobre um subconjunto (eventualmente invertido) das arestas do snapshot"""
+        origens = np.asarray(origens)
+        ordem = np.argsort(origens, kind='stable')
+        offsets = np.zeros(snapshot.num_nos + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origens, minlength=snapshot.num_nos), out=offsets[1:])
+        return cls(offsets, origens[ordem], np.asarray(destinos)[ordem], np.asarray(pesos)[ordem],
+                   snapshot.no_ids, snapshot.no_lat, snapshot.no_lng,
+                   np.asarray(arestas_base)[ordem], np.asarray(invertidas)[ordem])
+
+    def _montar_vistas(self, heuristica=True):
+        if heuristica:
+            self._hx = vista(self.no_mx * self.fator_heuristica)
+            self._hy = vista(self.no_my * self.fator_heuristica)
+        self._vistas = dict(self._topologia, pesos=vista(self.pesos), hx=self._hx, hy=self._hy)
+
+    def vistas(self):
+        """memoryviews do laço interno: offsets, origens, destinos, offsets_reversos, arestas_reversas, pesos, hx e hy"""
+        return self._vistas
+
+    def com_pesos(self, pesos):
+        """
+        Motor com a mesma topologia e outra coluna de pesos por arco (cenário).
+        Arrays, vistas e buffers por thread da topologia são compartilhados; só
+        os pesos, a escala da heurística e a hierarquia são próprios.
+        """
+        novo = copy.copy(self)
+        novo.pesos = novo.pesos_originais = np.asarray(pesos)
+        novo.fator_heuristica = novo._fator_admissivel(novo.pesos)
+        novo._montar_vistas()
+        novo.hierarquia = None
+        novo.arcos_alterados = set()
+        return novo
+
+    def atualizar_pesos(self, arcos, pesos, alterados):
+        """
+        Troca no lugar os pesos de alguns arcos (trânsito ao vivo, inf = fechado).
+        Os pesos só podem subir em relação aos originais: a heurística do A*
+        continua admissível e a hierarquia de contração, com os pesos originais,
+        vira limite inferior. `alterados` marca os arcos que ficam fora do original.
+
+        Os pesos originais, montados antes do fork e compartilhados entre os
+        workers, nunca são escritos: o trânsito vai para uma cópia própria do
+        processo, descartada quando todos os arcos voltam ao original.
+        """
+        if self.pesos is self.pesos_originais:
+            self.pesos = self.pesos_originais.copy()
+            self._montar_vistas(heuristica=False)
+        self.pesos[arcos] = pesos
+        marcados = self.arcos_alterados
+        for arco, alterado in zip(np.asarray(arcos).tolist(), np.asarray(alterados).tolist()):
+            if alterado:
+                marcados.add(arco)
+            else:
+                marcados.discard(arco)
+        if not marcados:
+            self.pesos = self.pesos_originais
+            self._montar_vistas(heuristica=False)
+
+    def _fator_admissivel(self, pesos):
+        """Menor razão peso / distância em linha reta entre todas as arestas"""
+        dx = self.no_mx[self.destinos] - self.no_mx[self.origens]
+        dy = self.no_my[self.destinos] - self.no_my[self.origens]
+        reta = np.hypot(dx, dy)
+        validas = reta > 1e-6
+        if not validas.any():
+            return 0.0
+        # Pequena folga para erros de arredondamento
+        return float(np.min(np.asarray(pesos)[validas] / reta[validas])) * 0.999
+
+    def _buffers(self):
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = BuffersBusca(self.num_nos)
+        return buffers
+
+    def _buffers_reversos(self):
+        buffers = getattr(self._local, 'buffers_reversos', None)
+        if buffers is None:
+            buffers = self._local.buffers_reversos = BuffersBusca(self.num_nos)
+        return buffers
+
+    def aresta_entre(self, u, v):
+        """Aresta u -> v de menor peso (índice no CSR) ou None"""
+        vistas = self._vistas
+        offsets, destinos, pesos = vistas['offsets'], vistas['destinos'], vistas['pesos']
+        melhor = None
+        for aresta in range(offsets[u], offsets[u + 1]):
+            if destinos[aresta] == v and (melhor is None or pesos[aresta] < pesos[melhor]):
+                melhor = aresta
+        return melhor
+
+    def dijkstra(self, origem, destino):
+        """
+        Caminho mínimo entre índices de nós.
+        Retorna (nós, arestas, distância, nós assentados); listas vazias se não houver caminho.
+        """
+        buffers = self._buffers()
+        geracao_atual = buffers.nova_geracao()
+        dist, pai_aresta, geracao = buffers.dist, buffers.pai_aresta, buffers.geracao
+        vistas = self._vistas
+        offsets, origens, destinos, pesos = vistas['offsets'], vistas['origens'], vistas['destinos'], vistas['pesos']
+
+        dist[origem] = 0.0
+        pai_aresta[origem] = -1
+        geracao[origem] = geracao_atual
+        fila_prioridade = [(0.0, origem)]
+        assentados = 0
+        encontrado = False
+
+        while fila_prioridade:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist[no_atual]:
+                continue
+            if distancia_atual == math.inf:
+                # Só restam nós atrás de vias fechadas (peso inf)
+                break
+            assentados += 1
+            if no_atual == destino:
+                encontrado = True
+                break
+
+            for aresta in range(offsets[no_atual], offsets[no_atual + 1]):
+                vizinho = destinos[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if geracao[vizinho] != geracao_atual or distancia < dist[vizinho]:
+                    geracao[vizinho] = geracao_atual
+                    dist[vizinho] = distancia
+                    pai_aresta[vizinho] = aresta
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+
+        if not encontrado:
+            return [], [], 0.0, assentados
+
+        arestas = []
+        aresta = pai_aresta[destino]
+        while aresta != -1:
+            arestas.append(aresta)
+            aresta = pai_aresta[origens[aresta]]
+        arestas.reverse()
+        nos = [origem] + [destinos[a] for a in arestas]
+        return nos, arestas, dist[destino], assentados
+
+    def um_para_muitos(self, origem, alvos):
+        """
+        Dijkstra a partir de `origem` que para assim que todos os `alvos` são
+        assentados. Retorna (custos, arestas por alvo, nós assentados); alvos
+        inalcançáveis ficam com custo inf e lista de arestas None.
+        """
+        buffers = self._buffers()
+        geracao_atual = buffers.nova_geracao()
+        dist, pai_aresta, geracao = buffers.dist, buffers.pai_aresta, buffers.geracao
+        vistas = self._vistas
+        offsets, origens, destinos, pesos = vistas['offsets'], vistas['origens'], vistas['destinos'], vistas['pesos']
+
+        dist[origem] = 0.0
+        pai_aresta[origem] = -1
+        geracao[origem] = geracao_atual
+        fila_prioridade = [(0.0, origem)]
+        pendentes = set(alvos)
+        assentados = 0
+
+        while fila_prioridade and pendentes:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist[no_atual]:
+                continue
+            if distancia_atual == math.inf:
+                break
+            assentados += 1
+            pendentes.discard(no_atual)
+
+            for aresta in range(offsets[no_atual], offsets[no_atual + 1]):
+                vizinho = destinos[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if geracao[vizinho] != geracao_atual or distancia < dist[vizinho]:
+                    geracao[vizinho] = geracao_atual
+                    dist[vizinho] = distancia
+                    pai_aresta[vizinho] = aresta
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+
+        custos, caminhos = [], []
+        for alvo in alvos:
+            if alvo in pendentes:
+                custos.append(math.inf)
+                caminhos.append(None)
+                continue
+            arestas = []
+            aresta = pai_aresta[alvo]
+            while aresta != -1:
+                arestas.append(aresta)
+                aresta = pai_aresta[origens[aresta]]
+            arestas.reverse()
+            custos.append(dist[alvo])
+            caminhos.append(arestas)
+        return custos, caminhos, assentados
+
+    def muitos_para_um(self, destino, fontes):
+        """
+        Dijkstra reverso a partir de `destino` até assentar todas as `fontes`.
+        Retorna (custos, arestas fonte -> destino por fonte, nós assentados),
+        no mesmo formato de um_para_muitos().
+        """
+        buffers = self._buffers_reversos()
+        geracao_atual = buffers.nova_geracao()
+        dist, pai_aresta, geracao = buffers.dist, buffers.pai_aresta, buffers.geracao
+        vistas = self._vistas
+        offsets_rev, arestas_rev = vistas['offsets_reversos'], vistas['arestas_reversas']
+        origens, destinos, pesos = vistas['origens'], vistas['destinos'], vistas['pesos']
+
+        dist[destino] = 0.0
+        pai_aresta[destino] = -1
+        geracao[destino] = geracao_atual
+        fila_prioridade = [(0.0, destino)]
+        pendentes = set(fontes)
+        assentados = 0
+
+        while fila_prioridade and pendentes:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist[no_atual]:
+                continue
+            if distancia_atual == math.inf:
+                break
+            assentados += 1
+            pendentes.discard(no_atual)
+
+            for indice in range(offsets_rev[no_atual], offsets_rev[no_atual + 1]):
+                aresta = arestas_rev[indice]
+                vizinho = origens[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if geracao[vizinho] != geracao_atual or distancia < dist[vizinho]:
+                    geracao[vizinho] = geracao_atual
+                    dist[vizinho] = distancia
+                    pai_aresta[vizinho] = aresta
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+
+        custos, caminhos = [], []
+        for fonte in fontes:
+            if fonte in pendentes:
+                custos.append(math.inf)
+                caminhos.append(None)
+                continue
+            # A árvore reversa já aponta no sentido da rota: fonte -> destino
+            arestas = []
+            aresta = pai_aresta[fonte]
+            while aresta != -1:
+                arestas.append(aresta)
+                aresta = pai_aresta[destinos[aresta]]
+            custos.append(dist[fonte])
+            caminhos.append(arestas)
+        return custos, caminhos, assentados
+
+    def alcance(self, origem, limite, pesos=None):
+        """
+        Dijkstra a partir de `origem` limitado ao custo `limite` (isócronas):
+        nada acima do limite entra na fila. `pesos` troca a coluna de pesos
+        por arco (lista, p.ex. metros). Retorna (nós, custos) na ordem em que
+        foram assentados.
+        """
+        buffers = self._buffers()
+        geracao_atual = buffers.nova_geracao()
+        dist, geracao = buffers.dist, buffers.geracao
+        vistas = self._vistas
+        offsets, destinos = vistas['offsets'], vistas['destinos']
+        if pesos is None:
+            pesos = vistas['pesos']
+
+        dist[origem] = 0.0
+        geracao[origem] = geracao_atual
+        fila_prioridade = [(0.0, origem)]
+        nos, custos = [], []
+
+        while fila_prioridade:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist[no_atual]:
+                continue
+            nos.append(no_atual)
+            custos.append(distancia_atual)
+
+            for aresta in range(offsets[no_atual], offsets[no_atual + 1]):
+                vizinho = destinos[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if distancia <= limite and (geracao[vizinho] != geracao_atual or distancia < dist[vizinho]):
+                    geracao[vizinho] = geracao_atual
+                    dist[vizinho] = distancia
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+        return nos, custos
+
+    def arvores_via(self, origem, destino, folga):
+        """
+        Árvores de caminhos mínimos para rotas alternativas (ver alternativas.py),
+        restritas aos nós que cabem numa rota de custo até (1 + folga) x ótimo.
+        Um Dijkstra de `origem` segue depois de assentar `destino` até esse
+        limite, descartando nós cuja distância em linha reta até o destino já o
+        estoura; a busca reversa a partir de `destino` só entra em nós assentados
+        pela primeira. Retorna (custo ótimo, vias, ida, volta, assentados): vias
+        são os nós assentados nas duas buscas dentro do limite, ida = (custos,
+        arcos pai) desde a origem e volta = (custos, arcos seguintes) até o
+        destino, listas por nó válidas até a próxima busca desta thread. Sem
+        caminho, custo inf e nenhuma via.
+        """
+        frente, tras = self._buffers(), self._buffers_reversos()
+        geracao_f, geracao_r = frente.nova_geracao(), tras.nova_geracao()
+        dist_f, pai_f, ger_f = frente.dist, frente.pai_aresta, frente.geracao
+        dist_r, pai_r, ger_r = tras.dist, tras.pai_aresta, tras.geracao
+        vistas = self._vistas
+        offsets, origens, destinos, pesos = vistas['offsets'], vistas['origens'], vistas['destinos'], vistas['pesos']
+        offsets_rev, arestas_rev = vistas['offsets_reversos'], vistas['arestas_reversas']
+        hx, hy = vistas['hx'], vistas['hy']
+        tx, ty = hx[destino], hy[destino]
+        hypot = math.hypot
+
+        dist_f[origem], pai_f[origem], ger_f[origem] = 0.0, -1, geracao_f
+        fila_prioridade = [(0.0, origem)]
+        limite = math.inf
+        podar = False
+        assentados = 0
+        while fila_prioridade:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist_f[no_atual]:
+                continue
+            if distancia_atual > limite:
+                break
+            assentados += 1
+            if no_atual == destino:
+                limite = distancia_atual * (1.0 + folga)
+                podar = True
+
+            for aresta in range(offsets[no_atual], offsets[no_atual + 1]):
+                vizinho = destinos[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if ger_f[vizinho] != geracao_f or distancia < dist_f[vizinho]:
+                    if podar and distancia + hypot(hx[vizinho] - tx, hy[vizinho] - ty) > limite:
+                        continue
+                    ger_f[vizinho] = geracao_f
+                    dist_f[vizinho] = distancia
+                    pai_f[vizinho] = aresta
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+
+        if not podar:
+            return math.inf, [], (dist_f, pai_f), (dist_r, pai_r), assentados
+
+        # Tudo o que ficou na fila passa do limite: nó alcançado dentro dele já está assentado
+        dist_r[destino], pai_r[destino], ger_r[destino] = 0.0, -1, geracao_r
+        fila_prioridade = [(0.0, destino)]
+        vias = []
+        while fila_prioridade:
+            distancia_atual, no_atual = heapq.heappop(fila_prioridade)
+            if distancia_atual > dist_r[no_atual]:
+                continue
+            vias.append(no_atual)
+
+            for indice in range(offsets_rev[no_atual], offsets_rev[no_atual + 1]):
+                aresta = arestas_rev[indice]
+                vizinho = origens[aresta]
+                distancia = distancia_atual + pesos[aresta]
+                if (ger_f[vizinho] == geracao_f and dist_f[vizinho] + distancia <= limite
+                        and (ger_r[vizinho] != geracao_r or distancia < dist_r[vizinho])):
+                    ger_r[vizinho] = geracao_r
+                    dist_r[vizinho] = distancia
+                    pai_r[vizinho] = aresta
+                    heapq.heappush(fila_prioridade, (distancia, vizinho))
+        return dist_f[destino], vias, (dist_f, pai_f), (dist_r, pai_r), assentados + len(vias)
+
+    def astar_bidirecional(self, origem, destino):
+        """
+        A* bidirecional com potenciais médios (p = (h_destino - h_origem) / 2),
+        que mantêm os custos reduzidos não negativos nos dois sentidos.
+        Mesmo retorno de dijkstra().
+        """
+        if origem == destino:
+            return [origem], [], 0.0, 1
+
+        frente, tras = self._buffers(), self._buffers_reversos()
+        geracao_f, geracao_r = frente.nova_geracao(), tras.nova_geracao()
+        dist_f, pai_f, ger_f = frente.dist, frente.pai_aresta, frente.geracao
+        dist_r, pai_r, ger_r = tras.dist, tras.pai_aresta, tras.geracao
+        vistas = self._vistas
+        offsets, origens, destinos, pesos = vistas['offsets'], vistas['origens'], vistas['destinos'], vistas['pesos']
+        offsets_rev, arestas_rev = vistas['offsets_reversos'], vistas['arestas_reversas']
+        hx, hy = vistas['hx'], vistas['hy']
+        sx, sy, tx, ty = hx[origem], hy[origem], hx[destino], hy[destino]
+        hypot = math.hypot
+
+        def potencial(no):
+            x, y = hx[no], hy[no]
+            return (hypot(x - tx, y - ty) - hypot(x - sx, y - sy)) * 0.5
+
+        dist_f[origem], pai_f[origem], ger_f[origem] = 0.0, -1, geracao_f
+        dist_r[destino], pai_r[destino], ger_r[destino] = 0.0, -1, geracao_r
+        fila_f = [(potencial(origem), 0.0, origem)]
+        fila_r = [(-potencial(destino), 0.0, destino)]
+        melhor = math.inf
+        encontro = -1
+        assentados = 0
+
+        while fila_f and fila_r:
+            # Critério de parada no grafo de custos reduzidos
+            if fila_f[0][0] + fila_r[0][0] >= melhor:
+                break
+
+            if fila_f[0][0] <= fila_r[0][0]:
+                _, distancia_atual, no_atual = heapq.heappop(fila_f)
+                if distancia_atual > dist_f[no_atual]:
+                    continue
+                assentados += 1
+                for aresta in range(offsets[no_atual], offsets[no_atual + 1]):
+                    vizinho = destinos[aresta]
+                    distancia = distancia_atual + pesos[aresta]
+                    if ger_f[vizinho] != geracao_f or distancia < dist_f[vizinho]:
+                        ger_f[vizinho] = geracao_f
+                        dist_f[vizinho] = distancia
+                        pai_f[vizinho] = aresta
+                        heapq.heappush(fila_f, (distancia + potencial(vizinho), distancia, vizinho))
+                        if ger_r[vizinho] == geracao_r and distancia + dist_r[vizinho] < melhor:
+                            melhor = distancia + dist_r[vizinho]
+                            encontro = vizinho
+            else:
+                _, distancia_atual, no_atual = heapq.heappop(fila_r)
+                if distancia_atual > dist_r[no_atual]:
+                    continue
+                assentados += 1
+                for indice in range(offsets_rev[no_atual], offsets_rev[no_atual + 1]):
+                    aresta = arestas_rev[indice]
+                    vizinho = origens[aresta]
+                    distancia = distancia_atual + pesos[aresta]
+                    if ger_r[vizinho] != geracao_r or distancia < dist_r[vizinho]:
+                        ger_r[vizinho] = geracao_r
+                        dist_r[vizinho] = distancia
+                        pai_r[vizinho] = aresta
+                        heapq.heappush(fila_r, (distancia - potencial(vizinho), distancia, vizinho))
+                        if ger_f[vizinho] == geracao_f and distancia + dist_f[vizinho] < melhor:
+                            melhor = distancia + dist_f[vizinho]
+                            encontro = vizinho
+
+        if encontro == -1:
+            return [], [], 0.0, assentados
+
+        arestas = []
+        aresta = pai_f[encontro]
+        while aresta != -1:
+            arestas.append(aresta)
+            aresta = pai_f[origens[aresta]]
+        arestas.reverse()
+        aresta = pai_r[encontro]
+        while aresta != -1:
+            arestas.append(aresta)
+            aresta = pai_r[destinos[aresta]]
+        nos = [origem] + [destinos[a] for a in arestas]
+        return nos, arestas, melhor, assentados
+
+    def rota(self, origem_no, destino_no, algoritmo='dijkstra'):
+        """Caminho mínimo entre ids OSM: retorna (nós OSM, arestas, distância, nós assentados)"""
+        if algoritmo not in ALGORITMOS:
+            raise ValueError(f"Algoritmo inválido: '{algoritmo}'")
+        if algoritmo == 'ch' and self.hierarquia is None:
+            raise ValueError('Hierarquia de contração não carregada para estes pesos')
+        origem = self.indice_nos.get(int(origem_no))
+        destino = self.indice_nos.get(int(destino_no))
+        if origem is None or destino is None:
+            return [], [], 0.0, 0
+        if algoritmo == 'ch':
+            arestas, distancia, assentados = self.hierarquia.consultar(origem, destino)
+            if arestas is None:
+                return [], [], 0.0, assentados
+            if self.arcos_alterados and not self.arcos_alterados.isdisjoint(arestas):
+                # Ótima com os pesos originais, mas passa por arco com trânsito: o
+                # custo atual pode ser maior que o de outra rota, refaz com A*
+                nos, arestas, distancia, mais = self.astar_bidirecional(origem, destino)
+                assentados += mais
+            else:
+                destinos = self._topologia['destinos']
+                nos = [origem] + [destinos[a] for a in arestas]
+        elif algoritmo == 'astar_bidirecional':
+            nos, arestas, distancia, assentados = self.astar_bidirecional(origem, destino)
+        else:
+            nos, arestas, distancia, assentados = self.dijkstra(origem, destino)
+        no_ids = self.no_ids
+        return [int(no_ids[i]) for i in nos], arestas, distancia, assentados
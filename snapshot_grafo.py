@@ -0,0 +1,401 @@
+"""
+Snapshot binário do grafo preparado de Maricá.
+
+O grafo baixado do OSM e projetado é gravado em um
+diretório de arrays NumPy (.npy) que podem ser mapeados em memória, junto com
+um manifesto JSON contendo a versão do formato, os parâmetros de construção e
+o checksum de cada arquivo. Os pesos randomizados são gerados aqui, de uma
+vez, a partir de `comprimento_original` e da semente dos parâmetros
+(cenarios.fatores_randomicos). Um snapshot de outra versão, de outra cidade ou
+com arquivos corrompidos é recusado e deve ser reconstruído.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+import cenarios
+import geometria_rotas
+
+log = logging.getLogger('rota')
+
+# Incrementar sempre que o conjunto ou o significado dos arrays mudar
+VERSAO_FORMATO = 5
+ARQUIVO_MANIFESTO = 'manifesto.json'
+# Separador (como no OSM) de arestas que juntam vias de nomes diferentes
+SEPARADOR_NOMES = ';'
+
+
+class SnapshotGrafo:
+    """Arrays do grafo preparado: coordenadas, adjacência CSR, pesos e geometria"""
+
+    def __init__(self, arrays, manifesto):
+        self.manifesto = manifesto
+        self.crs = manifesto.get('crs')
+
+        # Nós (índice inteiro 0..n-1)
+        self.no_ids = arrays['no_ids']
+        self.no_lat = arrays['no_lat']
+        self.no_lng = arrays['no_lng']
+        self.no_x = arrays['no_x']
+        self.no_y = arrays['no_y']
+
+        # Arestas em CSR ordenadas pelo nó de origem
+        self.offsets = arrays['offsets']
+        self.origens = arrays['origens']
+        self.destinos = arrays['destinos']
+        self.chaves = arrays['chaves']
+        self.pesos = arrays['pesos']
+        self.comprimento_original = arrays['comprimento_original']
+        self.fator_randomico = arrays['fator_randomico']
+
+        # Atributos OSM usados pelos perfis de transporte (ver modos.py)
+        self.highway = arrays['highway']
+        self.vocabulario_highway = arrays['vocabulario_highway']
+        self.maxspeed = arrays['maxspeed']
+        self.mao_unica = arrays['mao_unica']
+
+        # Nome da via (código 0 = sem nome), usado pelo autocompletar
+        self.nome = arrays['nome']
+        self.vocabulario_nomes = arrays['vocabulario_nomes']
+
+        # Vias OSM (way id) de cada aresta, ordenadas pelo id: uma aresta
+        # simplificada pode juntar várias vias (atualizações de trânsito por via)
+        self.via_osmid = arrays['via_osmid']
+        self.via_aresta = arrays['via_aresta']
+
+        # Geometria de cada aresta em (lat, lng), com offsets por aresta e o
+        # nível de simplificação (m) de cada ponto (ver geometria_rotas.py)
+        self.tem_geometria = arrays['tem_geometria']
+        self.geom_offsets = arrays['geom_offsets']
+        self.geom_coords = arrays['geom_coords']
+        self.geom_niveis = arrays['geom_niveis']
+
+        self._indice_nos = None
+
+    @property
+    def num_nos(self):
+        return len(self.no_ids)
+
+    @property
+    def num_arestas(self):
+        return len(self.destinos)
+
+    @property
+    def indice_nos(self):
+        """Mapa id OSM -> índice inteiro do nó"""
+        if self._indice_nos is None:
+            self._indice_nos = {int(no): i for i, no in enumerate(self.no_ids)}
+        return self._indice_nos
+
+    def arestas_da_via(self, osmid):
+        """Índices das arestas que percorrem a via OSM `osmid`"""
+        inicio, fim = np.searchsorted(self.via_osmid, [osmid, osmid + 1])
+        return np.asarray(self.via_aresta[inicio:fim])
+
+
+def _primeiro(valor):
+    """Atributos OSM simplificados podem vir como lista: usa o primeiro valor"""
+    if isinstance(valor, (list, tuple)):
+        return valor[0] if valor else None
+    return valor
+
+
+def _maxspeed_kmh(valor):
+    """Converte maxspeed OSM ('60', '40 mph', ['50', '60']) em km/h; NaN se desconhecido"""
+    valor = _primeiro(valor)
+    if valor is None:
+        return np.nan
+    texto = str(valor).strip().lower()
+    numero = ''.join(c for c in texto.split(' ')[0] if c.isdigit() or c == '.')
+    try:
+        velocidade = float(numero)
+    except ValueError:
+        return np.nan
+    return velocidade * 1.609344 if 'mph' in texto else velocidade
+
+
+def _nome_via(valor):
+    """Nome OSM da via; arestas simplificadas com vários nomes viram 'A;B'"""
+    if isinstance(valor, (list, tuple)):
+        return SEPARADOR_NOMES.join(str(v).strip() for v in valor if v)
+    return str(valor).strip() if valor else ''
+
+
+def arrays_do_grafo(grafo, grafo_proj, semente_pesos=None):
+    """
+    Converte o grafo NetworkX (e sua projeção) nos arrays do snapshot.
+    Com `semente_pesos`, os pesos são os comprimentos randomizados por essa
+    semente; sem ela, vêm dos atributos das arestas (length/fator_randomico).
+    """
+    no_ids = np.array(list(grafo.nodes()), dtype=np.int64)
+    indice = {no: i for i, no in enumerate(grafo.nodes())}
+
+    no_lat = np.array([grafo.nodes[no]['y'] for no in grafo.nodes()], dtype=np.float64)
+    no_lng = np.array([grafo.nodes[no]['x'] for no in grafo.nodes()], dtype=np.float64)
+    if grafo_proj is not None:
+        no_x = np.array([grafo_proj.nodes[no]['x'] for no in grafo.nodes()], dtype=np.float64)
+        no_y = np.array([grafo_proj.nodes[no]['y'] for no in grafo.nodes()], dtype=np.float64)
+    else:
+        no_x = no_lng.copy()
+        no_y = no_lat.copy()
+
+    arestas = list(grafo.edges(keys=True, data=True))
+    origens = np.array([indice[u] for u, _, _, _ in arestas], dtype=np.int32)
+    # Ordenação estável preserva a ordem de inserção entre arestas do mesmo nó
+    ordem = np.argsort(origens, kind='stable')
+    arestas = [arestas[i] for i in ordem]
+    origens = origens[ordem]
+
+    destinos = np.array([indice[v] for _, v, _, _ in arestas], dtype=np.int32)
+    chaves = np.array([k for _, _, k, _ in arestas], dtype=np.int32)
+    pesos = np.array([d.get('length', 100) for _, _, _, d in arestas], dtype=np.float64)
+    comprimento_original = np.array(
+        [d.get('length_original', d.get('length', 100)) for _, _, _, d in arestas], dtype=np.float64)
+    if semente_pesos is not None:
+        # Uma coluna alinhada ao índice de arestas, gerada de uma vez
+        fator_randomico = cenarios.fatores_randomicos(len(arestas), semente_pesos)
+        pesos = comprimento_original * fator_randomico
+    else:
+        fator_randomico = np.array([d.get('fator_randomico', 1.0) for _, _, _, d in arestas], dtype=np.float64)
+
+    offsets = np.zeros(len(no_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origens, minlength=len(no_ids)), out=offsets[1:])
+
+    # Código 0 reservado para arestas sem tag highway
+    tipos = [str(_primeiro(d.get('highway')) or '') for _, _, _, d in arestas]
+    vocabulario_highway = [''] + sorted(set(tipos) - {''})
+    codigo = {tipo: i for i, tipo in enumerate(vocabulario_highway)}
+    highway = np.array([codigo[t] for t in tipos], dtype=np.uint8)
+    maxspeed = np.array([_maxspeed_kmh(d.get('maxspeed')) for _, _, _, d in arestas], dtype=np.float32)
+    mao_unica = np.array([bool(_primeiro(d.get('oneway', False))) for _, _, _, d in arestas], dtype=bool)
+
+    # Mesmo esquema de vocabulário para os nomes das vias
+    nomes = [_nome_via(d.get('name')) for _, _, _, d in arestas]
+    vocabulario_nomes = [''] + sorted(set(nomes) - {''})
+    codigo_nome = {nome: i for i, nome in enumerate(vocabulario_nomes)}
+    nome = np.array([codigo_nome[n] for n in nomes], dtype=np.int32)
+
+    pares_vias = [(int(osmid), i) for i, (_, _, _, d) in enumerate(arestas)
+                  for osmid in (d['osmid'] if isinstance(d.get('osmid'), (list, tuple)) else [d.get('osmid')])
+                  if osmid is not None]
+    pares_vias.sort()
+    via_osmid = np.array([osmid for osmid, _ in pares_vias], dtype=np.int64)
+    via_aresta = np.array([i for _, i in pares_vias], dtype=np.int32)
+
+    tem_geometria = np.zeros(len(arestas), dtype=bool)
+    geom_offsets = np.zeros(len(arestas) + 1, dtype=np.int64)
+    blocos = []
+    for i, (u, v, _, dados) in enumerate(arestas):
+        if 'geometry' in dados:
+            tem_geometria[i] = True
+            coords = [(lat, lng) for lng, lat in dados['geometry'].coords]
+        else:
+            coords = [(no_lat[indice[u]], no_lng[indice[u]]), (no_lat[indice[v]], no_lng[indice[v]])]
+        blocos.append(np.asarray(coords, dtype=np.float64))
+        geom_offsets[i + 1] = geom_offsets[i] + len(coords)
+    geom_coords = np.concatenate(blocos) if blocos else np.zeros((0, 2), dtype=np.float64)
+    geom_niveis = geometria_rotas.niveis_douglas_peucker(geom_offsets, geom_coords).astype(np.float32)
+
+    return {
+        'no_ids': no_ids,
+        'no_lat': no_lat,
+        'no_lng': no_lng,
+        'no_x': no_x,
+        'no_y': no_y,
+        'offsets': offsets,
+        'origens': origens,
+        'destinos': destinos,
+        'chaves': chaves,
+        'pesos': pesos,
+        'comprimento_original': comprimento_original,
+        'fator_randomico': fator_randomico,
+        'highway': highway,
+        'vocabulario_highway': np.array(vocabulario_highway),
+        'maxspeed': maxspeed,
+        'mao_unica': mao_unica,
+        'nome': nome,
+        'vocabulario_nomes': np.array(vocabulario_nomes),
+        'via_osmid': via_osmid,
+        'via_aresta': via_aresta,
+        'tem_geometria': tem_geometria,
+        'geom_offsets': geom_offsets,
+        'geom_coords': geom_coords,
+        'geom_niveis': geom_niveis,
+    }
+
+
+def _sha1_arquivo(caminho):
+    h = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _checksum_manifesto(manifesto):
+    """Checksum global sobre versão, parâmetros e checksums dos arquivos"""
+    h = hashlib.sha1()
+    h.update(str(manifesto['versao_formato']).encode())
+    h.update(json.dumps(manifesto['parametros'], sort_keys=True).encode())
+    for nome in sorted(manifesto['arquivos']):
+        h.update(nome.encode())
+        h.update(manifesto['arquivos'][nome]['sha1'].encode())
+    return h.hexdigest()
+
+
+def gravar_arrays(diretorio, arrays, versao_formato, parametros, extras=None):
+    """Grava arrays .npy e o manifesto com checksums em `diretorio` de forma atômica"""
+    temporario = diretorio.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    arquivos = {}
+    for nome, array in arrays.items():
+        caminho = os.path.join(temporario, f'{nome}.npy')
+        np.save(caminho, np.ascontiguousarray(array))
+        arquivos[nome] = {
+            'sha1': _sha1_arquivo(caminho),
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+        }
+
+    manifesto = {
+        'versao_formato': versao_formato,
+        'parametros': parametros,
+        'criado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    manifesto.update(extras or {})
+    manifesto['arquivos'] = arquivos
+    manifesto['checksum'] = _checksum_manifesto(manifesto)
+    with open(os.path.join(temporario, ARQUIVO_MANIFESTO), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2, ensure_ascii=False)
+
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.replace(temporario, diretorio)
+    return manifesto
+
+
+def ler_arrays(diretorio, versao_formato, parametros=None, verificar=True, rotulo='snapshot'):
+    """
+    Lê arrays gravados por gravar_arrays() mapeando-os em memória (somente leitura).
+    Retorna (arrays, manifesto), ou None se não existirem, forem de outra
+    versão/parâmetros ou se algum checksum não conferir.
+    """
+    caminho_manifesto = os.path.join(diretorio, ARQUIVO_MANIFESTO)
+    if not os.path.exists(caminho_manifesto):
+        return None
+
+    try:
+        with open(caminho_manifesto, encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError) as e:
+        log.warning(f"⚠️ Manifesto do {rotulo} ilegível: {e}")
+        return None
+
+    if manifesto.get('versao_formato') != versao_formato:
+        log.warning(f"⚠️ {rotulo.capitalize()} com formato v{manifesto.get('versao_formato')}, esperado v{versao_formato}")
+        return None
+    if parametros is not None and manifesto.get('parametros') != parametros:
+        log.warning(f"⚠️ {rotulo.capitalize()} construído com outros parâmetros: {manifesto.get('parametros')}")
+        return None
+    if manifesto.get('checksum') != _checksum_manifesto(manifesto):
+        log.warning(f"⚠️ Checksum do manifesto do {rotulo} não confere")
+        return None
+
+    arrays = {}
+    for nome, info in manifesto['arquivos'].items():
+        caminho = os.path.join(diretorio, f'{nome}.npy')
+        if not os.path.exists(caminho):
+            log.warning(f"⚠️ Arquivo ausente no {rotulo}: {nome}.npy")
+            return None
+        if verificar and _sha1_arquivo(caminho) != info['sha1']:
+            log.warning(f"⚠️ Checksum de {nome}.npy não confere")
+            return None
+        arrays[nome] = np.load(caminho, mmap_mode='r')
+    return arrays, manifesto
+
+
+def salvar_snapshot(grafo, grafo_proj, diretorio, parametros):
+    """Grava o snapshot do grafo em `diretorio` de forma atômica"""
+    inicio = time.time()
+    arrays = arrays_do_grafo(grafo, grafo_proj, parametros.get('semente_pesos'))
+    manifesto = gravar_arrays(diretorio, arrays, VERSAO_FORMATO, parametros, {
+        'crs': str(grafo_proj.graph.get('crs')) if grafo_proj is not None else None,
+        'num_nos': int(len(arrays['no_ids'])),
+        'num_arestas': int(len(arrays['destinos'])),
+    })
+    log.info(f"💾 Snapshot gravado em {diretorio} ({time.time() - inicio:.2f}s)")
+    return manifesto
+
+
+def carregar_snapshot(diretorio, parametros=None, verificar=True):
+    """
+    Carrega o snapshot mapeando os arrays em memória (somente leitura).
+    Retorna None se o snapshot não existir, for de outra versão/parâmetros
+    ou se algum checksum não conferir.
+    """
+    inicio = time.time()
+    lido = ler_arrays(diretorio, VERSAO_FORMATO, parametros, verificar)
+    if lido is None:
+        return None
+
+    snapshot = SnapshotGrafo(*lido)
+    log.info(f"⚡ Snapshot carregado: {snapshot.num_nos} nós, {snapshot.num_arestas} arestas "
+          f"({(time.time() - inicio) * 1000:.0f} ms)")
+    return snapshot
+
+
+def grafos_do_snapshot(snapshot):
+    """Reconstrói o grafo NetworkX (lat/lng) e a projeção de nós usados pelo app"""
+    import networkx as nx
+
+    try:
+        import shapely
+    except ImportError:
+        shapely = None
+
+    no_ids = snapshot.no_ids.tolist()
+    grafo = nx.MultiDiGraph(crs='epsg:4326')
+    grafo.add_nodes_from(
+        (no, {'x': x, 'y': y})
+        for no, x, y in zip(no_ids, snapshot.no_lng.tolist(), snapshot.no_lat.tolist()))
+
+    geometrias = [None] * snapshot.num_arestas
+    if shapely is not None:
+        com_geometria = np.flatnonzero(snapshot.tem_geometria)
+        for i in com_geometria.tolist():
+            trecho = snapshot.geom_coords[snapshot.geom_offsets[i]:snapshot.geom_offsets[i + 1]]
+            geometrias[i] = shapely.LineString(trecho[:, ::-1])
+
+    vocabulario_nomes = snapshot.vocabulario_nomes.tolist()
+    vias = [[] for _ in range(snapshot.num_arestas)]
+    for osmid, aresta in zip(snapshot.via_osmid.tolist(), snapshot.via_aresta.tolist()):
+        vias[aresta].append(osmid)
+    arestas = []
+    for i, (u, v, k, peso, original, fator, nome) in enumerate(zip(
+            snapshot.origens.tolist(), snapshot.destinos.tolist(), snapshot.chaves.tolist(),
+            snapshot.pesos.tolist(), snapshot.comprimento_original.tolist(),
+            snapshot.fator_randomico.tolist(), snapshot.nome.tolist())):
+        dados = {'length': peso, 'length_original': original, 'fator_randomico': fator}
+        if nome:
+            partes = vocabulario_nomes[nome].split(SEPARADOR_NOMES)
+            dados['name'] = partes if len(partes) > 1 else partes[0]
+        if vias[i]:
+            dados['osmid'] = vias[i] if len(vias[i]) > 1 else vias[i][0]
+        if geometrias[i] is not None:
+            dados['geometry'] = geometrias[i]
+        arestas.append((no_ids[u], no_ids[v], k, dados))
+    grafo.add_edges_from(arestas)
+
+    # A projeção só é usada para busca de nó mais próximo: basta ter os nós
+    grafo_proj = nx.MultiDiGraph(crs=snapshot.crs)
+    grafo_proj.add_nodes_from(
+        (no, {'x': x, 'y': y})
+        for no, x, y in zip(no_ids, snapshot.no_x.tolist(), snapshot.no_y.tolist()))
+
+    return grafo, grafo_proj
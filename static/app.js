@@ -11,6 +11,10 @@ let destinoCoords = null;
 let notificacaoAtual = null;
 let modoTransporte = 'driving'; // Modo padrão
 let rotasCalculadas = {}; // Armazenar rotas para todos os modos
+let camadasAlternativas = []; // Rotas não selecionadas do modo atual, em cinza
+let rotaSelecionada = 0; // 0 = mais rápida, i = alternativas[i - 1]
+const ROTAS_POR_MODO = 3; // Rotas pedidas ao servidor, contando a mais rápida
+let zoomRotas = {}; // Zoom para o qual a geometria de cada modo foi simplificada
 
 // Função para mostrar notificações
 function mostrarNota(mensagem, tipo = 'info') {
@@ -88,6 +92,13 @@ function inicializarMapa() {
         handleMapClick(e);
     });
     
+    // Zoom além do detalhe da geometria recebida: pede a rota de novo, menos simplificada
+    mapa.on('zoomend', function() {
+        if (rotasCalculadas[modoTransporte] && mapa.getZoom() > zoomRotas[modoTransporte] + 1) {
+            calcularRotaSelecionada(true);
+        }
+    });
+    
     // Carregar pontos de referência
     carregarPontosReferencia();
     
@@ -292,15 +303,48 @@ function calcularRotasTodosModos() {
     
     // Limpar rotas anteriores
     rotasCalculadas = {};
+    zoomRotas = {};
     
     // Calcular rota para o modo selecionado
     calcularRotaSelecionada();
 }
 
+// Decodifica uma polilinha no formato do Google (encoded polyline) em [[lat, lng], ...]
+function decodificarPolilinha(texto, precisao = 5) {
+    const fator = Math.pow(10, precisao);
+    const coords = [];
+    let indice = 0, lat = 0, lng = 0;
+    
+    while (indice < texto.length) {
+        const deltas = [];
+        for (let k = 0; k < 2; k++) {
+            let resultado = 0, deslocamento = 0, byte;
+            do {
+                byte = texto.charCodeAt(indice++) - 63;
+                resultado |= (byte & 0x1f) << deslocamento;
+                deslocamento += 5;
+            } while (byte >= 0x20);
+            deltas.push(resultado & 1 ? ~(resultado >> 1) : resultado >> 1);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        coords.push([lat / fator, lng / fator]);
+    }
+    return coords;
+}
+
 // Função para calcular rota para o modo selecionado
-function calcularRotaSelecionada() {
+// manterSelecao: refaz a rota já exibida (p.ex. com mais detalhe após zoom) sem voltar à mais rápida
+function calcularRotaSelecionada(manterSelecao = false) {
     if (!origemCoords || !destinoCoords) return;
     
+    // Geometria simplificada para o zoom em que a rota inteira cabe no mapa (ou o atual, se maior)
+    const zoom = Math.max(
+        mapa.getBoundsZoom(L.latLngBounds([origemCoords, destinoCoords]).pad(0.1)),
+        manterSelecao ? mapa.getZoom() : 0
+    );
+    const modo = modoTransporte;
+    
     fetch('/api/calcular_rota', {
         method: 'POST',
         headers: {
@@ -311,7 +355,10 @@ function calcularRotaSelecionada() {
             origem_lng: origemCoords.lng,
             destino_lat: destinoCoords.lat,
             destino_lng: destinoCoords.lng,
-            modo: modoTransporte
+            modo: modo,
+            alternativas: ROTAS_POR_MODO,
+            formato: 'polyline',
+            zoom: zoom
         })
     })
     .then(response => response.json())
@@ -323,10 +370,23 @@ function calcularRotaSelecionada() {
         console.log('Primeiras coordenadas:', data.caminho ? data.caminho.slice(0, 5) : 'Sem caminho');
         
         if (data.sucesso) {
-            // Armazenar rota calculada
-            rotasCalculadas[modoTransporte] = data;
-            exibirRota(data);
-            exibirComparacaoRotas();
+            // Armazenar rota calculada, já decodificada
+            data.caminho = decodificarPolilinha(data.caminho);
+            (data.alternativas || []).forEach(rota => {
+                rota.caminho = decodificarPolilinha(rota.caminho);
+            });
+            rotasCalculadas[modo] = data;
+            zoomRotas[modo] = zoom;
+            if (modo !== modoTransporte) return;
+            if (manterSelecao) {
+                // Só troca o desenho, sem reajustar o mapa ao zoom atual
+                const rotas = rotasDoModo(data);
+                rotaSelecionada = Math.min(rotaSelecionada, rotas.length - 1);
+                caminhoRota.setLatLngs(rotas[rotaSelecionada].caminho);
+                exibirAlternativas(rotas);
+            } else {
+                selecionarRota(0);
+            }
         } else {
             mostrarNota(`❌ Erro: ${data.mensagem || 'Erro ao calcular rota'}`, 'error');
         }
@@ -338,6 +398,50 @@ function calcularRotaSelecionada() {
     });
 }
 
+// Rotas de um resultado do servidor: a mais rápida e as alternativas
+function rotasDoModo(dados) {
+    const alternativas = (dados.alternativas || []).map(rota => ({
+        ...rota,
+        algoritmo: dados.algoritmo,
+        nos_assentados: dados.nos_assentados
+    }));
+    return [dados, ...alternativas];
+}
+
+// Função para selecionar uma das rotas do modo atual
+function selecionarRota(indice) {
+    const dados = rotasCalculadas[modoTransporte];
+    if (!dados) return;
+    
+    const rotas = rotasDoModo(dados);
+    rotaSelecionada = Math.min(indice, rotas.length - 1);
+    exibirRota(rotas[rotaSelecionada]);
+    exibirAlternativas(rotas);
+    exibirComparacaoRotas();
+}
+
+// Função para exibir as rotas não selecionadas em cinza, clicáveis
+function exibirAlternativas(rotas) {
+    camadasAlternativas.forEach(camada => mapa.removeLayer(camada));
+    camadasAlternativas = [];
+    
+    rotas.forEach((rota, i) => {
+        if (i === rotaSelecionada) return;
+        const camada = L.polyline(rota.caminho, {
+            color: '#6c757d',
+            weight: 6,
+            opacity: 0.6
+        }).addTo(mapa);
+        camada.bindTooltip(`${i === 0 ? 'Mais rápida' : 'Alternativa ' + i}: ${calcularTempoEstimado(rota.distancia / 1000, modoTransporte, rota.duracao)}`);
+        camada.on('click', () => selecionarRota(i));
+        camadasAlternativas.push(camada);
+    });
+    
+    if (caminhoRota) {
+        caminhoRota.bringToFront();
+    }
+}
+
 // Função para exibir rota no mapa
 function exibirRota(dados) {
     console.log('=== exibirRota ===');
@@ -500,7 +604,7 @@ function exibirComparacaoRotas() {
         if (rotasCalculadas[modo]) {
             const rota = rotasCalculadas[modo];
             const distanciaKm = (rota.distancia / 1000).toFixed(1);
-            const tempoEstimado = calcularTempoEstimado(distanciaKm, modo);
+            const tempoEstimado = calcularTempoEstimado(distanciaKm, modo, rota.duracao);
             
             const card = document.createElement('div');
             card.className = `route-card ${modoTransporte === modo ? 'active' : ''}`;
@@ -517,27 +621,62 @@ function exibirComparacaoRotas() {
             
             card.addEventListener('click', () => {
                 modoTransporte = modo;
-                exibirRota(rota);
                 atualizarSeletorModo();
-                exibirComparacaoRotas();
+                selecionarRota(0);
             });
             
             routeCards.appendChild(card);
         }
     });
+    
+    // Rotas alternativas do modo atual
+    const rotas = rotasCalculadas[modoTransporte] ? rotasDoModo(rotasCalculadas[modoTransporte]) : [];
+    if (rotas.length < 2) return;
+    
+    const titulo = document.createElement('h6');
+    titulo.className = 'route-cards-title';
+    titulo.innerHTML = `<i class="fas fa-code-branch"></i> Rotas alternativas (${titulos[modoTransporte]})`;
+    routeCards.appendChild(titulo);
+    
+    rotas.forEach((rota, i) => {
+        const distanciaKm = (rota.distancia / 1000).toFixed(1);
+        const diferencaMin = Math.round((rota.duracao - rotas[0].duracao) / 60);
+        
+        const card = document.createElement('div');
+        card.className = `route-card ${rotaSelecionada === i ? 'active' : ''}`;
+        card.innerHTML = `
+            <div class="route-card-header">
+                <h6>${i === 0 ? '⭐ Mais rápida' : `🔀 Alternativa ${i}`}</h6>
+                <span class="route-time">${calcularTempoEstimado(distanciaKm, modoTransporte, rota.duracao)}</span>
+            </div>
+            <div class="route-card-body">
+                <p><i class="fas fa-ruler"></i> ${distanciaKm} km</p>
+                ${i === 0 ? '' : `<p><i class="fas fa-clock"></i> +${diferencaMin} min · ${Math.round(rota.sobreposicao * 100)}% em comum com a mais rápida</p>`}
+            </div>
+        `;
+        
+        card.addEventListener('click', () => selecionarRota(i));
+        
+        routeCards.appendChild(card);
+    });
 }
 
 // Função para calcular tempo estimado
-function calcularTempoEstimado(distanciaKm, modo) {
+// Usa a duração calculada pelo servidor (segundos) quando disponível
+function calcularTempoEstimado(distanciaKm, modo, duracaoSegundos) {
     const velocidades = {
         driving: 30,    // km/h médio em cidade
         walking: 5,     // km/h médio caminhando
         cycling: 15     // km/h médio bicicleta
     };
     
-    const velocidade = velocidades[modo] || 30;
-    const tempoHoras = distanciaKm / velocidade;
-    const tempoMinutos = Math.round(tempoHoras * 60);
+    let tempoMinutos;
+    if (typeof duracaoSegundos === 'number') {
+        tempoMinutos = Math.round(duracaoSegundos / 60);
+    } else {
+        const velocidade = velocidades[modo] || 30;
+        tempoMinutos = Math.round(distanciaKm / velocidade * 60);
+    }
     
     if (tempoMinutos < 60) {
         return `${tempoMinutos} min`;
@@ -590,8 +729,16 @@ function exibirInformacoesRota(dados) {
             </div>
         </div>
         <hr>
+        <div class="row">
+            <div class="col-12">
+                <small><i class="fas fa-clock text-warning"></i> Tempo estimado</small><br>
+                <strong>${calcularTempoEstimado(dados.distancia / 1000, modoTransporte, dados.duracao)}</strong>
+            </div>
+        </div>
+        <hr>
         <div class="text-center">
-            <small class="text-muted">Algoritmo: Dijkstra</small>
+            <small class="text-muted">Algoritmo: ${{astar_bidirecional: 'A* bidirecional', ch: 'Contraction Hierarchies', alternativas: 'Dijkstra (rotas alternativas)'}[dados.algoritmo] || 'Dijkstra'}
+                · ${dados.nos_assentados ?? '-'} nós assentados</small>
         </div>
     `;
     
@@ -616,6 +763,8 @@ function limparRota() {
         mapa.removeLayer(caminhoRota);
         caminhoRota = null;
     }
+    camadasAlternativas.forEach(camada => mapa.removeLayer(camada));
+    camadasAlternativas = [];
     
     // Limpar coordenadas
     origemCoords = null;
@@ -635,6 +784,7 @@ function limparRota() {
     
     // Limpar rotas calculadas
     rotasCalculadas = {};
+    zoomRotas = {};
     
     mostrarNota('🗺️ Mapa limpo! Selecione um novo ponto de origem.', 'info');
 }
@@ -691,6 +841,57 @@ function buscarEndereco(tipo) {
     });
 }
 
+// Autocompletar endereços pelo índice local de vias e pontos turísticos
+function configurarAutocompletar(tipo) {
+    const input = document.getElementById(tipo + 'Busca');
+    const lista = document.getElementById(tipo + 'Sugestoes');
+    let temporizador = null;
+    
+    input.addEventListener('input', function() {
+        clearTimeout(temporizador);
+        const query = input.value.trim();
+        if (query.length < 2) {
+            lista.style.display = 'none';
+            return;
+        }
+        temporizador = setTimeout(() => {
+            fetch('/api/autocompletar?q=' + encodeURIComponent(query))
+                .then(response => response.json())
+                .then(data => {
+                    // Ignora respostas atrasadas de consultas anteriores
+                    if (input.value.trim() !== query) return;
+                    lista.innerHTML = '';
+                    if (!data.sucesso || data.resultados.length === 0) {
+                        lista.style.display = 'none';
+                        return;
+                    }
+                    data.resultados.forEach(resultado => {
+                        const item = document.createElement('div');
+                        item.className = 'sugestao';
+                        const icone = resultado.tipo === 'ponto' ? 'fa-star' : 'fa-road';
+                        item.innerHTML = `<i class="fas ${icone} text-muted"></i> `;
+                        item.appendChild(document.createTextNode(resultado.nome));
+                        item.addEventListener('mousedown', () => {
+                            input.value = resultado.nome;
+                            lista.style.display = 'none';
+                            if (tipo === 'origem') {
+                                definirOrigem(resultado.lat, resultado.lng);
+                            } else {
+                                definirDestino(resultado.lat, resultado.lng);
+                            }
+                            mapa.setView([resultado.lat, resultado.lng], 16);
+                        });
+                        lista.appendChild(item);
+                    });
+                    lista.style.display = 'block';
+                })
+                .catch(error => console.error('Erro ao autocompletar:', error));
+        }, 150);
+    });
+    
+    input.addEventListener('blur', () => { lista.style.display = 'none'; });
+}
+
 // Adicionar animação CSS
 const style = document.createElement('style');
 style.textContent = `
@@ -785,6 +986,12 @@ style.textContent = `
     .route-card-body p {
         margin: 2px 0;
     }
+    
+    .route-cards-title {
+        margin: 12px 0 8px;
+        font-size: 13px;
+        color: #444;
+    }
 `;
 document.head.appendChild(style);
 
@@ -801,6 +1008,9 @@ document.addEventListener('DOMContentLoaded', function() {
         if (e.key === 'Enter') buscarEndereco('destino');
     });
     
+    configurarAutocompletar('origem');
+    configurarAutocompletar('destino');
+    
     // Configurar seletor de modo de transporte
     document.querySelectorAll('.transport-option').forEach(option => {
         option.addEventListener('click', function() {
@@ -815,8 +1025,7 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Se já houver rota calculada para este modo, exibi-la
             if (rotasCalculadas[modoTransporte]) {
-                exibirRota(rotasCalculadas[modoTransporte]);
-                exibirComparacaoRotas();
+                selecionarRota(0);
             } else if (origemCoords && destinoCoords) {
                 // Caso contrário, calcular rota
                 calcularRotaSelecionada();
@@ -878,16 +1087,16 @@ function mostrarInfoAlgoritmo() {
                     <div class="alert alert-info">
                         <h6><i class="fas fa-info-circle"></i> Sobre o Algoritmo</h6>
                         <p class="mb-0">
-                            O algoritmo de Dijkstra é um algoritmo clássico para encontrar o caminho mais curto 
-                            em grafos com arestas ponderadas. Nesta implementação, utilizamos uma fila de prioridade 
-                            (heap) para otimizar o desempenho, resultando em complexidade O((V + E) log V).
+                            As rotas usam por padrão <strong>${info.algoritmo}</strong> sobre o grafo em arrays (CSR);
+                            cada pedido pode escolher ${info.algoritmos.join(', ')}. Dijkstra e A* bidirecional usam
+                            uma fila de prioridade (heap), com complexidade O((V + E) log V).
+                            Hierarquia de contração carregada para: ${info.modos_com_ch.length ? info.modos_com_ch.join(', ') : 'nenhum modo'}.
                         </p>
                     </div>
                     <div class="alert alert-warning">
-                        <h6><i class="fas fa-exclamation-triangle"></i> Randomização</h6>
+                        <h6><i class="fas fa-exclamation-triangle"></i> Cenário de pesos</h6>
                         <p class="mb-0">
-                            Os pesos das arestas foram randomizados em ±20% do valor original para demonstrar 
-                            a robustez do algoritmo com diferentes configurações de peso.
+                            Cenário ativo <strong>${info.cenario_ativo}</strong>: ${info.cenario_descricao}.
                         </p>
                     </div>
                 `;
@@ -0,0 +1,62 @@
+"""
+Fixtures dos testes: o app carregado sobre uma grade sintética, sem acesso à rede.
+
+A grade (bench_motor_rotas.grafo_grade), com nomes nas ruas horizontais, vira
+um snapshot num diretório temporário, com a hierarquia de contração do modo
+driving, uma vez por sessão.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+# Antes de importar o app: matriz no próprio processo, logs só de aviso
+os.environ['ROTA_MATRIZ_PROCESSOS'] = '1'
+os.environ.setdefault('ROTA_LOG_NIVEL', 'WARNING')
+
+import numpy as np
+import osmnx as ox
+import pytest
+
+import app as aplicacao
+import bench_motor_rotas
+import contracao
+import snapshot_grafo
+
+LADO_GRADE = 20
+SEMENTE_GRADE = 7
+# Nomes das ruas da grade, um por linha (só as arestas horizontais), para o autocompletar
+NOMES_RUAS = ('Rua Abreu Rangel', 'Avenida Roberto Silveira', 'Rua Ribeiro de Almeida', 'Rua Domício da Gama')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Módulo app inicializado sobre a grade, com a CH do driving"""
+    diretorio = str(tmp_path_factory.mktemp('grade'))
+    parametros = dict(aplicacao.PARAMETROS_SNAPSHOT, semente_pesos=SEMENTE_GRADE)
+    grafo = bench_motor_rotas.grafo_grade(LADO_GRADE, SEMENTE_GRADE)
+    for u, v, dados in grafo.edges(data=True):
+        if u // LADO_GRADE == v // LADO_GRADE:
+            dados['name'] = NOMES_RUAS[u // LADO_GRADE % len(NOMES_RUAS)]
+    snapshot_grafo.salvar_snapshot(grafo, ox.project_graph(grafo), diretorio, parametros)
+    aplicacao.SNAPSHOT_DIR = diretorio
+    aplicacao.PARAMETROS_SNAPSHOT = parametros
+    assert aplicacao.inicializar_sistema(usar_snapshot=True)
+    motor = aplicacao.visoes['driving'].motor
+    motor.hierarquia = contracao.construir_para_motor(motor, diretorio, 'driving')
+    yield aplicacao
+    aplicacao.servico_matriz.encerrar()
+
+
+@pytest.fixture
+def cliente(app):
+    """Cliente de teste do Flask; restaura o trânsito e esvazia o cache de rotas ao final"""
+    yield app.app.test_client()
+    app.trafego_ao_vivo.gravar([(modo, np.arange(app.snapshot.num_arestas), 1.0)
+                                for modo in app.trafego_ao_vivo.modos])
+    app.sincronizar_trafego()
+    app.cache_resultados.nova_versao()
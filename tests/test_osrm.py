@@ -0,0 +1,113 @@
+"""Cliente OSRM contra o servidor falso (benchmarks/osrm_falso.py), limites do upstream e cache de geocodificação"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import cache_geocodificacao
+import cliente_osrm
+import io_assincrono
+import osrm_falso
+
+WAYPOINTS = [(-22.95, -42.90), (-22.94, -42.89)]
+
+
+@pytest.fixture
+def servidor():
+    servidor, url = osrm_falso.iniciar_em_thread(latencia=0)
+    yield servidor, url
+    servidor.shutdown()
+
+
+def test_resposta_sem_rota_nao_entra_no_cache(servidor):
+    servidor, url = servidor
+    cliente = cliente_osrm.ClienteOSRM(url)
+    servidor.sem_rotas = True
+    assert not cliente.rota('driving', WAYPOINTS)['sucesso']
+    servidor.sem_rotas = False
+    resultado = cliente.rota('driving', WAYPOINTS)
+    assert resultado['sucesso'] and resultado['fonte'] == 'osrm'
+    assert servidor.atendidos == 2
+    assert cliente.rota('driving', WAYPOINTS)['sucesso']
+    assert servidor.atendidos == 2
+
+
+def test_vaga_so_volta_quando_a_thread_termina():
+    upstream = io_assincrono.Upstream('lento', max_simultaneos=1, timeout=0.1)
+    laco = io_assincrono.LacoAssincrono(upstream)
+    liberar = threading.Event()
+    with pytest.raises(io_assincrono.TempoEsgotado) as expirado:
+        laco.chamar('lento', liberar.wait, 5)
+    assert not isinstance(expirado.value, io_assincrono.ExpirouNaFila)
+    # A primeira chamada segue na thread: a segunda não passa da fila
+    with pytest.raises(io_assincrono.ExpirouNaFila):
+        laco.chamar('lento', time.sleep, 0)
+    assert upstream.em_andamento == 1
+    liberar.set()
+    assert laco.chamar('lento', sum, [1, 2]) == 3
+    assert upstream.em_andamento == 0
+
+
+def test_expirado_em_andamento_nao_repete_o_fallback(app, monkeypatch):
+    chamadas = []
+
+    def rota_local(profile, waypoints):
+        chamadas.append(profile)
+        time.sleep(0.3)
+        return {'sucesso': True, 'fonte': 'local'}
+
+    # Porta sem servidor: o cliente cai no fallback local dentro da thread do upstream
+    cliente = cliente_osrm.ClienteOSRM('http://127.0.0.1:9', rota_local=rota_local, timeout=1)
+    laco = io_assincrono.LacoAssincrono(io_assincrono.Upstream('osrm', max_simultaneos=1, timeout=0.1))
+    monkeypatch.setattr(app, 'cliente_osrm_app', cliente)
+    monkeypatch.setattr(app, 'laco_io', laco)
+    resultado = app.chamar_osrm_route('driving', WAYPOINTS)
+    assert not resultado['sucesso']
+    time.sleep(0.5)
+    assert chamadas == ['driving']
+
+
+def test_upstream_cria_o_pool_so_no_laco():
+    upstream = io_assincrono.Upstream('unico', max_simultaneos=1)
+    assert upstream._executor is None
+    laco = io_assincrono.LacoAssincrono(upstream)
+    assert laco.chamar('unico', sum, [1, 2]) == 3
+    executor = upstream._executor
+    # Como depois de um fork: o pool antigo é encerrado e trocado
+    laco._pid = None
+    assert laco.chamar('unico', sum, [3, 4]) == 7
+    assert upstream._executor is not executor and executor._shutdown
+
+
+class LacoFalso:
+    """Registra as chamadas ao upstream no lugar do Nominatim"""
+
+    def __init__(self, resposta):
+        self.resposta = resposta
+        self.chamadas = []
+
+    def chamar(self, nome, funcao, *args):
+        self.chamadas.append((nome, args))
+        return self.resposta
+
+
+def test_acerto_no_cache_de_geocodificacao_nao_chama_o_nominatim(app, cliente, monkeypatch, tmp_path):
+    local = SimpleNamespace(address='Rua Abreu Rangel, Maricá', latitude=-22.95, longitude=-42.90)
+    laco = LacoFalso(local)
+    monkeypatch.setattr(app, 'laco_io', laco)
+    monkeypatch.setattr(app, 'cache_geocodificacao_app', cache_geocodificacao.CacheGeocodificacao(str(tmp_path)))
+
+    def reverso(lat, lng):
+        return cliente.post('/api/reverse_geocode', json={'lat': lat, 'lng': lng}).json
+
+    primeira = reverso(-22.95001, -42.90001)
+    assert primeira['sucesso'] and primeira['resultados'][0]['nome'] == local.address
+    assert len(laco.chamadas) == 1
+    # Mesmo ponto arredondado: acerto em memória
+    assert reverso(-22.95002, -42.90002) == primeira
+    # Cache novo sobre o mesmo diretório: acerto em disco
+    monkeypatch.setattr(app, 'cache_geocodificacao_app', cache_geocodificacao.CacheGeocodificacao(str(tmp_path)))
+    assert reverso(-22.95001, -42.90001) == primeira
+    assert app.cache_geocodificacao_app.acertos_disco == 1
+    assert len(laco.chamadas) == 1
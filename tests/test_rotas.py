@@ -0,0 +1,249 @@
+"""Comportamento dos motores de rota, do cache e da API sobre a grade sintética"""
+import numpy as np
+import pytest
+from shapely.geometry import Point, shape
+
+import alternativas
+import geometria_rotas
+
+
+def pedir_rota(app, cliente, origem, destino, **opcoes):
+    """POST /api/calcular_rota entre dois nós (índices do snapshot)"""
+    lat, lng = app.snapshot.no_lat, app.snapshot.no_lng
+    return cliente.post('/api/calcular_rota', json=dict(
+        origem_lat=float(lat[origem]), origem_lng=float(lng[origem]),
+        destino_lat=float(lat[destino]), destino_lng=float(lng[destino]), **opcoes)).json
+
+
+def aplicar_trafego(cliente, itens):
+    resposta = cliente.post('/api/trafego', json={'atualizacoes': itens}).json
+    assert resposta['sucesso'], resposta
+    return resposta
+
+
+def arestas_da_rota(app, origem, destino):
+    motor = app.visoes['driving'].motor
+    _, arcos, _, _ = motor.rota(origem, destino, 'dijkstra')
+    return [int(aresta) for aresta in motor.arestas_base[arcos]]
+
+
+def test_cache_apos_fechar_e_restaurar(app, cliente):
+    origem, destino = 0, app.snapshot.num_nos - 1
+    arestas = arestas_da_rota(app, origem, destino)
+    aplicar_trafego(cliente, [{'aresta': aresta, 'fator': 5.0, 'modos': ['driving']} for aresta in arestas])
+    congestionada = pedir_rota(app, cliente, origem, destino)
+    assert congestionada['sucesso'] and not congestionada['cache']
+
+    aplicar_trafego(cliente, [{'aresta': aresta, 'restaurar': True} for aresta in arestas])
+    motor = app.visoes['driving'].motor
+    otimo = motor.rota(origem, destino, 'dijkstra')[2]
+    assert otimo < congestionada['duracao']
+    for algoritmo in ('dijkstra', 'ch'):
+        restaurada = pedir_rota(app, cliente, origem, destino, algoritmo=algoritmo)
+        assert restaurada['duracao'] == pytest.approx(otimo)
+
+
+def test_cache_apos_aumento(app, cliente):
+    origem, destino = 0, app.snapshot.num_nos - 1
+    primeira = pedir_rota(app, cliente, origem, destino)
+    assert not primeira['cache']
+    assert pedir_rota(app, cliente, origem, destino)['cache']
+
+    # Aresta fora da rota: a rota continua no cache
+    fora = np.setdiff1d(np.arange(app.snapshot.num_arestas), arestas_da_rota(app, origem, destino))
+    aplicar_trafego(cliente, [{'aresta': int(fora[0]), 'fator': 3.0}])
+    assert pedir_rota(app, cliente, origem, destino)['cache']
+
+    # Aresta da rota: sai do cache e a nova rota reflete o peso maior
+    aresta = arestas_da_rota(app, origem, destino)[0]
+    resposta = aplicar_trafego(cliente, [{'aresta': aresta, 'fator': 10.0}])
+    assert resposta['sucesso']
+    depois = pedir_rota(app, cliente, origem, destino)
+    assert not depois['cache']
+    assert depois['duracao'] > primeira['duracao']
+
+
+def test_cache_separado_por_algoritmo(app, cliente):
+    origem, destino = 0, app.snapshot.num_nos - 1
+    dijkstra = pedir_rota(app, cliente, origem, destino, algoritmo='dijkstra')
+    ch = pedir_rota(app, cliente, origem, destino, algoritmo='ch')
+    assert not ch['cache']
+    assert ch['algoritmo'] == 'ch'
+    assert ch['nos_assentados'] < dijkstra['nos_assentados']
+    assert ch['duracao'] == pytest.approx(dijkstra['duracao'])
+    repetida = pedir_rota(app, cliente, origem, destino, algoritmo='ch')
+    assert repetida['cache'] and repetida['algoritmo'] == 'ch'
+
+
+def test_desvio_com_ordem_otimizada_respeita_posicao_final(app, cliente):
+    lat, lng = app.snapshot.no_lat, app.snapshot.no_lng
+    lado = int(round(app.snapshot.num_nos ** 0.5))
+    # Origem, duas paradas fora de ordem, destino; candidato no meio da grade
+    nos = [0, lado * (lado - 1), lado - 1, lado * lado - 1]
+    base = [[float(lat[n]), float(lng[n])] for n in nos]
+    meio = lado * (lado // 2) + lado // 2
+    corpo = {'base': base, 'candidate': [float(lat[meio]), float(lng[meio])], 'otimizar_ordem': True}
+
+    livre = cliente.post('/api/desvio_parada', json=corpo).json
+    final = cliente.post('/api/desvio_parada', json=dict(corpo, posicao='final')).json
+    assert livre['sucesso'] and final['sucesso']
+    assert final['ordem'][-2:] == [len(base), len(base) - 1]
+    assert livre['ordem'][-2] != len(base)
+    assert final['delta_duration_s'] >= livre['delta_duration_s']
+
+
+# Algoritmos comparados com o Dijkstra nas mesmas consultas
+ALGORITMOS_COMPARADOS = ('astar_bidirecional', 'ch')
+
+
+def pares_aleatorios(app, quantidade, semente):
+    rng = np.random.default_rng(semente)
+    ids = app.snapshot.no_ids
+    return [(int(ids[a]), int(ids[b])) for a, b in rng.integers(0, app.snapshot.num_nos, (quantidade, 2))]
+
+
+def conferir_algoritmos(app, pares):
+    """Custos de cada algoritmo iguais aos do Dijkstra; devolve os do Dijkstra"""
+    motor = app.visoes['driving'].motor
+    referencia = [motor.rota(origem, destino, 'dijkstra')[2] for origem, destino in pares]
+    for algoritmo in ALGORITMOS_COMPARADOS:
+        custos = [motor.rota(origem, destino, algoritmo)[2] for origem, destino in pares]
+        assert custos == pytest.approx(referencia), algoritmo
+    return referencia
+
+
+def test_algoritmos_concordam(app):
+    conferir_algoritmos(app, pares_aleatorios(app, 40, 11))
+
+
+@pytest.mark.parametrize('opcoes, mensagem', [
+    ({'origem_lat': None}, 'Coordenadas incompletas'),
+    ({'algoritmo': 'bfs'}, 'Algoritmo inválido'),
+    ({'modo': 'aviao'}, 'Modo inválido'),
+    ({'ajuste': 'via'}, 'Ajuste inválido'),
+    ({'algoritmo': 'ch', 'modo': 'walking'}, 'Hierarquia de contração não construída'),
+    ({'alternativas': 0}, "'alternativas' deve ser um inteiro"),
+    ({'alternativas': True}, "'alternativas' deve ser um inteiro"),
+    ({'alternativas': 99}, "'alternativas' deve ser um inteiro"),
+    ({'formato': 'geojson'}, 'Formato inválido'),
+    ({'zoom': 30}, "'zoom' deve ir de 0 a"),
+    ({'zoom': 'perto'}, "'zoom' deve ir de 0 a"),
+    ({'simplificacao_m': -1}, "'zoom' deve ir de 0 a"),
+])
+def test_validacao_calcular_rota(app, cliente, opcoes, mensagem):
+    lat, lng = app.snapshot.no_lat, app.snapshot.no_lng
+    corpo = {'origem_lat': float(lat[0]), 'origem_lng': float(lng[0]),
+             'destino_lat': float(lat[-1]), 'destino_lng': float(lng[-1])}
+    resposta = cliente.post('/api/calcular_rota', json=dict(corpo, **opcoes)).json
+    assert not resposta['sucesso']
+    assert resposta['mensagem'].startswith(mensagem)
+
+
+def test_algoritmos_concordam_com_trafego(app, cliente):
+    pares = pares_aleatorios(app, 40, 11)
+    rng = np.random.default_rng(12)
+    arestas = rng.choice(app.snapshot.num_arestas, 150, replace=False)
+    antes = conferir_algoritmos(app, pares)
+
+    itens = [{'aresta': int(aresta), 'fator': float(fator)}
+             for aresta, fator in zip(arestas[:120], rng.uniform(1.5, 6.0, 120))]
+    itens += [{'aresta': int(aresta), 'fechada': True} for aresta in arestas[120:]]
+    aplicar_trafego(cliente, itens)
+    com_trafego = conferir_algoritmos(app, pares)
+    assert all(depois >= anterior - 1e-9 for anterior, depois in zip(antes, com_trafego))
+    assert com_trafego != pytest.approx(antes)
+
+    aplicar_trafego(cliente, [{'aresta': int(aresta), 'restaurar': True} for aresta in arestas])
+    assert conferir_algoritmos(app, pares) == pytest.approx(antes)
+
+
+def test_alternativas_comecam_pela_minima(app):
+    motor = app.visoes['driving'].motor
+    origem, destino = 0, app.snapshot.num_nos - 1
+    rotas, _ = alternativas.rotas_alternativas(motor, origem, destino, 3)
+    otimo = motor.rota(int(motor.no_ids[origem]), int(motor.no_ids[destino]), 'dijkstra')[2]
+    assert rotas[0]['custo'] == pytest.approx(otimo)
+    for rota in rotas[1:]:
+        assert otimo <= rota['custo'] <= (1 + alternativas.FOLGA) * otimo + 1e-9
+        assert rota['sobreposicao'] <= alternativas.SOBREPOSICAO_MAXIMA + 1e-9
+
+
+def test_codificar_polilinha_vetor_do_google():
+    coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert geometria_rotas.codificar_polilinha(coords) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_padrao_ch_sem_hierarquia_informa_dijkstra(app, cliente, monkeypatch):
+    monkeypatch.setattr(app, 'ALGORITMO_PADRAO', 'ch')
+    origem, destino = 0, app.snapshot.num_nos - 1
+    assert pedir_rota(app, cliente, origem, destino)['algoritmo'] == 'ch'
+    a_pe = pedir_rota(app, cliente, origem, destino, modo='walking')
+    assert a_pe['sucesso'] and a_pe['algoritmo'] == 'dijkstra'
+    with pytest.raises(ValueError):
+        app.visoes['walking'].motor.rota(int(app.snapshot.no_ids[origem]), int(app.snapshot.no_ids[destino]), 'ch')
+
+
+def test_info_algoritmo_reflete_a_configuracao(app, cliente):
+    info = cliente.get('/api/info_algoritmo').json['info']
+    assert info['algoritmo'] == app.ALGORITMO_PADRAO
+    assert info['modos_com_ch'] == ['driving']
+    assert info['cenario_ativo'] == app.cenarios_pesos.ativo
+    assert info['cenario_descricao'] == app.cenarios_pesos.cenarios[info['cenario_ativo']].descricao
+
+
+def test_trafego_nao_escreve_os_pesos_originais(app, cliente):
+    motor = app.visoes['driving'].motor
+    originais = motor.pesos_originais.copy()
+    aplicar_trafego(cliente, [{'aresta': 0, 'fator': 4.0}])
+    app.sincronizar_trafego()
+    assert motor.pesos is not motor.pesos_originais
+    assert np.array_equal(motor.pesos_originais, originais)
+    aplicar_trafego(cliente, [{'aresta': 0, 'restaurar': True}])
+    app.sincronizar_trafego()
+    assert motor.pesos is motor.pesos_originais
+
+
+def test_matriz_igual_as_rotas_individuais(app, cliente):
+    ids, lat, lng = app.snapshot.no_ids, app.snapshot.no_lat, app.snapshot.no_lng
+    nos = np.random.default_rng(21).choice(app.snapshot.num_nos, 6, replace=False)
+    pontos = [[float(lat[n]), float(lng[n])] for n in nos]
+    resposta = cliente.post('/api/matriz', json={'origens': pontos[:3], 'destinos': pontos[3:]}).json
+    assert resposta['sucesso'], resposta
+
+    visao = app.visoes['driving']
+    for i, origem in enumerate(nos[:3]):
+        for j, destino in enumerate(nos[3:]):
+            _, arcos, duracao, _ = visao.motor.rota(int(ids[origem]), int(ids[destino]), 'dijkstra')
+            assert resposta['duracoes'][i][j] == pytest.approx(duracao)
+            assert resposta['distancias'][i][j] == pytest.approx(visao.distancia(arcos))
+
+
+def test_isocronas_contem_a_origem_e_crescem_com_o_limite(app, cliente):
+    lado = int(round(app.snapshot.num_nos ** 0.5))
+    meio = lado * (lado // 2) + lado // 2
+    lat, lng = float(app.snapshot.no_lat[meio]), float(app.snapshot.no_lng[meio])
+    resposta = cliente.post('/api/isocronas', json={
+        'lat': lat, 'lng': lng, 'limites': [60, 180, 400], 'simplificacao_m': 0}).json
+    assert resposta['sucesso'], resposta
+    areas = sorted((feature['properties']['limite'], shape(feature['geometry']))
+                   for feature in resposta['isocronas']['features'])
+    assert [limite for limite, _ in areas] == [60, 180, 400]
+    for _, area in areas:
+        assert area.contains(Point(lng, lat))
+    # Folga de ~1 m (em graus) para o arredondamento nas bordas comuns
+    for (_, menor), (_, maior) in zip(areas, areas[1:]):
+        assert maior.buffer(1e-5).contains(menor)
+        assert maior.area > menor.area
+
+
+@pytest.mark.parametrize('consulta, aproximado', [
+    ('Avenida Rob', False),
+    ('rob silv', False),
+    ('Robeto Silvera', True),
+])
+def test_autocompletar_encontra_a_rua(app, cliente, consulta, aproximado):
+    resposta = cliente.get('/api/autocompletar', query_string={'q': consulta}).json
+    assert resposta['sucesso'] and resposta['fonte'] == 'local'
+    primeiro = resposta['resultados'][0]
+    assert primeiro['nome'] == 'Avenida Roberto Silveira'
+    assert primeiro['aproximado'] == aproximado
@@ -0,0 +1,168 @@
+"""
+Trânsito ao vivo: fatores de tempo de viagem por modo e aresta, trocados em lotes.
+
+Cada aresta tem, por modo, um fator sobre o tempo do cenário de pesos: 1 é a
+via livre, > 1 é congestionamento e inf é via fechada. Fatores abaixo de 1
+são recusados. Com os pesos só subindo em relação ao cenário, a heurística
+do A* continua admissível. A hierarquia de contração, construída com os pesos
+do cenário, vira um limite inferior: uma rota dela que não passa por arco
+alterado continua ótima (ver MotorRotas.rota).
+
+Os fatores ficam em memória compartilhada, criada antes do fork dos workers
+do gunicorn e repassada aos processos da matriz. Quem recebe o lote grava os
+fatores e incrementa a versão. Cada processo compara a versão no início de
+cada pedido. Se ela mudou, aplica só as arestas que diferem do que já tinha
+aplicado, nos pesos dos motores. Se os fatores só subiram, invalida só as
+rotas em cache que passam por elas; se algum desceu (via restaurada ou menos
+congestionada), uma rota em cache que desviava dela pode ter deixado de ser a
+mínima, e todas as rotas do modo saem.
+"""
+import math
+import multiprocessing
+import threading
+
+import numpy as np
+
+
+class AtualizacaoInvalida(ValueError):
+    """Item do lote de atualizações que não pode ser aplicado"""
+
+
+class TrafegoAoVivo:
+    """Fatores por (modo, aresta) em memória compartilhada e o que este processo já aplicou"""
+
+    def __init__(self, modos, num_arestas, compartilhado=None):
+        self.modos = tuple(modos)
+        self.num_arestas = num_arestas
+        if compartilhado is None:
+            fatores = multiprocessing.RawArray('d', len(self.modos) * num_arestas)
+            np.frombuffer(fatores, dtype=np.float64)[:] = 1.0
+            # Trava do contexto spawn: herdada no fork do gunicorn e aceita pelo pool da matriz
+            compartilhado = (fatores, multiprocessing.RawValue('q', 0), multiprocessing.get_context('spawn').Lock())
+        # Repassado aos processos da matriz (initargs) para verem os mesmos fatores
+        self.compartilhado = compartilhado
+        fatores, self._versao, self._trava_escrita = compartilhado
+        self.fatores = np.frombuffer(fatores, dtype=np.float64).reshape(len(self.modos), num_arestas)
+        self._aplicados = np.ones((len(self.modos), num_arestas), dtype=np.float64)
+        self._versao_aplicada = 0
+        self._trava = threading.Lock()
+
+    @property
+    def versao(self):
+        return self._versao.value
+
+    def gravar(self, alteracoes):
+        """
+        Grava [(modo, arestas, fator), ...] de uma vez e publica uma nova versão.
+        Os processos aplicam o lote no próximo `sincronizar()`.
+        """
+        with self._trava_escrita:
+            for modo, arestas, fator in alteracoes:
+                self.fatores[self.modos.index(modo), arestas] = fator
+            self._versao.value += 1
+            return self._versao.value
+
+    def sincronizar(self, aplicar):
+        """
+        Chama aplicar(modo, arestas, fatores) para as arestas cujo fator mudou
+        desde a última sincronização deste processo; devolve {modo: (arestas,
+        algum fator desceu)}.
+        """
+        versao = self._versao.value
+        if versao == self._versao_aplicada:
+            return {}
+        with self._trava:
+            if versao == self._versao_aplicada:
+                return {}
+            alteradas = {}
+            # Lido depois da versão: uma escrita em andamento é completada na próxima versão
+            diferentes = self.fatores != self._aplicados
+            for i, modo in enumerate(self.modos):
+                arestas = np.flatnonzero(diferentes[i])
+                if len(arestas):
+                    fatores = self.fatores[i, arestas].copy()
+                    aplicar(modo, arestas, fatores)
+                    desceu = bool((fatores < self._aplicados[i, arestas]).any())
+                    self._aplicados[i, arestas] = fatores
+                    alteradas[modo] = (arestas, desceu)
+            self._versao_aplicada = versao
+            return alteradas
+
+    def alterados(self, modo):
+        """(arestas, fatores) diferentes de 1 já aplicados neste processo no modo"""
+        linha = self._aplicados[self.modos.index(modo)]
+        arestas = np.flatnonzero(linha != 1.0)
+        return arestas, linha[arestas]
+
+    def estatisticas(self):
+        return {
+            'versao': self.versao,
+            'versao_aplicada': self._versao_aplicada,
+            'arestas_congestionadas': {modo: int(np.count_nonzero(np.isfinite(linha) & (linha != 1.0)))
+                                       for modo, linha in zip(self.modos, self.fatores)},
+            'arestas_fechadas': {modo: int(np.count_nonzero(np.isinf(linha)))
+                                 for modo, linha in zip(self.modos, self.fatores)},
+        }
+
+
+def fator_do_item(item):
+    """Fator de um item do lote: 'fechada', 'restaurar' ou 'fator' (>= 1)"""
+    if item.get('fechada'):
+        return math.inf
+    if item.get('restaurar'):
+        return 1.0
+    try:
+        fator = float(item['fator'])
+    except (KeyError, TypeError, ValueError):
+        raise AtualizacaoInvalida("Informe 'fator' (>= 1), 'fechada' ou 'restaurar'")
+    if not fator >= 1.0:
+        raise AtualizacaoInvalida(f"Fator {fator} abaixo de 1: o trânsito só aumenta o tempo do cenário")
+    return fator
+
+
+def arestas_do_item(snapshot, item):
+    """Arestas do snapshot de um item: 'via' (way id OSM) ou 'aresta' ([u, v, chave] OSM ou índice)"""
+    if 'via' in item:
+        arestas = snapshot.arestas_da_via(int(item['via']))
+        if not len(arestas):
+            raise AtualizacaoInvalida(f"Via OSM {item['via']} não está no grafo")
+        return arestas
+    aresta = item.get('aresta')
+    if isinstance(aresta, int) and not isinstance(aresta, bool):
+        if not 0 <= aresta < snapshot.num_arestas:
+            raise AtualizacaoInvalida(f'Índice de aresta fora do grafo: {aresta}')
+        return np.array([aresta])
+    if isinstance(aresta, (list, tuple)) and len(aresta) in (2, 3):
+        u = snapshot.indice_nos.get(int(aresta[0]))
+        v = snapshot.indice_nos.get(int(aresta[1]))
+        if u is not None and v is not None:
+            faixa = np.arange(snapshot.offsets[u], snapshot.offsets[u + 1])
+            selecao = np.asarray(snapshot.destinos[faixa]) == v
+            if len(aresta) == 3:
+                selecao &= np.asarray(snapshot.chaves[faixa]) == int(aresta[2])
+            if selecao.any():
+                return faixa[selecao]
+        raise AtualizacaoInvalida(f'Aresta {aresta} não está no grafo')
+    raise AtualizacaoInvalida("Informe 'via' (id OSM) ou 'aresta' ([u, v, chave] ou índice)")
+
+
+def interpretar_lote(snapshot, itens, modos):
+    """
+    Converte o lote da API em [(modo, arestas, fator), ...]. Cada item afeta
+    os modos em 'modos' (padrão: todos). Erros citam a posição do item.
+    """
+    alteracoes = []
+    for posicao, item in enumerate(itens):
+        try:
+            if not isinstance(item, dict):
+                raise AtualizacaoInvalida('Item deve ser um objeto')
+            fator = fator_do_item(item)
+            arestas = arestas_do_item(snapshot, item)
+            modos_item = item.get('modos') or modos
+            desconhecidos = set(modos_item) - set(modos)
+            if desconhecidos:
+                raise AtualizacaoInvalida(f"Modos inválidos: {', '.join(sorted(desconhecidos))}")
+        except (TypeError, ValueError) as e:
+            raise AtualizacaoInvalida(f'Atualização {posicao}: {e}') from None
+        alteracoes.extend((modo, arestas, fator) for modo in modos_item)
+    return alteracoes